@@ -34,6 +34,13 @@ __fzsl_create_fzcd() {
     }
 }
 
+# Start an fzsl server in the background unless one is already running.
+# Later runs of fzsl, such as from the keybinding, use it to keep the files
+# of recently used directories loaded.
+__fzsl_start_server() {
+    (fzsl --server &> /dev/null &)
+}
+
 # Echo the top directory of a git tree.  If currently in a submodule,
 # this assumes that 'git rev-parse --show-gitdir' will return a
 # subdirectory of the top gitdir which is named '.git'
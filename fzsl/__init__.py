@@ -1,31 +1,112 @@
-from .core import FuzzyMatch
+import sys
 
-from .ui import (
-    ncurses,
-    SimplePager,
-)
+# Modules are only imported once one of their names is used so that each
+# run of fzsl loads no more than it needs.  Starting the pager, for
+# instance, never loads the server and filtering never loads curses.
+_EXPORTS = {
+    "FuzzyMatch": "core",
+    "Library": "library",
+    "BackgroundMatcher": "matcher",
+    "Results": "matcher",
+    "RemoteLibrary": "client",
+    "ServerError": "client",
+    "DetectionCache": "detect",
+    "pick_scanner": "detect",
+    "AutoExecutor": "executor",
+    "Executor": "executor",
+    "ProcessExecutor": "executor",
+    "SerialExecutor": "executor",
+    "ThreadExecutor": "executor",
+    "Server": "server",
+    "ncurses": "ui",
+    "SimplePager": "ui",
+    "ConfigError": "scanner",
+    "GitScanner": "scanner",
+    "NoTypeError": "scanner",
+    "Scanner": "scanner",
+    "scanner_from_configparser": "scanner",
+    "SimpleScanner": "scanner",
+    "StaticScanner": "scanner",
+    "StreamScanner": "scanner",
+    "SubprocessError": "scanner",
+    "UnknownTypeError": "scanner",
+    "WalkScanner": "scanner",
+    "Watcher": "watch",
+}
 
-from .scanner import (
-    ConfigError,
-    NoTypeError,
-    Scanner,
-    scanner_from_configparser,
-    SimpleScanner,
-    StaticScanner,
-    SubprocessError,
-    UnknownTypeError,
+_SUBMODULES = (
+    "cache",
+    "client",
+    "core",
+    "corpus",
+    "detect",
+    "executor",
+    "git",
+    "library",
+    "matcher",
+    "scanner",
+    "server",
+    "ui",
+    "walk",
+    "watch",
 )
 
+
+def _import(name):
+    # Unlike importlib.import_module(), __import__() shows up in the output
+    # of python -X importtime
+    return __import__(name, globals(), level=1, fromlist=("*",))
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(_import(_EXPORTS[name]), name)
+    elif name in _SUBMODULES:
+        value = _import(name)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_SUBMODULES))
+
+
+if sys.version_info < (3, 7):
+    # Modules cannot define __getattr__ before python 3.7
+    for _name in _EXPORTS:
+        __getattr__(_name)
+    del _name
+
+
 __all__ = [
     "FuzzyMatch",
+    "Library",
+    "BackgroundMatcher",
+    "Results",
+    "RemoteLibrary",
+    "ServerError",
+    "DetectionCache",
+    "pick_scanner",
+    "AutoExecutor",
+    "Executor",
+    "ProcessExecutor",
+    "SerialExecutor",
+    "ThreadExecutor",
+    "Server",
     "ncurses",
     "SimplePager",
     "ConfigError",
+    "GitScanner",
     "NoTypeError",
     "Scanner",
     "scanner_from_configparser",
     "SimpleScanner",
     "StaticScanner",
+    "StreamScanner",
     "SubprocessError",
     "UnknownTypeError",
+    "WalkScanner",
+    "Watcher",
 ]
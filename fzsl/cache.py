@@ -0,0 +1,282 @@
+import array
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from . import core
+
+# Binary cache layout, every section is aligned to 8 bytes:
+#
+#   header      - MAGIC, version, flags, number of paths and the byte offset
+#                 of each of the following sections
+#   data        - every path encoded as UTF-8 back to back
+#   offsets     - uint64 offset of the start of each path in data plus one
+#                 for the end of the last
+#   masks       - uint64 core.char_mask() of each path, if FLAG_MASKS
+#   meta        - JSON object describing how the cache was made
+#
+# The version must be bumped whenever the layout or the way masks are
+# computed changes.  Caches of any other version are treated as missing.
+#
+#   1   - data, offsets and masks
+#   2   - adds the meta section
+#   3   - masks are taken from the case-folded path, see core.char_mask()
+MAGIC = b"FZSLPATH"
+VERSION = 3
+FLAG_MASKS = 1 << 0
+
+_HEADER = struct.Struct("<8sIIQQQQQQ")
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class Paths(list):
+    def __init__(self, paths=(), masks=None):
+        """
+        List of paths which may carry the precomputed character mask of
+        every path.  FuzzyMatch.add_files() uses the masks rather than
+        computing them.
+
+        @param paths    - paths in the list
+        @param masks    - sequence of the core.char_mask() of every path
+        """
+        super(Paths, self).__init__(paths)
+        self.masks = masks
+
+
+def is_cache(path):
+    """
+    @param path - path to a file
+    @return     - True if the file is a binary path cache of any version
+    """
+    try:
+        with open(path, "rb") as fp:
+            return fp.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class PathCache(object):
+    def __init__(self, path):
+        """
+        Open a binary path cache.  The file is memory mapped so only the
+        pages holding the paths actually read are loaded.
+
+        @param path - path to the cache
+        @raise      - ValueError if the file is not a cache of the current
+                      version
+        """
+        with open(path, "rb") as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError("%s is not a path cache" % (path,))
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = _HEADER.unpack_from(self._map)
+        magic, version, flags, count, data, offsets, masks, meta, meta_size = header
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError("%s is not a path cache" % (path,))
+        if version != VERSION:
+            self._map.close()
+            raise ValueError("%s is version %d, expected %d" % (path, version, VERSION))
+
+        self.meta = json.loads(self._map[meta : meta + meta_size].decode("UTF-8"))
+
+        view = memoryview(self._map)
+        self._count = count
+        self._data = view[data:offsets]
+        self._offsets = view[offsets : offsets + 8 * (count + 1)].cast("Q")
+        self._mask_data = self.masks = None
+        if flags & FLAG_MASKS:
+            self._mask_data = view[masks : masks + 8 * count]
+            self.masks = self._mask_data.cast("Q")
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("cache index out of range")
+
+        start = self._offsets[index]
+        end = self._offsets[index + 1]
+        return str(self._data[start:end], "UTF-8", "surrogateescape")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def batches(self, size):
+        """
+        @param size - maximum number of paths in a batch
+        @return     - generator of Paths of consecutive paths with their masks
+        """
+        data = self._data
+        offsets = self._offsets
+        for lo in range(0, self._count, size):
+            hi = min(lo + size, self._count)
+            paths = [
+                str(data[offsets[i] : offsets[i + 1]], "UTF-8", "surrogateescape")
+                for i in range(lo, hi)
+            ]
+            masks = None
+            if self.masks is not None:
+                masks = array.array("Q")
+                masks.frombytes(self._mask_data[8 * lo : 8 * hi])
+            yield Paths(paths, masks)
+
+    def close(self):
+        """
+        Release the mapping.  Paths already read remain valid.
+        """
+        if self._map is None:
+            return
+
+        for view in (self._data, self._offsets, self.masks, self._mask_data):
+            if view is not None:
+                view.release()
+        self._data = self._offsets = self.masks = self._mask_data = None
+        self._map.close()
+        self._map = None
+
+
+class CacheWriter(object):
+    def __init__(self, path, masks=True, meta=None):
+        """
+        Write a binary path cache.  Paths are streamed to a temporary file
+        next to the cache which replaces it when commit() is called.  If
+        the writer is closed without being committed, the existing cache,
+        if any, is left untouched.
+
+        @param path     - path of the cache to write
+        @param masks    - store the character mask of every path
+        @param meta     - JSON serializable dictionary stored with the cache,
+                          available as PathCache.meta when it is read
+        """
+        self._path = path
+        self._meta = json.dumps(meta if meta is not None else {}).encode("UTF-8")
+        self._fp = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path) or ".",
+            prefix=".%s." % (os.path.basename(path),),
+            delete=False,
+        )
+        self._fp.write(bytes(_HEADER.size))
+        self._offsets = array.array("Q", [0])
+        self._masks = array.array("Q") if masks else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, paths):
+        """
+        Append paths to the cache.
+
+        @param paths    - list of paths.  If it is a Paths with masks they
+                          are used rather than recomputed.
+        """
+        encoded = [p.encode("UTF-8", "surrogateescape") for p in paths]
+        end = self._offsets[-1]
+        for e in encoded:
+            end += len(e)
+            self._offsets.append(end)
+        self._fp.write(b"".join(encoded))
+
+        if self._masks is not None:
+            masks = getattr(paths, "masks", None)
+            if masks is None:
+                masks = map(core.char_mask, paths)
+            self._masks.extend(masks)
+
+    def commit(self):
+        """
+        Finish writing and replace the cache.
+        """
+        fp = self._fp
+        count = len(self._offsets) - 1
+        data = _HEADER.size
+
+        offsets = _align(data + self._offsets[-1])
+        fp.write(bytes(offsets - fp.tell()))
+        fp.write(self._offsets.tobytes())
+
+        flags = 0
+        masks = fp.tell()
+        if self._masks is not None:
+            flags |= FLAG_MASKS
+            fp.write(self._masks.tobytes())
+
+        meta = fp.tell()
+        fp.write(self._meta)
+
+        fp.seek(0)
+        fp.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                flags,
+                count,
+                data,
+                offsets,
+                masks,
+                meta,
+                len(self._meta),
+            )
+        )
+        fp.close()
+
+        os.replace(fp.name, self._path)
+        self._fp = None
+
+    def close(self):
+        """
+        Discard the cache unless it was committed.
+        """
+        if self._fp is not None:
+            self._fp.close()
+            os.unlink(self._fp.name)
+            self._fp = None
+
+
+def export_text(path, fp):
+    """
+    Write the paths of a binary cache, one per line.
+
+    @param path - path to the cache
+    @param fp   - text file to write to
+    """
+    with PathCache(path) as cache:
+        for batch in cache.batches(1 << 12):
+            for p in batch:
+                fp.write(p + "\n")
+
+
+def import_text(fp, path):
+    """
+    Build a binary cache from paths given one per line.
+
+    @param fp   - text file to read from
+    @param path - path of the cache to write
+    """
+    with CacheWriter(path) as writer:
+        batch = []
+        for line in fp:
+            line = line.rstrip("\n")
+            if line:
+                batch.append(line)
+            if len(batch) >= 1 << 12:
+                writer.add(batch)
+                batch = []
+        writer.add(batch)
+        writer.commit()
@@ -0,0 +1,266 @@
+import json
+import os
+import socket
+import stat
+import threading
+
+from . import matcher
+
+
+class ServerError(Exception):
+    pass
+
+
+def socket_path():
+    """
+    @return - path of the socket the server listens on, in a directory
+              only the user can access under $XDG_RUNTIME_DIR or /tmp
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "fzsl", "server.sock")
+    return os.path.join("/tmp", "fzsl-%d" % (os.getuid(),), "server.sock")
+
+
+def check_socket_dir(path):
+    """
+    Check that the directory holding a socket can only be used by the
+    current user, since the server runs the commands of whatever
+    configuration it is sent.
+
+    @param path - path of the socket
+    @raise      - ServerError if someone else could use the directory
+    """
+    dirname = os.path.dirname(path)
+    st = os.stat(dirname)
+    if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        raise ServerError("%s is accessible by other users" % (dirname,))
+
+
+def send(sock, message):
+    """
+    Send a message.  Messages are JSON objects, one per line.
+
+    @param sock     - connected socket
+    @param message  - dictionary to send
+    """
+    sock.sendall(json.dumps(message).encode("UTF-8") + b"\n")
+
+
+def receive(fp):
+    """
+    @param fp   - binary file reading from a connected socket
+    @return     - generator of the messages received, ending when the
+                  connection is closed
+    """
+    for line in fp:
+        yield json.loads(line.decode("UTF-8"))
+
+
+def connect(path=None):
+    """
+    Connect to the server.
+
+    @param path - path of the socket, socket_path() by default
+    @return     - connected socket or None if no server is running
+    """
+    path = path if path is not None else socket_path()
+    try:
+        check_socket_dir(path)
+    except (OSError, ServerError):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+class RemoteLibrary(object):
+    def __init__(self, sock, config, rule=None, path=None, depth=10):
+        """
+        A library held by a server, with the same interface as
+        fzsl.Library.  Queries are sent to the server and results are
+        pushed back as they are scored and read by a background thread, so
+        the properties never block.
+
+        @param sock     - socket connected to the server
+        @param config   - path to the configuration file the server reads
+                          the rules from
+        @param rule     - name of the rule to use, if undefined then the
+                          server picks one for the path
+        @param path     - path at which to scan, if undefined then the
+                          current working directory is used
+        @param depth    - number of best matches kept in the results
+        @raise          - ServerError if the server cannot open the library
+        """
+        self._sock = sock
+        self._fp = sock.makefile("rb")
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._done = 0
+        self._replies = []
+        self._error = None
+        self._closed = False
+        self._results = matcher.Results(0, "", [], 0, 0)
+        self._pending = False
+
+        self.scanning = False
+        self.refreshing = False
+        self.scanned = 0
+
+        self._thread = threading.Thread(target=self._read, name="fzsl-client")
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.rule = self._call(
+            op="open",
+            config=os.path.abspath(config),
+            rule=rule,
+            path=os.path.abspath(path if path is not None else os.curdir),
+            depth=depth,
+        )["rule"]
+
+    @property
+    def results(self):
+        return self._results
+
+    @property
+    def pending(self):
+        """
+        True if a request has not been handled by the server or the results
+        are older than the query
+        """
+        return self._done != self._sent or self._pending
+
+    def _send(self, **message):
+        """
+        Send a request.  Must not be called with the condition held.
+
+        @return - sequence number of the request
+        """
+        with self._lock:
+            self._sent += 1
+            message["seq"] = self._sent
+            try:
+                send(self._sock, message)
+            except OSError as e:
+                with self._cond:
+                    self._error = ServerError("Lost the server: %s" % (e,))
+            return self._sent
+
+    def _call(self, **message):
+        """
+        Send a request and wait for its reply.
+
+        @return - the reply
+        @raise  - ServerError if the server reports an error
+        """
+        self._send(**message)
+        with self._cond:
+            self._cond.wait_for(lambda: self._replies or self._error is not None)
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            return self._replies.pop(0)
+
+    def _read(self):
+        try:
+            for message in receive(self._fp):
+                with self._cond:
+                    if "state" in message:
+                        self._update(message["state"])
+                    elif "error" in message:
+                        self._error = ServerError(message["error"])
+                    else:
+                        self._replies.append(message["reply"])
+                    self._cond.notify_all()
+        except (OSError, ValueError) as e:
+            error = ServerError("Lost the server: %s" % (e,))
+        else:
+            error = ServerError("Lost the server")
+
+        with self._cond:
+            if not self._closed and self._error is None:
+                self._error = error
+            self._cond.notify_all()
+
+    def _update(self, state):
+        results = state["results"]
+        if results["generation"] != self._results.generation:
+            self._results = matcher.Results(
+                results["generation"],
+                results["search"],
+                [tuple(m) for m in results["matches"]],
+                results["n_matches"],
+                results["n_files"],
+                results["offset"],
+            )
+        self._pending = state["pending"]
+        self.scanning = state["scanning"]
+        self.refreshing = state["refreshing"]
+        self.scanned = state["scanned"]
+        self._done = state["seq"]
+
+    def search(self, search):
+        return self._send(op="search", search=search)
+
+    def resize(self, depth):
+        return self._send(op="resize", depth=depth)
+
+    def scroll(self, offset):
+        return self._send(op="scroll", offset=offset)
+
+    def scan(self, rescan=False):
+        """
+        The server scans when the library is opened, so only rescans are
+        requested.
+
+        @param rescan   - rescan and sync the library with the result
+        @return         - True if a rescan was requested
+        """
+        if not rescan:
+            return False
+        self._send(op="scan", rescan=True)
+        return True
+
+    def wait(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self.pending or self._error is not None, timeout
+            )
+
+    def check(self):
+        """
+        Raise the last error reported by the server, if any, once.
+        """
+        with self._cond:
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+
+    def transform(self, path):
+        return self._call(op="transform", path=path)["path"]
+
+    def close(self):
+        """
+        Hand the library back to the server and disconnect.
+        """
+        try:
+            self._call(op="close")
+        except ServerError:
+            pass
+
+        with self._cond:
+            self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._thread.join()
+        self._fp.close()
+        self._sock.close()
@@ -1,132 +1,548 @@
+import array
+import bisect
 import functools
 import heapq
-import multiprocessing
-import re
-import signal
+import time
 
+from . import corpus
+from . import executor as executors
 
-class MatchInfo(object):
-    def __init__(self, start=0, end=0, score=0, round_ejected=0):
-        """
-        Information about how a patch matches against the given search
 
-        @attr start         - index in path where match starts
-        @attr end           - index in path where match ends
-        @attr score         - match score
-        @attr round_ejected - the round (length of search string) that this
-                              path was removed as a possible match
-        """
-        self.start = start
-        self.end = end
-        self.score = score
-        self.round_ejected = round_ejected
+def _mask_bit(byte):
+    """
+    @param byte - byte of UTF-8 encoded text
+    @return     - index of the bit representing byte in a character mask
+    """
+    c = chr(byte).lower()
+    if "a" <= c <= "z":
+        return ord(c) - ord("a")
+    elif "0" <= c <= "9":
+        return 26 + ord(c) - ord("0")
+    elif byte < 128:
+        return 36 + byte % 27
+    else:
+        return 63
 
-    def update(self, start=None, end=None, score=None, round_ejected=None):
-        """
-        Update the MatchInfo attributes
 
-        @param start            - index in path where match starts
-        @param end              - index in path where match ends
-        @param score            - match score
-        @param round_ejected    - the round (length of search string) that this
-                                  path
-        """
-        if start is not None:
-            self.start = start
-        if end is not None:
-            self.end = end
-        if score is not None:
-            self.score = score
-        if round_ejected is not None:
-            self.round_ejected = round_ejected
+# Translation of every byte to the index of the bit which represents it.
+_MASK_BITS = bytes(_mask_bit(byte) for byte in range(256))
+_MASK_VALUES = [1 << bit for bit in range(64)]
+
+
+def char_mask(text):
+    """
+    Compute a case-insensitive 64 bit mask of the characters present in
+    text.  Letters and digits each have their own bit while all other
+    characters share the remaining bits.  If the mask of a query has a
+    bit set which is not set in the mask of a path, then the query cannot
+    match that path.  Text is case-folded as by fold() so that characters
+    like the Kelvin sign set the bit of the letter they match.
+
+    @param text - text to compute the mask for
+    @return     - integer mask
+    """
+    encoded = text.encode("UTF-8", "surrogateescape")
+    if len(encoded) != len(text):
+        encoded = fold(text).encode("UTF-8", "surrogateescape")
+    bits = encoded.translate(_MASK_BITS)
+    return sum(map(_MASK_VALUES.__getitem__, set(bits)))
+
+
+def fold(text):
+    """
+    Case-fold text for matching.  Characters whose lowercase form is more
+    than a single character are left untouched so that indices into the
+    folded text are always valid indices into the original.
+
+    @param text - text to fold
+    @return     - folded text of the same length as the input
+    """
+    folded = text.lower()
+    if len(folded) != len(text):
+        folded = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+    return folded
 
 
-def default_scorer(path, c_round, regex):
+def subsequence_match(path, search):
     """
-    Score how well a path is matched by the given regex.  Note
+    Find the best window of path in which search appears as a subsequence.
+    The best window is the one which starts as late as possible in the path
+    and, from that start, ends as early as possible.  This is found in two
+    linear passes, the first walks backwards from the end of the path to
+    find the latest possible start and the second walks forward from there
+    to find the earliest end.
+
+    @param path     - case-folded path to match against
+    @param search   - case-folded query
+    @return         - tuple of (start, end) indices of the first and last
+                      matched characters in path or None if search is not
+                      a subsequence of path
+    """
+    pos = len(path)
+    for c in reversed(search):
+        pos = path.rfind(c, 0, pos)
+        if pos == -1:
+            return None
+
+    start = pos
+    for c in search[1:]:
+        pos = path.find(c, pos + 1)
+
+    return start, pos
+
+
+def default_scorer(path, c_round, search):
+    """
+    Score how well a path is matched by the given search.  Note
     that this function will be passed to a multiprocessing pool
     and needs to return enough context such that the results can
     be correctly collated back at the source.
 
     @param path     - path to score
     @param c_round  - length of the current search query.  This is
-                      used to support deletion of characters in the
-                      query.  If a character is deleted, then all
-                      results that were ejected in the previous round
-                      will be re-evaluated
-    @param regex    - regular expression to use for matching
+                      returned as the round in which the path was
+                      ejected if it does not match
+    @param search   - case-folded query to match against the path
     @return         - This is a little complex in order to support
                       multiprocessing.  The return is a tuple where
                       the first item is the path that was passed into
                       this function.  The second item is another tuple
-                      consisting of MatchInfo attributes: start, end,
+                      consisting of the match attributes: start, end,
                       score, round_ejected.  That is:
                       (path, (start, end, score, round_ejected))
     """
-    matches = [m for m in regex.finditer(path)]
+    span = subsequence_match(fold(path), search)
+    if span is None:
+        return path, (0, 0, 0.0, c_round)
+
+    start, end = span
+    return path, (start, end, 1.0 / (len(path) - start), 0)
+
+
+def _directory_state(directory, search, n_chars):
+    """
+    Match the part of a query which falls within a directory.  This is
+    subsequence_match() split at the last separator of a path: the
+    backward pass has already matched the tail of the query against the
+    basename and only the first n_chars of the query are left to find in
+    the directory.
+
+    @param directory    - case-folded directory including the trailing
+                          separator
+    @param search       - case-folded query
+    @param n_chars      - number of leading characters of the query which
+                          must be matched within the directory
+    @return             - tuple of (start, consumed, end) where start is the
+                          latest start of the match, consumed is the number
+                          of characters of the query matched in the
+                          directory going forward from start and end is the
+                          index of the last of them.  None if the directory
+                          does not contain the characters.
+    """
+    pos = len(directory)
+    for c in reversed(search[:n_chars]):
+        pos = directory.rfind(c, 0, pos)
+        if pos == -1:
+            return None
+
+    start = pos
+    consumed = 1
+    for c in search[1:]:
+        found = directory.find(c, pos + 1)
+        if found == -1:
+            break
+        pos = found
+        consumed += 1
+
+    return start, consumed, pos
+
+
+def match_tree(search, query_mask, items):
+    """
+    Match a query against paths grouped by directory.  This gives the same
+    results as the default_scorer but the part of each match that falls
+    within a directory is computed once and shared by every path in that
+    directory so only the basename of each path is searched.  Paths which
+    fail the character mask are skipped without being searched.
+
+    State is only shared between paths with the same directory, not with
+    subdirectories.  Whole subtrees cannot be pruned as a basename alone
+    may hold the entire query.
+
+    @param search       - case-folded query
+    @param query_mask   - char_mask() of the query
+    @param items        - iterable of (index, path, mask, parent) where
+                          parent identifies the directory of the path
+    @return             - generator of (index, start, end, score) for every
+                          path which matches
+    """
+    n_search = len(search)
+    backward = search[::-1]
+    forward = search[1:]
+    groups = {}
+    last = None
+
+    for index, path, mask, parent in items:
+        if mask & query_mask != query_mask:
+            continue
+
+        if parent != last:
+            last = parent
+            group = groups.get(parent)
+            if group is None:
+                split = path.rfind("/") + 1
+                group = groups[parent] = (split, fold(path[:split]), {})
+            split, directory, states = group
+
+        name = path[split:].lower()
+        if len(name) != len(path) - split:
+            name = fold(path[split:])
+
+        pos = len(name)
+        remaining = n_search
+        for c in backward:
+            found = name.rfind(c, 0, pos)
+            if found == -1:
+                break
+            pos = found
+            remaining -= 1
+        else:
+            start = split + pos
+            for c in forward:
+                pos = name.find(c, pos + 1)
+            yield index, start, split + pos, 1.0 / (len(path) - start)
+            continue
+
+        state = states.get(remaining, False)
+        if state is False:
+            state = states[remaining] = _directory_state(directory, search, remaining)
+        if state is None:
+            continue
+
+        start, consumed, end = state
+        if consumed < n_search:
+            pos = -1
+            for c in search[consumed:]:
+                pos = name.find(c, pos + 1)
+            end = split + pos
+        yield index, start, end, 1.0 / (len(path) - start)
+
+
+@functools.lru_cache(maxsize=32)
+def _search_regex(search):
+    # re is only loaded by the few configurations using the regex_scorer
+    import re
+
+    pattern = "(?=(" + ".*?".join(re.escape(c) for c in search) + "))"
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def regex_scorer(path, c_round, search):
+    """
+    Score a path using a lookahead regular expression built from the
+    search.  Every overlapping match is found and scored which makes
+    this quadratic in the length of the path.  It returns the same
+    results as the default_scorer and is kept as a reference
+    implementation for testing and benchmarking.
+
+    @param path     - path to score
+    @param c_round  - length of the current search query
+    @param search   - case-folded query to match against the path
+    @return         - (path, (start, end, score, round_ejected)), see
+                      default_scorer
+    """
+    matches = [m for m in _search_regex(search).finditer(path)]
     if matches:
 
         def score(match):
             return 1.0 / (len(path) - match.start(1))
 
-        ranked = [(score(m), m) for m in matches]
-        score, best = max(ranked)
+        ranked = [(score(m), m.start(1), m) for m in matches]
+        score, _, best = max(ranked)
 
         return path, (best.start(1), best.end(1) - 1, score, 0)
     else:
         return path, (0, 0, 0.0, c_round)
 
 
+class _Round(object):
+    def __init__(self, query, candidates=None, top=None, depth=0):
+        """
+        The paths which matched a query.  Only the best matches are ranked
+        when a round is created, the spans and scores of the rest are
+        computed on demand.
+
+        @param query        - case-folded query
+        @param candidates   - array('Q') of the indices of the matching
+                              paths in ascending order.  If None, every path
+                              in the library matched with a score of 0.
+        @param top          - list of (score, -index, start, end) of the
+                              best matches, best first
+        @param depth        - number of matches top was limited to
+
+        @attr spans         - tuple of arrays of (starts, ends, scores) with
+                              an entry for every candidate or None if they
+                              have not been computed
+        """
+        self.query = query
+        self.candidates = candidates
+        self.top = top if top is not None else []
+        self.depth = depth
+        self.spans = None
+        self._known = None
+        self._heap = None
+
+    def __len__(self):
+        return 0 if self.candidates is None else len(self.candidates)
+
+    @property
+    def ranked(self):
+        """
+        True if every candidate is in top
+        """
+        return len(self.top) == len(self)
+
+    @property
+    def known(self):
+        """
+        Dictionary of path index to (start, end, score) for every path whose
+        match is known without consulting spans
+        """
+        if self._known is None:
+            self._known = {
+                -neg: (start, end, score) for score, neg, start, end in self.top
+            }
+        return self._known
+
+    def extend(self, depth):
+        """
+        Rank more of the candidates, adding them to top.  The first call
+        puts every candidate which is not in top on a heap so that later
+        calls only pay for the matches they add rather than ranking every
+        candidate again.  The spans must have been computed.
+
+        @param depth    - number of matches top should hold
+        """
+        starts, ends, scores = self.spans
+        if self._heap is None:
+            ranked = set(-neg for _, neg, _, _ in self.top)
+            self._heap = [
+                (-score, pos)
+                for pos, score in enumerate(scores)
+                if self.candidates[pos] not in ranked
+            ]
+            heapq.heapify(self._heap)
+
+        while len(self.top) < depth and self._heap:
+            _, pos = heapq.heappop(self._heap)
+            index = self.candidates[pos]
+            self.top.append((scores[pos], -index, starts[pos], ends[pos]))
+            if self._known is not None:
+                self._known[index] = (starts[pos], ends[pos], scores[pos])
+
+    def position(self, index):
+        """
+        @param index    - index of a path in the library
+        @return         - position of the path in candidates or -1 if it is
+                          not a candidate
+        """
+        pos = bisect.bisect_left(self.candidates, index)
+        if pos < len(self.candidates) and self.candidates[pos] == index:
+            return pos
+        return -1
+
+    def remap(self, remap):
+        """
+        @param remap    - array mapping the old index of every path in the
+                          library to its new index or -1 if it was removed.
+                          Indices must keep their order.
+        @return         - new _Round for the same query over the new indices
+        """
+        if self.candidates is None:
+            return _Round(self.query)
+
+        keep = [pos for pos, i in enumerate(self.candidates) if remap[i] >= 0]
+        candidates = array.array("Q", (remap[self.candidates[pos]] for pos in keep))
+        top = [
+            (score, -remap[-neg], start, end)
+            for score, neg, start, end in self.top
+            if remap[-neg] >= 0
+        ]
+        c_round = _Round(self.query, candidates, top, self.depth)
+        if self.spans is not None:
+            c_round.spans = tuple(
+                array.array(col.typecode, (col[pos] for pos in keep))
+                for col in self.spans
+            )
+        return c_round
+
+
 class FuzzyMatch(object):
-    def __init__(self, files=None, scorer=default_scorer):
+    def __init__(
+        self,
+        files=None,
+        scorer=default_scorer,
+        cache_size=1 << 22,
+        executor=None,
+        rank_depth=256,
+    ):
         """
         Create a FuzzyMatcher which is responsible for handling the
         state as paths are added to the library being searched by an
         updating query.
 
-        @param files    - initial library of paths to rank
-        @param scorer   - scoring function.  This function must match
-                          the signature and return values of the
-                          default_scorer.  See it for more information.
+        @param files        - initial library of paths to rank
+        @param scorer       - scoring function.  This function must match
+                              the signature and return values of the
+                              default_scorer.  See it for more information.
+        @param cache_size   - maximum number of matches, summed over every
+                              prefix of the current query, that are kept so
+                              that deleting or editing characters in the query
+                              does not require rescanning the library.  The
+                              matches of the current query are always kept.
+        @param executor     - fzsl.Executor used to run the scorer.  By
+                              default an AutoExecutor picks between scoring
+                              serially and the shared process pool depending
+                              on the number of candidates.
+        @param rank_depth   - number of best matches ranked by each scoring
+                              job.  Only these are sent back from the workers,
+                              asking top_matches() for more than this scores
+                              the rest of the matches again.
         """
-        if files is not None:
-            self._library = {path: MatchInfo() for path in files}
-        else:
-            self._library = {}
+        self._index = {}
+        self._paths = []
+        self._masks = array.array("Q")
+        # Id of every distinct directory, kept so that paths added later
+        # share the ids.  Each directory string is a copy, not shared with
+        # the paths, and with the ids costs about 13 bytes per path on
+        # test/files.
+        self._directories = {}
+        self._parents = array.array("I")
+        self._corpus = None
+
+        self._root = _Round("")
+        self._rounds = [self._root]
+        self._current = self._root
+        self._pending = array.array("Q")
+        self._cache_size = cache_size
+        self._depth = rank_depth
+        self._top = None
+        self._top_depth = 0
 
         self._scorer = scorer
         self._search = ""
+        self._executor = executor if executor is not None else executors.AutoExecutor()
 
-        def pool_init():
-            signal.signal(signal.SIGINT, signal.SIG_IGN)
-
-        self._pool = multiprocessing.Pool(initializer=pool_init)
+        if files is not None:
+            self.add_files(files)
 
     def __del__(self):
-        self._pool.close()
+        if self._corpus is not None:
+            self._corpus.close()
 
     @property
     def n_matches(self):
         """
         Number of paths which are candidates given the current query
         """
-        return len([info for info in self._library.values() if info.round_ejected == 0])
+        if self._current.candidates is None:
+            return len(self._paths)
+        return len(self._current) + len(self._pending)
 
     @property
     def n_files(self):
         """
         Total number of paths in the library being searched
         """
-        return len(self._library)
+        return len(self._paths)
 
     def add_files(self, files):
         """
         Add files to the library being searched.  This does not automatically
         score the new files.  Use update_scores() to do so if necessary.
+        Files which are already in the library are ignored.
 
-        @param files    - list of files to add.
+        @param files    - list of files to add.  If it has a masks attribute,
+                          such as the fzsl.cache.Paths read from a cache, it
+                          is used as the char_mask() of every file rather
+                          than computing them.
         """
-        self._library.update({path: MatchInfo() for path in files})
+        first = len(self._paths)
+        masks = getattr(files, "masks", None)
+
+        for i, path in enumerate(files):
+            if path not in self._index:
+                self._index[path] = len(self._paths)
+                self._paths.append(path)
+                self._masks.append(char_mask(path) if masks is None else masks[i])
+                directory = path[: path.rfind("/") + 1]
+                parent = self._directories.setdefault(directory, len(self._directories))
+                self._parents.append(parent)
+
+        if len(self._paths) == first:
+            return
+
+        self._drop_corpus()
+        self._top = None
+        if self._current is not self._root:
+            # The new files are candidates until they are scored.  Cached
+            # prefixes of the query do not know about them so they are
+            # dropped.
+            self._pending.extend(range(first, len(self._paths)))
+            self._rounds = [self._root, self._current]
+
+    def remove_files(self, files):
+        """
+        Remove files from the library.  The matches of the current query are
+        kept, only the cached prefixes of the query are dropped.  Files which
+        are not in the library are ignored.
+
+        @param files    - list of files to remove
+        """
+        removed = [self._index.pop(path) for path in files if path in self._index]
+        if not removed:
+            return
+
+        dropped = bytearray(len(self._paths))
+        for i in removed:
+            dropped[i] = 1
+
+        remap = array.array("q", bytes(8 * len(self._paths)))
+        keep = []
+        for i, drop in enumerate(dropped):
+            if drop:
+                remap[i] = -1
+            else:
+                remap[i] = len(keep)
+                keep.append(i)
+
+        self._paths = [self._paths[i] for i in keep]
+        self._masks = array.array("Q", (self._masks[i] for i in keep))
+        self._parents = array.array("I", (self._parents[i] for i in keep))
+        self._index = {path: i for i, path in enumerate(self._paths)}
+        self._pending = array.array(
+            "Q", (remap[i] for i in self._pending if remap[i] >= 0)
+        )
+
+        self._drop_corpus()
+        self._top = None
+        self._rounds = [self._root]
+        if self._current is not self._root:
+            self._current = self._current.remap(remap)
+            self._rounds.append(self._current)
+
+    def sync_files(self, files):
+        """
+        Make the library hold exactly the given files.  Only the difference
+        is applied: files which are gone are removed and new files are added
+        and, like add_files(), scored by the next update_scores().  The
+        matches of every other file are kept.
+
+        @param files    - complete list of files the library should hold
+        """
+        wanted = set(files)
+        self.remove_files([path for path in self._paths if path not in wanted])
+        self.add_files([path for path in files if path not in self._index])
 
     def reset_files(self, files):
         """
@@ -136,60 +552,255 @@ class FuzzyMatch(object):
 
         @param files    - new files to use as a library
         """
-        self._library = {path: MatchInfo() for path in files}
-
-    def update_scores(self, search):
+        self._index = {}
+        self._paths = []
+        self._masks = array.array("Q")
+        self._directories = {}
+        self._parents = array.array("I")
+        self._drop_corpus()
+        self._rounds = [self._root]
+        self._pending = array.array("Q")
+        self._set_current(self._root)
+        self.add_files(files)
+
+    def _drop_corpus(self):
+        """
+        Release the shared corpus, it will be rebuilt from the library
+        the next time it is needed.
         """
-        Update the scores for every path in the library that was not
-        previously ejected.  If the search term is smaller than the
-        previous one, paths that were ejected in the last round will
-        be re-scored and possibly retained.
+        if self._corpus is not None:
+            self._corpus.close()
+            self._corpus = None
 
-        @param search   - query to fuzzy match against the library
+    def _shared_corpus(self):
         """
-        s_len = len(search)
+        @return - SharedCorpus holding every path in the library
+        """
+        if self._corpus is None:
+            self._corpus = corpus.SharedCorpus(self._paths, self._masks, self._parents)
+        return self._corpus
 
-        if s_len < len(self._search):
-            for path, info in self._library.items():
-                if info.round_ejected == s_len + 1:
-                    self._library[path].update(round_ejected=0)
+    def update_scores(self, search, cancelled=None):
+        """
+        Update the scores for every path in the library that matches
+        the search.  The matches for every prefix of the search are
+        kept so that when characters are deleted or edited anywhere in
+        the search, matching restarts from the longest prefix of the new
+        search that is still cached rather than from the entire library.
+
+        @param search       - query to fuzzy match against the library
+        @param cancelled    - optional callable which is polled while
+                              scoring.  If it returns True, scoring stops
+                              and the matches are left as they were for
+                              the previous search.
+        @return             - False if scoring was cancelled, else True
+        """
+        folded = fold(search)
+
+        if len(self._pending) > 0:
+            added = self._match(self._pending, self._current.query, cancelled=cancelled)
+            if added is None:
+                return False
+
+            merged = _Round(
+                added.query,
+                self._current.candidates + added.candidates,
+                heapq.nlargest(self._depth, self._current.top + added.top),
+                min(self._current.depth, added.depth),
+            )
+            self._pending = array.array("Q")
+            self._rounds = [self._root, merged]
+            self._set_current(merged)
+
+        depth = len(self._rounds)
+        while not folded.startswith(self._rounds[depth - 1].query):
+            depth -= 1
+
+        base = self._rounds[depth - 1]
+        if base.query != folded:
+            c_round = self._match(base.candidates, folded, cancelled=cancelled)
+            if c_round is None:
+                return False
+            del self._rounds[depth:]
+            self._push(c_round)
+        else:
+            del self._rounds[depth:]
+            if base is not self._current:
+                self._set_current(base)
 
         self._search = search
+        return True
 
-        if s_len == 0:
-            return
-        elif s_len == 1:
-            # In the single character search case, it's far faster to use the
-            # string index function over regex.  This is important as we want
-            # to slim down the potential matches as quickly as possible.
-            def quick_score(path, info):
-                index = path.find(search)
-                if index != -1:
-                    info.update(start=index, end=index, score=1.0)
-                else:
-                    info.update(round_ejected=1)
-
-            for path, info in self._library.items():
-                quick_score(path, info)
-            return
+    def match_queries(self, queries, depth=10, cancelled=None):
+        """
+        Find the best matches of many queries at once without changing the
+        current query.  The queries are matched in sorted order so that,
+        like the rounds kept by update_scores(), a query extending another
+        one is only matched against the paths which matched the longest
+        such query.  Queries typed one character at a time by an editor
+        therefore cost little more than the last of them.  Only the matches
+        of the prefixes of the query being matched are held at any time.
+
+        @param queries      - list of queries
+        @param depth        - maximum number of matches returned per query
+        @param cancelled    - optional callable polled while scoring, see
+                              update_scores()
+        @return             - list holding, for every query, a list of
+                              (path, start, end, score) of its best matches,
+                              best first, or None if cancelled
+        """
+        folded = sorted(set(fold(query) for query in queries))
+
+        matches = {}
+        stack = [self._root]
+        for query in folded:
+            while not query.startswith(stack[-1].query):
+                stack.pop()
+
+            if query == stack[-1].query:
+                c_round = stack[-1]
+            else:
+                c_round = self._match(stack[-1].candidates, query, cancelled=cancelled)
+                if c_round is None:
+                    return None
+                stack.append(c_round)
+
+            matches[query] = [
+                (self._paths[index],) + self._round_span(c_round, index)
+                for index in self._rank_round(c_round, depth)
+            ]
 
-        pattern = "(?=(" + ".*?".join(re.escape(c) for c in search) + "))"
-        regex = re.compile(pattern, re.IGNORECASE)
+        return [matches[fold(query)] for query in queries]
 
-        scorer = functools.partial(self._scorer, c_round=s_len, regex=regex)
-        candidates = [
-            path for path, info in self._library.items() if info.round_ejected == 0
-        ]
+    def _round_span(self, c_round, index):
+        """
+        @param c_round  - _Round the path is a candidate of
+        @param index    - index of the path in the library
+        @return         - tuple of (start, end, score) of the match
+        """
+        if c_round.candidates is None:
+            return 0, 0, 0.0
+        elif c_round.spans is not None:
+            pos = c_round.position(index)
+            return tuple(column[pos] for column in c_round.spans)
+
+        span = c_round.known.get(index)
+        if span is None:
+            path = self._paths[index]
+            _, (start, end, score, _) = self._scorer(
+                path, len(c_round.query), c_round.query
+            )
+            span = c_round.known[index] = (start, end, score)
+        return span
+
+    def _push(self, c_round):
+        """
+        Push the matches for a new query on to the stack.  Matches for the
+        shortest cached prefixes are dropped first if the stack has grown
+        larger than the cache size.
 
-        for path, update in self._pool.map(scorer, candidates):
-            self._library[path].update(*update)
+        @param c_round  - _Round of matches for the new query
+        """
+        self._rounds.append(c_round)
+        self._set_current(c_round)
+
+        cached = sum(len(r) for r in self._rounds[1:-1])
+        while cached > self._cache_size:
+            cached -= len(self._rounds.pop(1))
+
+    def _set_current(self, c_round):
+        """
+        Make a round the matches of the current query.
+
+        @param c_round  - _Round of matches for the current query
+        """
+        self._current = c_round
+        self._top = None
+
+    def _match(self, candidates, search, full=False, cancelled=None):
+        """
+        Match a query against a set of paths using the executor.  Each job
+        only sends back the indices of the paths which matched and its own
+        best matches which are merged here.
+
+        @param candidates   - array('Q') of indices of the paths to match or
+                              None to match every path in the library
+        @param search       - case-folded query
+        @param full         - if True, compute the spans of every match
+        @param cancelled    - optional callable polled between jobs, see
+                              update_scores()
+        @return             - _Round of matches for search or None if
+                              cancelled
+        """
+        if candidates is None:
+            n_candidates = len(self._paths)
+        else:
+            n_candidates = len(candidates)
+
+        backend = self._executor.select(n_candidates)
+        query_mask = char_mask(search)
+        args = (self._scorer, search, query_mask, self._depth, full)
+
+        if backend.in_process:
+            job = functools.partial(
+                corpus.match_paths,
+                *args,
+                self._paths,
+                self._masks,
+                self._parents,
+                candidates,
+            )
+        else:
+            # Only the indices of the candidates are copied into shared
+            # memory, the workers are sent nothing but the query and a range
+            # of them.
+            shared = self._shared_corpus()
+            if candidates is not None:
+                shared.set_candidates(candidates)
+            job = functools.partial(
+                corpus.match_range, *args, shared.handle, candidates is None
+            )
+
+        start = time.perf_counter()
+        results = backend.map(job, backend.bounds(n_candidates), cancelled)
+        if results is None:
+            return None
+        self._executor.record(backend, n_candidates, time.perf_counter() - start)
+
+        survivors = array.array("Q")
+        top = []
+        spans = (array.array("i"), array.array("i"), array.array("d"))
+        for _, part, part_top, part_spans in results:
+            survivors.extend(part)
+            top.extend(part_top)
+            if full:
+                for column, values in zip(spans, part_spans):
+                    column.extend(values)
+
+        top = heapq.nlargest(self._depth, top)
+        c_round = _Round(search, survivors, top, self._depth)
+        if full:
+            c_round.spans = spans
+        return c_round
+
+    def _span(self, path):
+        """
+        @param path - path to lookup
+        @return     - tuple of (start, end, score) of how the current query
+                      matches the path
+        """
+        index = self._index[path]
+        c_round = self._current
+        if c_round.candidates is None or c_round.position(index) == -1:
+            return 0, 0, 0.0
+        return self._round_span(c_round, index)
 
     def score(self, path):
         """
         @param path - path to lookup
         @return     - score of the given path
         """
-        return self._library[path].score
+        return self._span(path)[2]
 
     def start(self, path):
         """
@@ -197,7 +808,7 @@ class FuzzyMatch(object):
         @return     - index of the start of the match of the current query in
                       the path
         """
-        return self._library[path].start
+        return self._span(path)[0]
 
     def end(self, path):
         """
@@ -205,26 +816,62 @@ class FuzzyMatch(object):
         @return     - index of the end of the match of the current query in the
                       path
         """
-        return self._library[path].end
+        return self._span(path)[1]
 
-    def top_matches(self, depth=10):
+    def top_matches(self, depth=10, offset=0):
         """
         Get the best matching paths in the library.  Note that only paths which
         have not been ejected and have a positive score will be returned.
         Therefore, the length of the returned list may be less than the
-        specified depth.
+        specified depth.  The ranking is cached until the library or the
+        query changes so repeated calls are cheap, and it is only extended
+        as far as asked so that paging through the matches costs no more
+        than the paths on each page.
 
         @param depth    - maximum number of paths to return
+        @param offset   - number of the best paths to skip
         @return         - sorted list of the top scoring paths in the library
         """
-        if len(self._search) > 0:
-            valid = [
-                path
-                for path, info in self._library.items()
-                if info.score > 0 and info.round_ejected == 0
-            ]
-        else:
-            valid = self._library.keys()
+        end = offset + depth
+        if self._top is None:
+            self._top = self._rank(end)
+            self._top_depth = end
+        elif end > self._top_depth and len(self._top) == self._top_depth:
+            self._top.extend(self._rank(end, len(self._top)))
+            self._top_depth = end
 
-        ret = heapq.nlargest(depth, valid, key=lambda x: self._library[x].score)
-        return ret
+        return [self._paths[index] for index in self._top[offset:end]]
+
+    def _rank(self, depth, start=0):
+        """
+        @param depth    - number of the best paths to rank
+        @param start    - number of the best paths to leave out
+        @return         - list of the indices of the paths ranked from start
+                          to depth
+        """
+        c_round = self._current
+
+        if c_round.candidates is None and len(self._search) > 0:
+            # The library was reset and nothing has been scored
+            return []
+        return self._rank_round(c_round, depth, start)
+
+    def _rank_round(self, c_round, depth, start=0):
+        """
+        @param c_round  - _Round to rank
+        @param depth    - number of the best paths to rank
+        @param start    - number of the best paths to leave out
+        @return         - list of the indices of the paths ranked from start
+                          to depth
+        """
+        if c_round.candidates is None:
+            # Nothing has been scored so every path ties
+            return list(range(start, min(depth, len(self._paths))))
+        elif depth > len(c_round.top) and not c_round.ranked:
+            if c_round.spans is None:
+                c_round.spans = self._match(
+                    c_round.candidates, c_round.query, True
+                ).spans
+            c_round.extend(depth)
+
+        return [-neg for _, neg, _, _ in c_round.top[start:depth]]
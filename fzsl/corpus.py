@@ -0,0 +1,322 @@
+import array
+import functools
+import heapq
+import itertools
+
+from . import core
+
+
+# Views of shared corpora opened by this process, keyed by their handle.
+_attached = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_memory():
+    """
+    multiprocessing is only imported once a library is large enough to be
+    scored by worker processes as it takes longer to import than the rest
+    of fzsl.
+
+    @return - the multiprocessing.shared_memory module or None if it is not
+              available
+    """
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        return None
+    return shared_memory
+
+
+def available():
+    """
+    @return - True if corpora can be shared with worker processes
+    """
+    return _shared_memory() is not None
+
+
+def start_tracker():
+    """
+    Start the shared memory resource tracker.  This must be called before
+    creating worker processes so that they share the tracker of the parent.
+    Otherwise each worker starts its own tracker which would unlink any
+    segment the worker opened when it exits.
+    """
+    if available():
+        from multiprocessing import resource_tracker
+
+        resource_tracker.ensure_running()
+
+
+def _segment(data):
+    """
+    Copy data into a newly created shared memory segment.
+
+    @param data - bytes-like object to copy
+    @return     - the new SharedMemory segment
+    """
+    shm = _shared_memory().SharedMemory(create=True, size=max(len(data), 8))
+    shm.buf[: len(data)] = data
+    return shm
+
+
+def _release(shm):
+    shm.close()
+    shm.unlink()
+
+
+class SharedCorpus(object):
+    def __init__(self, paths, masks, parents):
+        """
+        Library of paths stored once in shared memory so that worker
+        processes can read them by index rather than having every path
+        pickled to them on each query.  Paths are packed as UTF-8 into a
+        single segment with a second segment holding the byte offset of
+        every path, a third holding the character mask of every path and
+        a fourth the directory of every path.  A fifth segment holds the
+        indices of the paths which are candidates for the current query.
+
+        @param paths    - list of paths.  The index of a path in this list
+                          is used to refer to it.
+        @param masks    - array('Q') of the fzsl.core.char_mask() of every
+                          path
+        @param parents  - array('I') of the directory id of every path
+        """
+        encoded = [path.encode("UTF-8", "surrogateescape") for path in paths]
+        offsets = array.array("Q", [0])
+        offsets.extend(itertools.accumulate(len(e) for e in encoded))
+
+        self._data = _segment(b"".join(encoded))
+        self._offsets = _segment(offsets.tobytes())
+        self._masks = _segment(masks.tobytes())
+        self._parents = _segment(parents.tobytes())
+        self._candidates = _segment(b"")
+
+    @property
+    def handle(self):
+        """
+        Picklable reference to the corpus which can be passed to attach()
+        """
+        return (
+            self._data.name,
+            self._offsets.name,
+            self._masks.name,
+            self._parents.name,
+            self._candidates.name,
+        )
+
+    def set_candidates(self, candidates):
+        """
+        Set the indices of the paths to be matched by match_range().  The
+        candidate segment is reallocated if it is too small which changes
+        the handle of the corpus.  No job of an earlier query may still be
+        reading the candidates, Executor.map() only returns once none runs.
+
+        @param candidates   - array('Q') of path indices
+        """
+        data = candidates.tobytes()
+        if len(data) > self._candidates.size:
+            size = max(len(data), 2 * self._candidates.size)
+            _detach(self.handle)
+            _release(self._candidates)
+            self._candidates = _segment(bytes(size))
+        self._candidates.buf[: len(data)] = data
+
+    def close(self):
+        """
+        Release the shared memory backing the corpus.
+        """
+        _detach(self.handle)
+        for shm in (
+            self._data,
+            self._offsets,
+            self._masks,
+            self._parents,
+            self._candidates,
+        ):
+            _release(shm)
+
+
+class _CorpusView(object):
+    def __init__(self, handle):
+        """
+        Read-only view of a SharedCorpus from any process.
+
+        @param handle   - SharedCorpus.handle of the corpus to open
+        """
+        shared_memory = _shared_memory()
+        self._segments = [shared_memory.SharedMemory(name=name) for name in handle]
+        data, offsets, masks, parents, candidates = self._segments
+        self._data = data.buf
+        self._offsets = offsets.buf.cast("Q")
+        self.masks = masks.buf.cast("Q")
+        self.parents = parents.buf.cast("I")
+        self.candidates = candidates.buf.cast("Q")
+
+    def path(self, index):
+        """
+        @param index    - index of the path in the corpus
+        @return         - the decoded path
+        """
+        start = self._offsets[index]
+        end = self._offsets[index + 1]
+        return str(self._data[start:end], "UTF-8", "surrogateescape")
+
+    def close(self):
+        for view in (self._offsets, self.masks, self.parents, self.candidates):
+            view.release()
+        self._data = self._offsets = self.masks = self.parents = None
+        self.candidates = None
+        for shm in self._segments:
+            shm.close()
+
+
+def attach(handle):
+    """
+    Open a shared corpus.  Views are cached so repeated calls with the
+    same handle are cheap.  Views of any other corpus are closed as a
+    process only ever needs the current one.
+
+    @param handle   - SharedCorpus.handle of the corpus to open
+    @return         - view of the corpus
+    """
+    view = _attached.get(handle)
+    if view is None:
+        for stale in list(_attached):
+            _detach(stale)
+        view = _attached[handle] = _CorpusView(handle)
+    return view
+
+
+def _detach(handle):
+    view = _attached.pop(handle, None)
+    if view is not None:
+        view.close()
+
+
+def _scored(scorer, search, query_mask, items):
+    """
+    Match paths one at a time with a scorer.
+
+    @param scorer       - scoring function, see fzsl.core.default_scorer
+    @param search       - case-folded query
+    @param query_mask   - fzsl.core.char_mask() of the query
+    @param items        - iterable of (index, path, mask, parent) to match
+    @return             - generator of (index, start, end, score) for every
+                          path which matches
+    """
+    c_round = len(search)
+    for index, path, mask, _ in items:
+        if mask & query_mask != query_mask:
+            continue
+
+        _, (start, end, score, ejected) = scorer(path, c_round, search)
+        if ejected == 0:
+            yield index, start, end, score
+
+
+def _match(scorer, search, query_mask, depth, full, items):
+    """
+    Match paths against a query keeping only what the caller needs: the
+    indices of the paths that matched and the best few matches.
+
+    @param scorer       - scoring function, see fzsl.core.default_scorer
+    @param search       - case-folded query
+    @param query_mask   - fzsl.core.char_mask() of the query
+    @param depth        - number of best matches to return
+    @param full         - if True, also return the span and score of every
+                          matching path
+    @param items        - iterable of (index, path, mask, parent) to match
+    @return             - tuple of (survivors, top, spans).  survivors is
+                          an array('Q') of the indices of matching paths.
+                          top is a list of up to depth (score, -index,
+                          start, end) tuples of the best matches, best
+                          first.  spans is None unless full is set in which
+                          case it is a tuple of arrays of (starts, ends,
+                          scores) with an entry for each survivor.
+    """
+    if scorer is core.default_scorer:
+        matches = core.match_tree(search, query_mask, items)
+    else:
+        matches = _scored(scorer, search, query_mask, items)
+
+    survivors = array.array("Q")
+    top = []
+    spans = (array.array("i"), array.array("i"), array.array("d"))
+
+    for index, start, end, score in matches:
+        survivors.append(index)
+        if full:
+            spans[0].append(start)
+            spans[1].append(end)
+            spans[2].append(score)
+
+        entry = (score, -index, start, end)
+        if len(top) < depth:
+            heapq.heappush(top, entry)
+        elif entry > top[0]:
+            heapq.heapreplace(top, entry)
+
+    top.sort(reverse=True)
+    return survivors, top, spans if full else None
+
+
+def match_range(scorer, search, query_mask, depth, full, handle, every, bounds):
+    """
+    Match a range of the candidates of a shared corpus.  This is run by
+    worker processes and only the query and range are sent to it.  Only
+    the matching indices and the best few matches are sent back.
+
+    @param scorer       - scoring function, see fzsl.core.default_scorer
+    @param search       - case-folded query
+    @param query_mask   - fzsl.core.char_mask() of the query
+    @param depth        - number of best matches to return
+    @param full         - return the spans of every match, see _match()
+    @param handle       - SharedCorpus.handle of the corpus to match
+    @param every        - if True, bounds index every path in the corpus
+                          rather than the candidates
+    @param bounds       - tuple of (lo, hi) indices into the candidates
+    @return             - tuple of (lo, survivors, top, spans), see _match()
+    """
+    lo, hi = bounds
+    view = attach(handle)
+    indices = range(lo, hi) if every else view.candidates[lo:hi]
+    items = (
+        (index, view.path(index), view.masks[index], view.parents[index])
+        for index in indices
+    )
+    return (lo,) + _match(scorer, search, query_mask, depth, full, items)
+
+
+def match_paths(
+    scorer,
+    search,
+    query_mask,
+    depth,
+    full,
+    library,
+    masks,
+    parents,
+    candidates,
+    bounds,
+):
+    """
+    Match a range of candidates from a list of paths in this process.  This
+    is the counterpart to match_range() for serial and threaded matching.
+
+    @param scorer       - scoring function, see fzsl.core.default_scorer
+    @param search       - case-folded query
+    @param query_mask   - fzsl.core.char_mask() of the query
+    @param depth        - number of best matches to return
+    @param full         - return the spans of every match, see _match()
+    @param library      - list of every path
+    @param masks        - array('Q') of the character mask of every path
+    @param parents      - array('I') of the directory id of every path
+    @param candidates   - array of the indices of the paths to match or
+                          None to match every path
+    @param bounds       - tuple of (lo, hi) indices into the candidates
+    @return             - see match_range()
+    """
+    lo, hi = bounds
+    indices = range(lo, hi) if candidates is None else candidates[lo:hi]
+    items = ((index, library[index], masks[index], parents[index]) for index in indices)
+    return (lo,) + _match(scorer, search, query_mask, depth, full, items)
@@ -0,0 +1,321 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from .scanner import scanner_from_configparser, WalkScanner
+
+# Maximum number of scanners checked at once.  Checks mostly wait on
+# detect commands so this is not tied to the number of CPUs.
+THREADS = 8
+
+# Seconds for which the scanner picked for a directory is remembered
+DEFAULT_TTL = 60
+
+
+def default_cache_path():
+    """
+    @return - path of the detection cache under $XDG_CACHE_HOME
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "fzsl", "detect.json")
+
+
+def config_key(parser):
+    """
+    @param parser   - parser holding the configuration
+    @return         - string which changes whenever the configuration does
+    """
+    config = repr([(s, sorted(parser.items(s))) for s in parser.sections()])
+    return hashlib.sha1(config.encode("UTF-8")).hexdigest()
+
+
+def build_rules(parser):
+    """
+    Order the rules without building their scanners.  Rules are ordered by
+    their priority option.  Python rules without one are built at once as
+    only the scanner knows its priority.
+
+    @param parser   - parser holding the configuration
+    @return         - list of (section, build, deferred) for every rule which
+                      can be picked, sorted by decreasing priority.  build
+                      is a callable returning the scanner of the rule and
+                      deferred is True if it runs a python plugin and should
+                      only be called once every rule before it is found
+                      unsuitable.
+    """
+    ret = []
+    for section in parser.sections():
+        if section == "fzsl":
+            continue
+
+        build = functools.partial(scanner_from_configparser, section, parser)
+        deferred = parser.has_option(section, "type") and (
+            parser.get(section, "type") == "python"
+        )
+        if parser.has_option(section, "priority"):
+            priority = int(parser.get(section, "priority"))
+        elif deferred:
+            scanner = build()
+            priority = scanner.priority
+            build = _built(scanner)
+            deferred = False
+        else:
+            priority = 0
+
+        if priority >= 0:
+            ret.append((priority, section, build, deferred))
+
+    ret.sort(key=lambda rule: rule[0])
+    ret.reverse()
+    return [(section, build, deferred) for _, section, build, deferred in ret]
+
+
+def detection_cache(parser):
+    """
+    @param parser   - parser holding the configuration, the detect_ttl and
+                      detect_cache options of its fzsl section are used
+    @return         - DetectionCache or None if picks are not remembered
+    """
+    ttl = DEFAULT_TTL
+    path = default_cache_path()
+    if parser.has_option("fzsl", "detect_ttl"):
+        ttl = parser.getint("fzsl", "detect_ttl")
+    if parser.has_option("fzsl", "detect_cache"):
+        path = os.path.expanduser(parser.get("fzsl", "detect_cache"))
+
+    if ttl <= 0:
+        return None
+    return DetectionCache(path, ttl, config_key(parser))
+
+
+def scanner_for_path(parser, path):
+    """
+    Pick the rule to use for a path.  The rule picked last time is used
+    without checking the others if it is remembered, see detection_cache().
+
+    @param parser   - parser holding the configuration
+    @param path     - path fzsl runs in
+    @return         - tuple of the (section, scanner) to use.  If no rule is
+                      suitable, the section is None and the scanner walks
+                      the path.
+    """
+    cache = detection_cache(parser)
+    if cache is not None:
+        section = cache.get(path)
+        if section is not None and parser.has_section(section):
+            return section, scanner_from_configparser(section, parser)
+
+    section, scanner = _pick(build_rules(parser), path, THREADS)
+    if scanner is None:
+        return None, WalkScanner("default", follow_links=True, ignore=False)
+
+    if cache is not None:
+        cache.set(path, section)
+    return section, scanner
+
+
+def _built(scanner):
+    """
+    @param scanner  - Scanner which is already built
+    @return         - build callable of a rule returning the scanner
+    """
+    return lambda: scanner
+
+
+class _Check(object):
+    def __init__(self, key, scanner, path):
+        """
+        Check whether a scanner is suitable in a daemon thread.  Checks
+        which are no longer needed are left running but, unlike the workers
+        of a thread pool, are not waited for when python exits.
+
+        @param key      - value returned with the scanner when it is picked
+        @param scanner  - Scanner to check
+        @param path     - path to check
+        """
+        self.key = key
+        self.scanner = scanner
+        self._done = threading.Event()
+        self._suitable = False
+        self._error = None
+
+        thread = threading.Thread(
+            target=self._run, args=(path,), name="fzsl-detect-%s" % (key,)
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, path):
+        try:
+            self._suitable = self.scanner.is_suitable(path)
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def suitable(self):
+        """
+        @return - True if the scanner is suitable, once the check finished
+        @raise  - the error raised by the check
+        """
+        self._done.wait()
+        if self._error is not None:
+            raise self._error[1].with_traceback(self._error[2])
+        return self._suitable
+
+
+def _pick(rules, path, threads):
+    """
+    Pick the first suitable rule.  Scanners are built in order as checks
+    are started and at most threads checks run at once.  The first suitable
+    rule is picked as soon as the checks of all rules before it have
+    failed, without waiting for the checks of the rules after it.
+
+    @param rules    - iterable of (key, build, deferred), see build_rules()
+    @param path     - path to check
+    @param threads  - maximum number of scanners checked at once
+    @return         - tuple of the (key, scanner) picked or (None, None)
+    @raise          - any error raised by the check of a scanner which had
+                      to be waited on
+    """
+    rules = iter(rules)
+    pending = collections.deque()
+    exhausted = False
+
+    while True:
+        while pending and pending[0].done():
+            check = pending.popleft()
+            if check.suitable():
+                return check.key, check.scanner
+
+        if not exhausted and len(pending) < max(threads, 1):
+            rule = next(rules, None)
+            if rule is None:
+                exhausted = True
+                continue
+
+            key, build, deferred = rule
+            while deferred and pending:
+                check = pending.popleft()
+                if check.suitable():
+                    return check.key, check.scanner
+
+            scanner = build()
+            if scanner.priority >= 0:
+                pending.append(_Check(key, scanner, path))
+            continue
+
+        if not pending:
+            return None, None
+
+        check = pending.popleft()
+        if check.suitable():
+            return check.key, check.scanner
+
+
+def pick_scanner(scanners, path, threads=THREADS):
+    """
+    Pick the scanner to use for a path.  The is_suitable() checks of the
+    scanners run at once and the first suitable scanner is picked as soon
+    as the checks of all scanners before it have failed, without waiting
+    for the checks of the scanners after it.
+
+    @param scanners - list of Scanner in order of preference, usually sorted
+                      by decreasing priority.  Scanners with a priority less
+                      than 0 are never picked.
+    @param path     - path to check
+    @param threads  - maximum number of scanners checked at once
+    @return         - the picked Scanner or None if no scanner is suitable
+    @raise          - any error raised by the check of a scanner which had
+                      to be waited on
+    """
+    rules = [(i, _built(scanner), False) for i, scanner in enumerate(scanners)]
+    return _pick(rules, path, threads)[1]
+
+
+class DetectionCache(object):
+    def __init__(self, path, ttl=DEFAULT_TTL, key=""):
+        """
+        Remember the name of the scanner picked for each directory so that
+        the checks do not need to run again every time fzsl starts.  The
+        cache is a small JSON file which is rewritten atomically so that
+        concurrent instances of fzsl at worst lose an entry.
+
+        @param path     - file holding the cache
+        @param ttl      - seconds for which a pick is remembered
+        @param key      - string identifying the configuration the scanners
+                          were built from.  Picks stored with another key
+                          are ignored.
+        """
+        self._path = path
+        self._ttl = ttl
+        self._key = key
+
+    def _load(self):
+        """
+        @return - dictionary of directory to (time, scanner name) of the
+                  entries which have not expired
+        """
+        try:
+            with open(self._path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict) or data.get("key") != self._key:
+            return {}
+
+        now = time.time()
+        try:
+            return {
+                directory: (stamp, name)
+                for directory, (stamp, name) in data["entries"].items()
+                if 0 <= now - stamp < self._ttl
+            }
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return {}
+
+    def get(self, directory):
+        """
+        @param directory    - directory fzsl runs in
+        @return             - name of the scanner picked for the directory or
+                              None if there is none or it expired
+        """
+        entry = self._load().get(directory)
+        return entry[1] if entry is not None else None
+
+    def set(self, directory, name):
+        """
+        Remember the scanner picked for a directory.  Expired entries are
+        dropped at the same time.  Failing to write the cache is not an
+        error, the checks are simply run again next time.
+
+        @param directory    - directory fzsl runs in
+        @param name         - name of the picked scanner
+        """
+        entries = self._load()
+        entries[directory] = (time.time(), name)
+        data = {"key": self._key, "entries": entries}
+
+        try:
+            dirname = os.path.dirname(self._path) or "."
+            os.makedirs(dirname, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w",
+                dir=dirname,
+                prefix=".%s." % (os.path.basename(self._path),),
+                delete=False,
+            ) as fp:
+                json.dump(data, fp)
+            os.replace(fp.name, self._path)
+        except OSError:
+            pass
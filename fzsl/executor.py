@@ -0,0 +1,273 @@
+import abc
+import collections
+import os
+import signal
+import sys
+
+from . import corpus
+
+
+def _worker_init():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _context():
+    """
+    Workers must not be forked as the pool is started by whichever thread
+    first needs it while others are running, and a forked child can
+    inherit locks held by those threads.  The forkserver is itself started
+    from a fresh process.
+
+    @return - multiprocessing context used to start worker processes
+    """
+    import multiprocessing
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _gil_enabled():
+    """
+    @return - False if running on a free-threaded build of python
+    """
+    check = getattr(sys, "_is_gil_enabled", None)
+    return True if check is None else check()
+
+
+class Executor(object, metaclass=abc.ABCMeta):
+    """
+    Backend used by FuzzyMatch to run scoring jobs.  A job is called with
+    a tuple of (lo, hi) bounds of the candidates to score.
+
+    @attr in_process    - True if jobs run in the calling process and
+                          can therefore read the library directly.
+                          Otherwise jobs read the library from a
+                          fzsl.corpus.SharedCorpus.
+    @attr workers       - number of jobs that can run concurrently
+    @attr min_chunk     - smallest number of candidates worth sending
+                          in a single job
+    """
+
+    in_process = True
+    workers = 1
+    min_chunk = 1
+
+    def select(self, n_items):
+        """
+        Pick the executor that should score the given number of candidates.
+
+        @param n_items  - number of candidates to be scored
+        @return         - Executor to use
+        """
+        return self
+
+    def record(self, executor, n_items, elapsed):
+        """
+        Record how long scoring took.
+
+        @param executor - Executor returned by select() that did the work
+        @param n_items  - number of candidates that were scored
+        @param elapsed  - wall time in seconds that scoring took
+        """
+        pass
+
+    def bounds(self, n_items):
+        """
+        Split candidates into jobs.  Each worker is given a few jobs so that
+        an unlucky worker with slow paths does not hold up the rest, but no
+        job is smaller than min_chunk.
+
+        @param n_items  - number of candidates to be scored
+        @return         - list of (lo, hi) bounds, one per job
+        """
+        chunk = max(self.min_chunk, -(-n_items // (4 * self.workers)))
+        return [(lo, min(lo + chunk, n_items)) for lo in range(0, n_items, chunk)]
+
+    @abc.abstractmethod
+    def map(self, job, bounds, cancelled=None):
+        """
+        Run a job over every set of bounds.
+
+        @param job          - callable taking a tuple of (lo, hi)
+        @param bounds       - list of bounds
+        @param cancelled    - optional callable which is polled between
+                              jobs.  Once it returns True no more jobs are
+                              started.  Jobs which are already running are
+                              still waited for, none is left running once
+                              this returns.
+        @return             - list of the results of each job, in order, or
+                              None if cancelled
+        """
+        pass
+
+    def close(self):
+        """
+        Release any workers held by the executor.
+        """
+        pass
+
+
+class SerialExecutor(Executor):
+    """
+    Run every job in the calling thread.  This has no startup cost and is
+    the fastest option for small libraries.
+    """
+
+    min_chunk = 1 << 13
+
+    def map(self, job, bounds, cancelled=None):
+        results = []
+        for b in bounds:
+            if cancelled is not None and cancelled():
+                return None
+            results.append(job(b))
+        return results
+
+
+class ThreadExecutor(Executor):
+    def __init__(self, workers=None):
+        """
+        Run jobs in a thread pool.  This only helps when the scorer releases
+        the GIL or python is a free-threaded build.  The pool is started on
+        first use.
+
+        @param workers  - number of threads, defaults to the number of cpus
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chunk = 256
+        self._pool = None
+
+    def map(self, job, bounds, cancelled=None):
+        import concurrent.futures
+
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+
+        futures = [self._pool.submit(job, b) for b in bounds]
+        results = []
+        for future in futures:
+            if cancelled is not None and cancelled():
+                for f in futures:
+                    f.cancel()
+                concurrent.futures.wait(futures)
+                return None
+            results.append(future.result())
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class ProcessExecutor(Executor):
+    in_process = False
+
+    def __init__(self, workers=None):
+        """
+        Run jobs in a pool of worker processes which read the library from
+        shared memory.  The pool is started on first use and kept until
+        close() is called so it can be reused by any number of queries and
+        FuzzyMatch instances.  This requires multiprocessing.shared_memory.
+        Workers are not forked, so as with multiprocessing on macOS or
+        Windows, scripts using this must guard their entry point with
+        if __name__ == "__main__".
+
+        @param workers  - number of processes, defaults to the number of cpus
+        """
+        if not corpus.available():
+            raise RuntimeError("ProcessExecutor requires multiprocessing.shared_memory")
+
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chunk = 2048
+        self._pool = None
+
+    def map(self, job, bounds, cancelled=None):
+        if self._pool is None:
+            # multiprocessing is only imported once the pool is needed
+            context = _context()
+            corpus.start_tracker()
+            self._pool = context.Pool(self.workers, initializer=_worker_init)
+
+        if cancelled is None:
+            return self._pool.map(job, bounds, chunksize=1)
+
+        # Jobs handed to the pool cannot be recalled, so only one per worker
+        # is queued at a time and a cancelled query leaves no work behind
+        # for the next one to wait on.  The running jobs are waited for as
+        # they read shared memory that the next query may rewrite.
+        results = []
+        pending = collections.deque()
+        for b in bounds:
+            if cancelled():
+                for result in pending:
+                    result.wait()
+                return None
+            if len(pending) >= self.workers:
+                results.append(pending.popleft().get())
+            pending.append(self._pool.apply_async(job, (b,)))
+        results.extend(result.get() for result in pending)
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+
+# Process pool shared by every AutoExecutor
+_process_executor = None
+
+
+def process_executor():
+    """
+    @return - the ProcessExecutor shared by every AutoExecutor
+    """
+    global _process_executor
+    if _process_executor is None:
+        _process_executor = ProcessExecutor()
+    return _process_executor
+
+
+class AutoExecutor(Executor):
+    def __init__(self, budget=0.03, cost=2e-6):
+        """
+        Pick a backend for each query based on the number of candidates and
+        the measured cost of scoring a path.  Work that can be finished in
+        the calling thread within the budget is never handed to workers.
+        Larger jobs use threads on free-threaded builds of python and
+        otherwise the shared process pool.
+
+        @param budget   - seconds of scoring that is done serially
+        @param cost     - initial estimate of the seconds it takes to score
+                          a single path
+        """
+        self._budget = budget
+        self._cost = cost
+        self._serial = SerialExecutor()
+        self._threads = None
+
+    def select(self, n_items):
+        workers = os.cpu_count() or 1
+        if n_items * self._cost < self._budget or workers < 2:
+            return self._serial
+        elif not _gil_enabled():
+            if self._threads is None:
+                self._threads = ThreadExecutor(workers)
+            return self._threads
+        elif corpus.available():
+            return process_executor()
+        return self._serial
+
+    def record(self, executor, n_items, elapsed):
+        if n_items > 0:
+            cost = elapsed * executor.workers / n_items
+            self._cost = 0.75 * self._cost + 0.25 * cost
+
+    def map(self, job, bounds, cancelled=None):
+        return self._serial.map(job, bounds, cancelled)
+
+    def close(self):
+        if self._threads is not None:
+            self._threads.close()
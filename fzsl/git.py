@@ -0,0 +1,293 @@
+import os
+import struct
+import subprocess
+
+# Number of submodules whose indexes are read at once
+THREADS = 4
+
+_SIGNATURE = b"DIRC"
+_HEADER = struct.Struct(">4sII")
+# Entries start with ctime, mtime, dev, ino, mode, uid, gid, size, sha1
+# and flags of which only the mode and flags are needed
+_ENTRY = struct.Struct(">24xI32xH")
+_EXTENSION = struct.Struct(">4sI")
+
+_FLAG_EXTENDED = 0x4000
+_FLAG_NAME_MASK = 0xFFF
+
+_S_IFMT = 0o170000
+_S_IFDIR = 0o040000
+_S_IFGITLINK = 0o160000
+
+# Size of the trailing checksum
+_CHECKSUM = 20
+
+
+class GitError(Exception):
+    pass
+
+
+def _read_gitfile(path):
+    """
+    @param path - path to a .git file, as used by submodules and worktrees
+    @return     - the git directory it points to or None if it is not valid
+    """
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read(4096)
+    except OSError:
+        return None
+
+    if not data.startswith(b"gitdir: "):
+        return None
+    gitdir = os.fsdecode(data[len(b"gitdir: ") :].strip())
+    return os.path.normpath(os.path.join(os.path.dirname(path), gitdir))
+
+
+def git_dir(worktree):
+    """
+    @param worktree - path to a directory
+    @return         - git directory of the working tree at the directory or
+                      None if it is not the top of a working tree
+    """
+    dotgit = os.path.join(worktree, ".git")
+    if os.path.isdir(dotgit):
+        return dotgit
+    return _read_gitfile(dotgit)
+
+
+def find_repository(path):
+    """
+    Find the working tree holding a path by looking for .git in the path
+    and each of its parents, like git rev-parse --show-toplevel.
+
+    @param path - path to start looking from
+    @return     - tuple of the (worktree, git directory) or None if the path
+                  is not in a working tree
+    """
+    path = os.path.realpath(path)
+    while True:
+        gitdir = git_dir(path)
+        if gitdir is not None:
+            return path, gitdir
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def exclude_files(worktree, gitdir):
+    """
+    Find the files holding the ignore patterns of a working tree other than
+    its .gitignore files.  The global excludes file is named by the
+    core.excludesFile setting, which is read by running git config.
+
+    @param worktree - top of the working tree
+    @param gitdir   - git directory of the working tree
+    @return         - list of the paths of the global excludes file and
+                      info/exclude, in increasing order of precedence.  They
+                      may not exist.
+    """
+    excludes = None
+    try:
+        c = subprocess.run(
+            ["git", "config", "--path", "core.excludesFile"],
+            cwd=worktree,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        if c.returncode == 0 and c.stdout.strip():
+            excludes = os.fsdecode(c.stdout.rstrip(b"\n"))
+    except OSError:
+        pass
+    if excludes is None:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+        excludes = os.path.join(base, "git", "ignore")
+
+    # Linked working trees share info/exclude with the main one
+    commondir = gitdir
+    try:
+        with open(os.path.join(gitdir, "commondir")) as fp:
+            commondir = os.path.join(gitdir, fp.read().strip())
+    except OSError:
+        pass
+    return [excludes, os.path.join(commondir, "info", "exclude")]
+
+
+def _varint(data, pos):
+    """
+    @param data - buffer holding an offset encoded as in the git index
+    @param pos  - position of the offset
+    @return     - tuple of the (value, position after the offset)
+    """
+    c = data[pos]
+    pos += 1
+    value = c & 0x7F
+    while c & 0x80:
+        c = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (c & 0x7F)
+    return value, pos
+
+
+def read_index(path):
+    """
+    Read the paths in a git index.  Versions 2, 3 and 4 are supported,
+    split indexes are not.  Paths with merge conflicts are listed once and
+    the directories of a sparse index are skipped.
+
+    @param path - path to the index
+    @return     - tuple of a list of the tracked paths, including
+                  submodules, and a list of the paths of submodules
+    @raise      - OSError if the index cannot be read and GitError if it
+                  is not a supported index
+    """
+    with open(path, "rb") as fp:
+        data = fp.read()
+
+    if len(data) < _HEADER.size + _CHECKSUM:
+        raise GitError("%s is not a git index" % (path,))
+    signature, version, count = _HEADER.unpack_from(data)
+    if signature != _SIGNATURE:
+        raise GitError("%s is not a git index" % (path,))
+    if version not in (2, 3, 4):
+        raise GitError("%s is index version %d" % (path, version))
+
+    names = []
+    gitlinks = []
+    previous = b""
+    pos = _HEADER.size
+    unpack_entry = _ENTRY.unpack_from
+    entry_size = _ENTRY.size
+    append = names.append
+    find = data.index
+    try:
+        for _ in range(count):
+            start = pos
+            mode, flags = unpack_entry(data, pos)
+            pos += entry_size
+            if flags & _FLAG_EXTENDED:
+                pos += 2
+
+            if version == 4:
+                # The name replaces the given number of bytes at the end of
+                # the previous name and there is no padding.
+                strip = data[pos]
+                if strip & 0x80:
+                    strip, pos = _varint(data, pos)
+                else:
+                    pos += 1
+                end = find(b"\0", pos)
+                name = previous[: len(previous) - strip] + data[pos:end]
+                pos = end + 1
+            else:
+                length = flags & _FLAG_NAME_MASK
+                if length == _FLAG_NAME_MASK:
+                    end = find(b"\0", pos)
+                else:
+                    end = pos + length
+                name = data[pos:end]
+                # Entries are padded with 1 to 8 NULs to a multiple of 8
+                pos = start + ((end - start + 8) & ~7)
+
+            if name == previous:
+                # Another stage of a conflict
+                continue
+            previous = name
+
+            kind = mode & _S_IFMT
+            if kind == _S_IFGITLINK:
+                gitlinks.append(name.decode("UTF-8", "surrogateescape"))
+            elif kind == _S_IFDIR:
+                continue
+            append(name)
+
+        while pos + _EXTENSION.size <= len(data) - _CHECKSUM:
+            signature, size = _EXTENSION.unpack_from(data, pos)
+            if signature == b"link":
+                raise GitError("%s is a split index" % (path,))
+            pos += _EXTENSION.size + size
+    except (IndexError, ValueError, struct.error):
+        raise GitError("%s is truncated" % (path,))
+
+    # Names cannot hold NULs so they are decoded at once
+    if not names:
+        return [], gitlinks
+    paths = b"\0".join(names).decode("UTF-8", "surrogateescape").split("\0")
+    return paths, gitlinks
+
+
+def ls_files(worktree, gitdir, submodules=True, threads=THREADS):
+    """
+    List the files tracked in a working tree, like git ls-files.
+
+    @param worktree     - top of the working tree
+    @param gitdir       - git directory of the working tree
+    @param submodules   - list the files of initialized submodules, prefixed
+                          with the path of the submodule, rather than the
+                          submodule itself like --recurse-submodules.  The
+                          indexes of submodules are read in parallel.
+    @param threads      - maximum number of submodules read at once
+    @return             - tuple of the list of paths and a list of
+                          (path, st_mtime_ns, st_size) of every index read
+    @raise              - GitError if an index is not supported
+    """
+    index = os.path.join(gitdir, "index")
+    try:
+        # The index is stat()ed before being read so that a change made
+        # while reading it shows up as a newer index
+        st = os.stat(index)
+        paths, gitlinks = read_index(index)
+    except FileNotFoundError:
+        # Nothing has been added yet
+        return [], [(index, None, None)]
+
+    indexes = [(index, st.st_mtime_ns, st.st_size)]
+    if not submodules or not gitlinks:
+        return paths, indexes
+
+    def read(submodule):
+        subtree = os.path.join(worktree, submodule)
+        subdir = git_dir(subtree)
+        if subdir is None:
+            # Not initialized, the stamp notices when it is
+            return None, [(os.path.join(subtree, ".git"), None, None)]
+
+        subpaths, subindexes = ls_files(subtree, subdir, True, threads)
+        return [submodule + "/" + path for path in subpaths], subindexes
+
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(min(threads, len(gitlinks))) as pool:
+        expanded = dict(zip(gitlinks, pool.map(read, gitlinks)))
+
+    ret = []
+    for path in paths:
+        subpaths, subindexes = expanded.get(path, (None, ()))
+        indexes.extend(subindexes)
+        if subpaths is None:
+            ret.append(path)
+        else:
+            ret.extend(subpaths)
+    return ret, indexes
+
+
+def indexes_unchanged(indexes):
+    """
+    @param indexes  - list of (path, st_mtime_ns, st_size) of indexes as
+                      returned by ls_files(), st_mtime_ns and st_size are
+                      None for paths which did not exist
+    @return         - True if none of the indexes changed
+    """
+    for path, mtime, size in indexes:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if mtime is not None:
+                return False
+            continue
+        if (st.st_mtime_ns, st.st_size) != (mtime, size):
+            return False
+    return True
@@ -0,0 +1,283 @@
+import sys
+import threading
+
+from . import core
+from . import matcher
+
+# Seconds without changes after which the cache of a watched library is
+# written
+CACHE_DELAY = 2.0
+
+
+class Library(object):
+    def __init__(self, scanner, path=None, depth=10, watch=False):
+        """
+        The files listed by a scanner, loaded into a BackgroundMatcher.  Scans
+        run in a background thread which hands files to the matcher in
+        batches as the scanner finds them, so queries are answered while
+        scanning.  If the files came from a cache the scanner wants
+        refreshed, a rescan follows and the library is synced with its
+        result once it finishes.  The cached files stay searchable in the
+        meantime.
+
+        A watched library is kept up to date after the first scan by the
+        watcher of the scanner, see Scanner.watcher().  The first walk of
+        the watcher takes the place of the refresh and files added or
+        removed afterwards are applied to the library as they change, the
+        added files being scored against the current query.  The cache of
+        the scanner, if any, is rewritten once the changes settle so that
+        the next scan reads a current list.
+
+        @param scanner  - fzsl.Scanner listing the files
+        @param path     - path at which scans start, if undefined then the
+                          current working directory is used
+        @param depth    - number of best matches kept in the results
+        @param watch    - watch for changes if the scanner supports it
+        """
+        self._scanner = scanner
+        self._path = path
+        self._matcher = matcher.BackgroundMatcher(core.FuzzyMatch(), depth)
+        self._lock = threading.Lock()
+        self._error = None
+        self._watch = watch
+        self._watcher = None
+        self._closed = False
+        self._follower = None
+
+        self.scanning = False
+        self.refreshing = False
+        self.scanned = 0
+
+    @property
+    def scanner(self):
+        return self._scanner
+
+    @property
+    def watching(self):
+        """
+        True if changes to the files are applied as they happen
+        """
+        return self._watcher is not None
+
+    @property
+    def results(self):
+        """
+        Results of the latest query which finished scoring, see
+        BackgroundMatcher.results.
+        """
+        return self._matcher.results
+
+    @property
+    def pending(self):
+        """
+        True if a query or change to the files is newer than the results
+        """
+        return self._matcher.pending
+
+    def search(self, search):
+        """
+        @param search   - query to match
+        @return         - generation of the request
+        """
+        return self._matcher.search(search)
+
+    def resize(self, depth):
+        """
+        @param depth    - number of best matches to keep
+        @return         - generation of the request
+        """
+        return self._matcher.resize(depth)
+
+    def scroll(self, offset):
+        """
+        @param offset   - number of the best matches to leave out of the
+                          results
+        @return         - generation of the request
+        """
+        return self._matcher.scroll(offset)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the results to be current, see BackgroundMatcher.wait().
+        Scanning may still be in progress.
+
+        @param timeout  - maximum number of seconds to wait
+        @return         - True if the results are current
+        """
+        return self._matcher.wait(timeout)
+
+    def scan(self, rescan=False):
+        """
+        Start scanning in a background thread unless a scan is already
+        running.
+
+        @param rescan   - skip straight to rescanning and syncing the library
+                          with the result, keeping the files already loaded
+                          searchable until it finishes
+        @return         - True if a scan was started
+        """
+        with self._lock:
+            if self.scanning:
+                return False
+            self.scanning = True
+            self.refreshing = rescan
+            self.scanned = 0
+            self._error = None
+
+        thread = threading.Thread(target=self._feed, args=(rescan,), name="fzsl-scan")
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _feed(self, rescan):
+        watcher = None
+        try:
+            watcher = self._scan(rescan)
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            with self._lock:
+                self.scanning = False
+                self.refreshing = False
+
+        if watcher is not None:
+            self._follow(watcher)
+
+    def _scan(self, rescan):
+        """
+        @param rescan   - see scan()
+        @return         - fzsl.Watcher to follow if watching started
+        """
+        if not rescan:
+            scanned = []
+            for batch in self._scanner.iter_scan(self._path):
+                self._matcher.add_files(batch)
+                self.scanned += len(batch)
+                scanned.append(batch)
+
+            watcher = self._start_watcher(scanned)
+            if watcher is not None or self._closed:
+                return watcher
+            elif not self._scanner.needs_refresh(self._path):
+                return None
+
+        # Only the difference between the old and new files is applied so
+        # the current query and its scores are kept.
+        self.refreshing = True
+        self._matcher.sync_files(self._scanner.scan(self._path, rescan=True))
+        return None
+
+    def _start_watcher(self, scanned):
+        """
+        Start watching, unless a watcher already runs, and sync the library
+        with the files found by its first walk.
+
+        @param scanned  - list of the batches of files found by the scan
+        @return         - the started fzsl.Watcher or None if the library is
+                          not watched
+        """
+        with self._lock:
+            if not self._watch or self._watcher is not None or self._closed:
+                return None
+            watcher = self._scanner.watcher(self._path)
+            if watcher is None:
+                return None
+            self._watcher = watcher
+            self._follower = threading.current_thread()
+
+        # The first walk of the watcher refreshes the library
+        self.refreshing = True
+        try:
+            started = watcher.start()
+        except Exception:
+            self._stop_watcher()
+            raise
+        if not started:
+            self._stop_watcher()
+            return None
+
+        files = watcher.files()
+        wanted = set(files)
+        if len(wanted) != self.scanned or any(
+            path not in wanted for batch in scanned for path in batch
+        ):
+            self._matcher.sync_files(files)
+            self._write_cache(files)
+        return watcher
+
+    def _stop_watcher(self):
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.close()
+
+    def _write_cache(self, files):
+        """
+        Write the cache of the scanner.  Failing to write it is not an error,
+        the next scan simply reads an older cache or none.
+        """
+        try:
+            self._scanner.write_cache(files, self._path)
+        except OSError:
+            pass
+
+    def _follow(self, watcher):
+        """
+        Apply the changes reported by a watcher until it is stopped.
+        """
+        changed = False
+        try:
+            while True:
+                changes = watcher.changes(CACHE_DELAY if changed else None)
+                if changes is None:
+                    break
+
+                added, removed = changes
+                if removed:
+                    self._matcher.remove_files(removed)
+                if added:
+                    self._matcher.add_files(added)
+                if added or removed:
+                    changed = True
+                elif changed:
+                    # Nothing changed for CACHE_DELAY seconds
+                    self._write_cache(watcher.files())
+                    changed = False
+
+            if changed:
+                self._write_cache(watcher.files())
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            self._stop_watcher()
+
+    def check(self):
+        """
+        Re-raise the exception which stopped the last scan, if any.  The
+        exception is only raised once.
+        """
+        if self._error is not None:
+            exc, self._error = self._error, None
+            raise exc[0].with_traceback(exc[1], exc[2])
+
+    def transform(self, path):
+        """
+        @param path - path from the results
+        @return     - the path transformed by the scanner, see
+                      Scanner.transform()
+        """
+        return self._scanner.transform(path)
+
+    def close(self):
+        """
+        Stop watching and stop the matcher.  A scan which is still running is
+        abandoned.
+        """
+        with self._lock:
+            self._closed = True
+            watcher = self._watcher
+        if watcher is not None:
+            watcher.stop()
+            # Let the changes seen so far be written to the cache
+            self._follower.join()
+        self._matcher.close()
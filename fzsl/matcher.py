@@ -0,0 +1,264 @@
+import sys
+import threading
+
+from . import core
+
+
+class Results(object):
+    def __init__(self, generation, search, matches, n_matches, n_files, offset=0):
+        """
+        Snapshot of the best matches for a query.  Snapshots are never
+        modified so they can be read from any thread while the next query
+        is being scored.
+
+        @param generation   - generation of the request the results are for
+        @param search       - query that was matched
+        @param matches      - list of (path, start, end, score) of the best
+                              matches, best first
+        @param n_matches    - number of paths which matched the query
+        @param n_files      - number of paths in the library
+        @param offset       - rank of the first of the matches, the better
+                              matches being left out
+        """
+        self.generation = generation
+        self.search = search
+        self.matches = matches
+        self.n_matches = n_matches
+        self.n_files = n_files
+        self.offset = offset
+
+
+class BackgroundMatcher(object):
+    def __init__(self, fm=None, depth=10):
+        """
+        Score queries against a FuzzyMatch in a background thread.  Every
+        request bumps a generation counter and a round that is still being
+        scored when a newer request arrives is abandoned, so callers never
+        wait behind results they no longer need.  Only the latest request
+        is ever scored, intermediate ones are skipped.  Adding or removing
+        files or resizing does not abandon the round being scored, the
+        change is picked up by the next round instead.  This lets a scan
+        stream files in without starving the current query.
+
+        Once created, the FuzzyMatch belongs to the background thread and
+        must only be changed through this object.
+
+        @param fm       - fzsl.FuzzyMatch to score, a new empty one is used
+                          by default
+        @param depth    - number of best matches kept in the results
+        """
+        self._fm = fm if fm is not None else core.FuzzyMatch()
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._query_generation = 0
+        self._done = 0
+        self._search = ""
+        self._depth = depth
+        self._offset = 0
+        self._changes = []
+        self._synced = None
+        self._reset = None
+        self._error = None
+        self._closed = False
+        self._results = Results(0, "", [], 0, 0)
+
+        self._thread = threading.Thread(target=self._run, name="fzsl-matcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def results(self):
+        """
+        Results of the latest request which finished scoring.  Any exception
+        raised while scoring is re-raised here.
+        """
+        with self._cond:
+            if self._error is not None:
+                exc = self._error
+                self._error = None
+                raise exc[0].with_traceback(exc[1], exc[2])
+            return self._results
+
+    @property
+    def pending(self):
+        """
+        True if a request is newer than the current results
+        """
+        return self._done != self._generation
+
+    def _request(self, cancel=False):
+        """
+        Start a new generation and wake the background thread.  Must be
+        called with the condition held.
+
+        @param cancel   - abandon the round being scored
+        @return         - the new generation
+        """
+        self._generation += 1
+        if cancel:
+            self._query_generation = self._generation
+        self._cond.notify_all()
+        return self._generation
+
+    def search(self, search):
+        """
+        Score a new query.
+
+        @param search   - query to match
+        @return         - generation of the request
+        """
+        with self._cond:
+            self._search = search
+            return self._request(cancel=True)
+
+    def resize(self, depth):
+        """
+        Change the number of matches kept in the results.
+
+        @param depth    - number of best matches to keep
+        @return         - generation of the request
+        """
+        with self._cond:
+            self._depth = depth
+            return self._request()
+
+    def scroll(self, offset):
+        """
+        Change the rank of the first match kept in the results so that
+        matches beyond the best can be paged through.  Only as many matches
+        as needed to reach the page are ever ranked.
+
+        @param offset   - number of the best matches to leave out
+        @return         - generation of the request
+        """
+        with self._cond:
+            self._offset = offset
+            return self._request()
+
+    def add_files(self, files):
+        """
+        Add paths to the library.  They are scored against the current query
+        before the next results are published.
+
+        @param files    - list of paths to add
+        @return         - generation of the request
+        """
+        with self._cond:
+            self._changes.append((True, files))
+            return self._request()
+
+    def remove_files(self, files):
+        """
+        Remove paths from the library.  The scores of the other paths are
+        kept, see FuzzyMatch.remove_files().
+
+        @param files    - list of paths to remove
+        @return         - generation of the request
+        """
+        with self._cond:
+            self._changes.append((False, files))
+            return self._request()
+
+    def sync_files(self, files):
+        """
+        Replace the library with a new list of paths without abandoning the
+        current query.  Only the difference to the current library is
+        applied, see FuzzyMatch.sync_files().  Paths from earlier calls to
+        add_files() or remove_files() which have not been applied yet are
+        superseded.
+
+        @param files    - complete list of paths the library should hold
+        @return         - generation of the request
+        """
+        with self._cond:
+            self._synced = files
+            self._changes = []
+            return self._request()
+
+    def reset_files(self, files):
+        """
+        Replace the library.
+
+        @param files    - list of paths to use as the library
+        @return         - generation of the request
+        """
+        with self._cond:
+            self._reset = list(files)
+            self._synced = None
+            self._changes = []
+            return self._request(cancel=True)
+
+    def wait(self, timeout=None):
+        """
+        Wait for every request to be scored.
+
+        @param timeout  - maximum number of seconds to wait
+        @return         - True if the results are current
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self.pending or self._error is not None, timeout
+            )
+
+    def close(self):
+        """
+        Stop the background thread.  The round being scored, if any, is
+        abandoned.
+        """
+        with self._cond:
+            self._closed = True
+            self._request(cancel=True)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.pending or self._closed)
+                if self._closed:
+                    return
+
+                generation = self._generation
+                query_generation = self._query_generation
+                search = self._search
+                depth = self._depth
+                offset = self._offset
+                reset, self._reset = self._reset, None
+                synced, self._synced = self._synced, None
+                changes, self._changes = self._changes, []
+
+            def cancelled():
+                return self._query_generation != query_generation
+
+            try:
+                if reset is not None:
+                    self._fm.reset_files(reset)
+                if synced is not None:
+                    self._fm.sync_files(synced)
+                for added, files in changes:
+                    if added:
+                        self._fm.add_files(files)
+                    else:
+                        self._fm.remove_files(files)
+                if not self._fm.update_scores(search, cancelled):
+                    continue
+
+                fm = self._fm
+                matches = [
+                    (path, fm.start(path), fm.end(path), fm.score(path))
+                    for path in fm.top_matches(depth, offset)
+                ]
+                results = Results(
+                    generation, search, matches, fm.n_matches, fm.n_files, offset
+                )
+            except Exception:
+                with self._cond:
+                    self._error = sys.exc_info()
+                    self._done = generation
+                    self._cond.notify_all()
+                continue
+
+            with self._cond:
+                self._results = results
+                if self._generation == generation:
+                    self._done = generation
+                self._cond.notify_all()
@@ -1,7 +1,33 @@
 import abc
+import array
 import functools
+import hashlib
 import os
 import subprocess
+import tempfile
+import threading
+
+from . import cache as caches
+from . import core
+from . import git
+from . import walk
+from . import watch
+
+# Number of bytes read from a scan command or cache at a time.
+READ_SIZE = 1 << 16
+
+# Number of paths yielded at a time by scanners which already hold every
+# path in memory.
+BATCH_SIZE = 1 << 12
+
+# Values of the refresh option of SimpleScanner
+REFRESH_MANUAL = "manual"
+REFRESH_AUTO = "auto"
+REFRESH_ALWAYS = "always"
+
+# Paths, relative to the directory a SimpleScanner runs in, whose
+# modification times are checked to decide whether a cache is stale
+DEFAULT_WATCH = (".", ".git/index")
 
 
 class SubprocessError(Exception):
@@ -23,6 +49,88 @@ class ConfigError(Exception):
     pass
 
 
+def read_paths(fp, size=None):
+    """
+    Read whitespace separated paths from a binary file a fixed number
+    of bytes at a time.  Only a single buffer and the paths decoded
+    from it are held in memory at once.
+
+    @param fp   - binary file object to read from
+    @param size - number of bytes to read at a time, READ_SIZE by default
+    @return     - generator of lists of decoded paths
+    """
+    size = READ_SIZE if size is None else size
+    read = getattr(fp, "read1", fp.read)
+
+    partial = b""
+    while True:
+        data = read(size)
+        if not data:
+            break
+
+        # A path may be split across reads, hold on to the last one
+        # until the whitespace following it arrives.
+        data = partial + data
+        parts = data.split()
+        partial = b""
+        if parts and not data[-1:].isspace():
+            partial = parts.pop()
+
+        if parts:
+            yield [f.decode("UTF-8") for f in parts]
+
+    if partial:
+        yield [partial.decode("UTF-8")]
+
+
+def read_records(fp, delimiter=b"\n", size=None, strip=False):
+    """
+    Read delimited records, such as lines, from a binary file a fixed number
+    of bytes at a time.  Records are decoded as UTF-8 with undecodable bytes
+    kept as surrogates, see os.fsdecode(), and empty records are skipped.
+
+    @param fp           - binary file object to read from
+    @param delimiter    - bytes separating the records
+    @param size         - number of bytes to read at a time, READ_SIZE by
+                          default
+    @param strip        - strip whitespace around every record
+    @return             - generator of lists of decoded records
+    """
+    size = READ_SIZE if size is None else size
+    read = getattr(fp, "read1", fp.read)
+
+    partial = b""
+    while True:
+        data = read(size)
+        if not data:
+            break
+
+        # The last record is incomplete until its delimiter arrives
+        parts = (partial + data).split(delimiter)
+        partial = parts.pop()
+        if strip:
+            parts = [part.strip() for part in parts]
+
+        records = [part.decode("UTF-8", "surrogateescape") for part in parts if part]
+        if records:
+            yield records
+
+    if strip:
+        partial = partial.strip()
+    if partial:
+        yield [partial.decode("UTF-8", "surrogateescape")]
+
+
+def _read_text_cache(path):
+    with open(path, "rb") as fp:
+        yield from read_paths(fp)
+
+
+def _read_binary_cache(cache):
+    with cache:
+        yield from cache.batches(BATCH_SIZE)
+
+
 @functools.total_ordering
 class Scanner(object, metaclass=abc.ABCMeta):
     def __init__(self, name, priority=0):
@@ -35,7 +143,16 @@ class Scanner(object, metaclass=abc.ABCMeta):
                               scanner picking
         """
         self._name = name
-        self._priority = priority
+        # Priorities read from a config file are strings
+        self._priority = int(priority)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def priority(self):
+        return self._priority
 
     def __eq__(self, other):
         return self._name == other._name and self._priority == other._priority
@@ -54,22 +171,97 @@ class Scanner(object, metaclass=abc.ABCMeta):
         """
         pass
 
-    @abc.abstractmethod
     def scan(self, path=None, rescan=False):
         """
         Scan for files at the given path.  This assumes that the
         scanner is suitable for scanning (self.is_suitable()).
         If the Scanner is using a cache, then the cache should be
         invalidated and the file list regenerated when rescan is
-        True.
+        True.  Scanners must implement at least one of scan() and
+        iter_scan(), by default each is built on the other.
 
         @param path     - path at which to start scanning, if undefined
                           then the current working directory is used
         @param rescan   - force a full rescan of files instead of using
                           a cached list
         @return         - list of detected files
+        @raise          - TypeError if the class overrides neither
         """
-        pass
+        if not self.implements_scan():
+            raise TypeError(
+                "%s does not implement scan() or iter_scan()" % (type(self).__name__,)
+            )
+
+        ret = []
+        for batch in self.iter_scan(path, rescan):
+            ret.extend(batch)
+        return ret
+
+    def iter_scan(self, path=None, rescan=False):
+        """
+        Scan for files at the given path, yielding them in batches as
+        they are found.  The default implementation yields the result of
+        scan() as a single batch.
+
+        @param path     - path at which to start scanning, if undefined
+                          then the current working directory is used
+        @param rescan   - force a full rescan of files instead of using
+                          a cached list
+        @return         - generator of lists of detected files
+        @raise          - TypeError if the class overrides neither
+        """
+        yield self.scan(path, rescan)
+
+    def root(self, path=None):
+        """
+        @param path - path at which scanning starts, if undefined then the
+                      current working directory is used
+        @return     - directory whose files a scan at the path lists.  Scans
+                      of paths with the same root list the same files.
+        """
+        return os.path.realpath(path if path is not None else os.curdir)
+
+    def needs_refresh(self, path=None):
+        """
+        Check if files served from a cache by scan() or iter_scan() should be
+        refreshed by a scan with rescan=True.  The caller may keep using the
+        cached files while the refresh runs.  By default scanners are never
+        refreshed automatically.
+
+        @param path - path at which scanning starts, if undefined then the
+                      current working directory is used
+        @return     - True if the cached files should be refreshed
+        """
+        return False
+
+    def watcher(self, path=None):
+        """
+        @param path - path at which scanning starts, if undefined then the
+                      current working directory is used
+        @return     - fzsl.Watcher, not yet started, reporting the files a
+                      scan lists as they change or None if the scanner
+                      cannot tell which changes matter
+        """
+        return None
+
+    def write_cache(self, files, path=None):
+        """
+        Replace the cache, if the scanner has one, with files known to be
+        current by other means, such as a watcher.
+
+        @param files    - complete list of the files a scan lists
+        @param path     - path at which scanning starts, if undefined then
+                          the current working directory is used
+        @return         - True if the cache was written
+        """
+        return False
+
+    @classmethod
+    def implements_scan(cls):
+        """
+        @return - True if the class overrides scan() or iter_scan()
+        """
+        return cls.scan is not Scanner.scan or cls.iter_scan is not Scanner.iter_scan
 
     def transform(self, path):
         """
@@ -85,7 +277,15 @@ class Scanner(object, metaclass=abc.ABCMeta):
 
 class SimpleScanner(Scanner):
     def __init__(
-        self, name, cmd, priority=0, detect_cmd=None, root_path=None, cache=None
+        self,
+        name,
+        cmd,
+        priority=0,
+        detect_cmd=None,
+        root_path=None,
+        cache=None,
+        refresh=REFRESH_MANUAL,
+        watch=DEFAULT_WATCH,
     ):
         """
         Create a scanner.
@@ -106,46 +306,49 @@ class SimpleScanner(Scanner):
                               is a child of the root_path will allow the use
                               of this scanner.  Secondly, when scanning, the
                               current working directory will be set to this
-                              path
+                              path.  A root_path starting with '!' is a
+                              command printing the path.  It is run in the
+                              first path the scanner is checked or used at,
+                              once the root_path is needed, and the result
+                              is kept
         @param cache        - If specified, path where this scanner will store
                               a cache of files it scans.  By default, calls
                               to scan will just return the files in the cache.
                               This can be changed by passing rescan=True to
                               scan().
+        @param refresh      - When the cache should be refreshed in the
+                              background after being served, see
+                              needs_refresh().  One of REFRESH_MANUAL to
+                              only refresh on request, REFRESH_AUTO to refresh
+                              when the cache looks stale or REFRESH_ALWAYS.
+        @param watch        - paths, relative to the directory the scanner
+                              runs in, whose modification times are recorded
+                              in the cache.  If any of them changes, the cache
+                              is considered stale.
         """
         super(SimpleScanner, self).__init__(name, priority)
         self._cmd = cmd
         self._detect_cmd = detect_cmd
-        self._root_path = None
+        self._root_path_cmd = None
+        self._resolved_root_path = None
+        self._scanned = None
         self._cache = None
 
+        if refresh not in (REFRESH_MANUAL, REFRESH_AUTO, REFRESH_ALWAYS):
+            raise ConfigError('Unknown refresh "%s" for "%s"' % (refresh, name))
+        self._refresh = refresh
+        self._watch = tuple(watch)
+
         if root_path is not None:
             if root_path.startswith("!"):
-                try:
-                    c = subprocess.Popen(
-                        root_path[1:],
-                        shell=True,
-                        stdin=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                    )
-                    stdout, stderr = c.communicate()
-                except OSError:
-                    raise SubprocessError(
-                        root_path[1:], os.path.realpath(os.curdir), stderr
-                    )
-
-                if c.returncode != 0:
-                    raise SubprocessError(
-                        root_path[1:], os.path.realpath(os.curdir), stderr
-                    )
-
-                self._root_path = stdout.strip().decode("UTF-8")
+                # Scanners are built for every rule but few are used, so
+                # the command waits until the path is needed.
+                self._root_path_cmd = root_path[1:]
             else:
                 root_path = os.path.expandvars(root_path)
                 root_path = os.path.expanduser(root_path)
                 root_path = os.path.normpath(root_path)
-                self._root_path = os.path.realpath(root_path)
+                self._resolved_root_path = os.path.realpath(root_path)
 
         if cache is not None:
             cache = os.path.expandvars(cache)
@@ -164,6 +367,18 @@ class SimpleScanner(Scanner):
 
         @param config_section   - config parser object defining a scanner.
         """
+        cmd = parser.get(section, "cmd").replace("\n", " ")
+
+        return cls(section, cmd, **cls._options_from_configparser(section, parser))
+
+    @staticmethod
+    def _options_from_configparser(section, parser):
+        """
+        @param section  - section of the config defining a scanner
+        @param parser   - parser containing the definition
+        @return         - dictionary of the keyword arguments shared by every
+                          scanner built on SimpleScanner
+        """
         kwds = {}
         if parser.has_option(section, "detect_cmd"):
             dcmd = parser.get(section, "detect_cmd").replace("\n", " ")
@@ -178,9 +393,44 @@ class SimpleScanner(Scanner):
         if parser.has_option(section, "cache"):
             kwds["cache"] = parser.get(section, "cache")
 
-        cmd = parser.get(section, "cmd").replace("\n", " ")
+        if parser.has_option(section, "refresh"):
+            kwds["refresh"] = parser.get(section, "refresh")
+
+        if parser.has_option(section, "watch"):
+            kwds["watch"] = parser.get(section, "watch").split()
+
+        return kwds
+
+    def _root_path(self, path=None):
+        """
+        @param path - path to run the root_path command in if it has not run
+                      yet, the current working directory by default
+        @return     - the root_path, running the command it names the first
+                      time if it is one, or None if there is no root_path
+        @raise      - SubprocessError if the command fails
+        """
+        if self._root_path_cmd is not None:
+            cmd = self._root_path_cmd
+            cwd = os.path.realpath(path if path is not None else os.curdir)
+            try:
+                c = subprocess.Popen(
+                    cmd,
+                    cwd=cwd,
+                    shell=True,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+                stdout, stderr = c.communicate()
+            except OSError as e:
+                raise SubprocessError(cmd, cwd, e)
+
+            if c.returncode != 0:
+                raise SubprocessError(cmd, cwd, stderr)
 
-        return cls(section, cmd, **kwds)
+            self._resolved_root_path = stdout.strip().decode("UTF-8")
+            self._root_path_cmd = None
+        return self._resolved_root_path
 
     def is_suitable(self, path):
         """
@@ -193,9 +443,16 @@ class SimpleScanner(Scanner):
         @return     - True if this scanner is suitable to scan in
                       the specified path
         """
-        if self._root_path is not None:
+        try:
+            root_path = self._root_path(path)
+        except SubprocessError:
+            # Usually a command like git rev-parse run outside of the tree
+            # it looks for, leave it to the detect_cmd
+            root_path = None
+
+        if root_path is not None:
             path = os.path.realpath(os.path.normpath(path))
-            if path.startswith(self._root_path):
+            if path.startswith(root_path):
                 return True
 
         if self._detect_cmd is not None:
@@ -216,12 +473,13 @@ class SimpleScanner(Scanner):
             if c.returncode == 0:
                 return True
 
-        if self._root_path is None and self._detect_cmd is None:
-            return True
+        if root_path is None and self._root_path_cmd is None:
+            if self._detect_cmd is None:
+                return True
 
         return False
 
-    def scan(self, path=None, rescan=False):
+    def iter_scan(self, path=None, rescan=False):
         """
         Scan for files at the given path.  This assumes that the
         scanner is suitable for scanning (self.is_suitable()).
@@ -231,58 +489,516 @@ class SimpleScanner(Scanner):
         constructor, the file list will be generated by simply
         reading the cache.  This can be bypassed by setting rescan.
 
+        Files are yielded in batches as the command writes them rather
+        than once it exits.  The output is read with a fixed size buffer
+        and a new cache is written as it goes, replacing the old one
+        only once the command has succeeded.
 
         @param path     - path at which to start scanning, if undefined
                           then the current working directory is used
         @param rescan   - force a full rescan of files instead of using
                           a cached list
-        @return         - list of detected files
+        @return         - generator of lists of detected files
         """
-        have_cache = self._cache is not None and os.path.exists(self._cache)
-        ret = None
-
-        if have_cache and not rescan:
-            with open(self._cache, "r") as fp:
-                ret = [f.strip() for f in fp.read().split()]
-        else:
-            if path is None:
-                path = os.getcwd()
-
-            cwd = path if self._root_path is None else self._root_path
+        self._scanned = path
+        if self._cache is not None and not rescan:
+            cached = self._read_cache()
+            if cached is not None:
+                yield from cached
+                return
+
+        cwd = self._cwd(path)
+        if self._cache is None:
+            yield from self._run(cwd)
+            return
+
+        # The stamp is taken before scanning so that changes made while the
+        # command runs leave the new cache stale.
+        with caches.CacheWriter(self._cache, meta=self._stamp(cwd)) as writer:
+            for batch in self._run(cwd):
+                batch = caches.Paths(batch, array.array("Q"))
+                batch.masks.extend(map(core.char_mask, batch))
+                writer.add(batch)
+                yield batch
+            writer.commit()
+
+    def _run(self, cwd):
+        """
+        Run the command.
 
+        @param cwd  - directory to run the command in
+        @return     - generator of lists of files written by the command
+        """
+        # stderr goes to a file so that a chatty command cannot block on a
+        # full pipe while we are reading stdout.
+        with tempfile.TemporaryFile() as errors:
             try:
-                stdout = stderr = ""
                 c = subprocess.Popen(
                     self._cmd,
                     cwd=cwd,
                     shell=True,
-                    stdin=subprocess.PIPE,
+                    stdin=subprocess.DEVNULL,
                     stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
+                    stderr=errors,
                 )
-                stdout, stderr = c.communicate()
-            except OSError:
-                raise SubprocessError(self._cmd, cwd, stderr)
+            except OSError as e:
+                raise SubprocessError(self._cmd, cwd, e)
+
+            try:
+                yield from read_paths(c.stdout)
+                c.wait()
+            finally:
+                c.stdout.close()
+                if c.poll() is None:
+                    c.kill()
+                    c.wait()
 
             if c.returncode != 0:
-                raise SubprocessError(self._cmd, cwd, stderr)
+                errors.seek(0)
+                raise SubprocessError(self._cmd, cwd, errors.read())
 
-            ret = [f.strip().decode("UTF-8") for f in stdout.split()]
+    def needs_refresh(self, path=None):
+        """
+        Check if the cache should be refreshed.  With refresh set to
+        REFRESH_AUTO, only cheap signals are checked: the command and
+        directory the cache was made with and the modification times of the
+        watched paths.  A change to a deeply nested directory that does not
+        touch any watched path is not noticed.
+
+        @param path - path at which scanning starts, if undefined then the
+                      current working directory is used
+        @return     - True if the cached files should be refreshed
+        """
+        if self._cache is None or self._refresh == REFRESH_MANUAL:
+            return False
+        elif self._refresh == REFRESH_ALWAYS:
+            return True
 
-            if self._cache is not None:
-                with open(self._cache, "w") as fp:
-                    fp.write(u"\n".join(ret))
+        try:
+            with caches.PathCache(self._cache) as cache:
+                meta = cache.meta
+        except (OSError, ValueError):
+            return True
+        return meta != self._stamp(self._cwd(path))
 
-        return ret
+    def write_cache(self, files, path=None):
+        if self._cache is None:
+            return False
+
+        cwd = self._cwd(path)
+        with caches.CacheWriter(self._cache, meta=self._stamp(cwd)) as writer:
+            writer.add(files)
+            writer.commit()
+        return True
+
+    def _cwd(self, path=None):
+        """
+        @param path - path at which scanning starts, if undefined then the
+                      current working directory is used
+        @return     - directory the command runs in
+        """
+        root_path = self._root_path(path)
+        if root_path is not None:
+            return root_path
+        return path if path is not None else os.getcwd()
+
+    def root(self, path=None):
+        return os.path.realpath(self._cwd(path))
+
+    def _stamp(self, cwd):
+        """
+        @param cwd  - directory the command runs in
+        @return     - dictionary describing the state of cwd, stored in the
+                      cache to check whether it is stale
+        """
+        mtimes = []
+        for watched in self._watch:
+            try:
+                mtimes.append(os.stat(os.path.join(cwd, watched)).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return {
+            "cmd": self._cmd,
+            "cwd": cwd,
+            "watch": list(self._watch),
+            "mtimes": mtimes,
+        }
+
+    def _read_cache(self):
+        """
+        Open the cache.  Caches written by older versions of fzsl as text
+        are still read but binary caches of any other version are ignored.
+
+        @return - generator of batches of cached files or None if there is
+                  no usable cache
+        """
+        if not os.path.exists(self._cache):
+            return None
+
+        if not caches.is_cache(self._cache):
+            return _read_text_cache(self._cache)
+
+        try:
+            cache = caches.PathCache(self._cache)
+        except ValueError:
+            return None
+        return _read_binary_cache(cache)
 
     def transform(self, path):
-        if self._root_path:
-            root_rel_path = os.path.join(self._root_path, path)
+        # A scan served from the cache has not run the root_path command
+        # yet, it must run where the scan started rather than here.
+        root_path = self._root_path(self._scanned)
+        if root_path:
+            root_rel_path = os.path.join(root_path, path)
             return os.path.normpath(root_rel_path)
         else:
             return path
 
 
+class WalkScanner(SimpleScanner):
+    def __init__(
+        self,
+        name,
+        priority=0,
+        detect_cmd=None,
+        root_path=None,
+        cache=None,
+        refresh=REFRESH_MANUAL,
+        watch=DEFAULT_WATCH,
+        threads=walk.THREADS,
+        max_depth=None,
+        follow_links=False,
+        hidden=True,
+        ignore=True,
+        types=walk.TYPES_ALL,
+    ):
+        """
+        Create a scanner which walks the directory tree itself rather than
+        running a command.  Directories are read by a pool of threads and
+        files are yielded as they are found, in no particular order.  Paths
+        are relative to the directory being scanned.
+
+        @param name         - name of the Scanner.
+        @param priority     - see SimpleScanner
+        @param detect_cmd   - see SimpleScanner
+        @param root_path    - see SimpleScanner, the walk starts here if set
+        @param cache        - see SimpleScanner
+        @param refresh      - see SimpleScanner
+        @param watch        - see SimpleScanner
+        @param threads      - number of threads reading directories
+        @param max_depth    - if not None, only report paths at most this many
+                              levels deep, like find -maxdepth
+        @param follow_links - descend into symlinks to directories, like
+                              find -L.  Symlink loops are detected and not
+                              followed.
+        @param hidden       - report files and directories starting with '.'
+        @param ignore       - skip paths ignored by .gitignore or .ignore
+                              files and .git directories
+        @param types        - report walk.TYPES_ALL, walk.TYPES_FILES or
+                              walk.TYPES_DIRS
+        """
+        if types not in (walk.TYPES_ALL, walk.TYPES_FILES, walk.TYPES_DIRS):
+            raise ConfigError('Unknown types "%s" for "%s"' % (types, name))
+
+        self._walk_options = {
+            "threads": threads,
+            "max_depth": max_depth,
+            "follow_links": follow_links,
+            "hidden": hidden,
+            "ignore_files": walk.IGNORE_FILES if ignore else (),
+            "types": types,
+        }
+        # The command only describes the walk, it is recorded in the cache
+        # so that changing any option makes the cache stale.
+        cmd = "walk max_depth=%s follow_links=%s hidden=%s ignore=%s types=%s" % (
+            max_depth,
+            follow_links,
+            hidden,
+            ignore,
+            types,
+        )
+
+        super(WalkScanner, self).__init__(
+            name,
+            cmd,
+            priority=priority,
+            detect_cmd=detect_cmd,
+            root_path=root_path,
+            cache=cache,
+            refresh=refresh,
+            watch=watch,
+        )
+
+    @classmethod
+    def from_configparser(cls, section, parser):
+        """
+        Create a scanner from a config parser section.
+
+        @param config_section   - config parser object defining a scanner.
+        """
+        kwds = cls._options_from_configparser(section, parser)
+
+        for option in ("threads", "max_depth"):
+            if parser.has_option(section, option):
+                kwds[option] = parser.getint(section, option)
+
+        for option in ("follow_links", "hidden", "ignore"):
+            if parser.has_option(section, option):
+                kwds[option] = parser.getboolean(section, option)
+
+        if parser.has_option(section, "types"):
+            kwds["types"] = parser.get(section, "types")
+
+        return cls(section, **kwds)
+
+    def _run(self, cwd):
+        """
+        Walk the tree.
+
+        @param cwd  - directory to walk
+        @return     - generator of lists of files found
+        """
+        return walk.walk(cwd, batch_size=BATCH_SIZE, **self._walk_options)
+
+    def watcher(self, path=None):
+        options = dict(self._walk_options)
+        del options["threads"]
+        return watch.Watcher(self._cwd(path), **options)
+
+
+class GitScanner(Scanner):
+    def __init__(
+        self,
+        name,
+        priority=0,
+        untracked=False,
+        submodules=True,
+        cache_dir=None,
+        threads=walk.THREADS,
+    ):
+        """
+        Create a scanner which lists the files in a git working tree by
+        reading the git index directly rather than running git.  The working
+        tree is found by looking for .git in the scanned path and its
+        parents.
+
+        @param name         - name of the Scanner.
+        @param priority     - see SimpleScanner
+        @param untracked    - also list untracked files which are not
+                              ignored, like git ls-files -o --exclude-standard
+        @param submodules   - list the files of initialized submodules rather
+                              than the submodules themselves
+        @param cache_dir    - If specified, directory where the files of each
+                              working tree are cached.  A cache is used until
+                              one of the indexes it was read from changes.
+                              Untracked files do not change the index so if
+                              they are listed, the cache is also refreshed
+                              in the background, see needs_refresh().
+        @param threads      - number of threads reading submodule indexes and
+                              walking for untracked files
+        """
+        super(GitScanner, self).__init__(name, priority)
+        self._untracked = untracked
+        self._submodules = submodules
+        self._threads = threads
+        self._worktree = None
+        self._cache_dir = None
+
+        if cache_dir is not None:
+            cache_dir = os.path.expanduser(os.path.expandvars(cache_dir))
+            self._cache_dir = os.path.realpath(cache_dir)
+            if not os.path.isdir(self._cache_dir):
+                os.makedirs(self._cache_dir)
+
+    @classmethod
+    def from_configparser(cls, section, parser):
+        """
+        Create a scanner from a config parser section.
+
+        @param config_section   - config parser object defining a scanner.
+        """
+        kwds = {}
+        for option in ("priority", "threads"):
+            if parser.has_option(section, option):
+                kwds[option] = parser.getint(section, option)
+
+        for option in ("untracked", "submodules"):
+            if parser.has_option(section, option):
+                kwds[option] = parser.getboolean(section, option)
+
+        if parser.has_option(section, "cache_dir"):
+            kwds["cache_dir"] = parser.get(section, "cache_dir")
+
+        return cls(section, **kwds)
+
+    def is_suitable(self, path):
+        """
+        @param path - path to check
+        @return     - True if the path is in a git working tree
+        """
+        return git.find_repository(path) is not None
+
+    def iter_scan(self, path=None, rescan=False):
+        """
+        List the files of the working tree holding the path.  Paths are
+        relative to the top of the working tree.
+
+        @param path     - path in the working tree, if undefined then the
+                          current working directory is used
+        @param rescan   - read the indexes even if they have not changed
+                          since the cache was written
+        @return         - generator of lists of files
+        @raise          - GitError if an index cannot be read
+        """
+        found = git.find_repository(path if path is not None else os.getcwd())
+        if found is None:
+            return
+        worktree, gitdir = found
+        self._worktree = worktree
+
+        cache = self._cache_path(worktree)
+        if cache is not None and not rescan:
+            cached = self._read_cache(cache, worktree)
+            if cached is not None:
+                yield from cached
+                return
+
+        try:
+            paths, indexes = git.ls_files(
+                worktree, gitdir, self._submodules, self._threads
+            )
+        except git.GitError:
+            # Split indexes and newer versions are left to git itself
+            paths, indexes = self._ls_files(worktree), None
+        if self._untracked:
+            paths.extend(self._list_untracked(worktree, gitdir, paths))
+
+        if cache is not None and indexes is not None:
+            meta = {
+                "worktree": worktree,
+                "options": self._options(),
+                "indexes": indexes,
+            }
+            with caches.CacheWriter(cache, meta=meta) as writer:
+                writer.add(paths)
+                writer.commit()
+
+        for i in range(0, len(paths), BATCH_SIZE):
+            yield paths[i : i + BATCH_SIZE]
+
+    def root(self, path=None):
+        found = git.find_repository(path if path is not None else os.curdir)
+        if found is None:
+            return super(GitScanner, self).root(path)
+        return found[0]
+
+    def needs_refresh(self, path=None):
+        """
+        @param path - path in the working tree, if undefined then the current
+                      working directory is used
+        @return     - True if untracked files are listed from a cache, the
+                      index does not tell when they change
+        """
+        return self._untracked and self._cache_dir is not None
+
+    def _options(self):
+        return [self._untracked, self._submodules]
+
+    def _cache_path(self, worktree):
+        """
+        @param worktree - top of a working tree
+        @return         - path of the cache of the working tree or None
+        """
+        if self._cache_dir is None:
+            return None
+        digest = hashlib.sha1(os.fsencode(worktree)).hexdigest()
+        return os.path.join(self._cache_dir, digest)
+
+    def _read_cache(self, cache, worktree):
+        """
+        @param cache    - path of the cache
+        @param worktree - top of the working tree
+        @return         - generator of batches of cached files or None if
+                          there is no cache or the indexes changed
+        """
+        try:
+            cached = caches.PathCache(cache)
+        except (OSError, ValueError):
+            return None
+
+        meta = cached.meta
+        if (
+            meta.get("worktree") != worktree
+            or meta.get("options") != self._options()
+            or not git.indexes_unchanged(meta.get("indexes", []))
+        ):
+            cached.close()
+            return None
+        return _read_binary_cache(cached)
+
+    def _ls_files(self, worktree):
+        """
+        @param worktree - top of the working tree
+        @return         - list of the files git ls-files reports
+        """
+        cmd = ["git", "ls-files", "-z"]
+        if self._submodules:
+            cmd.append("--recurse-submodules")
+
+        try:
+            c = subprocess.run(
+                cmd,
+                cwd=worktree,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except OSError as e:
+            raise SubprocessError(" ".join(cmd), worktree, e)
+
+        if c.returncode != 0:
+            raise SubprocessError(" ".join(cmd), worktree, c.stderr)
+
+        return [
+            path.decode("UTF-8", "surrogateescape")
+            for path in c.stdout.split(b"\0")
+            if path
+        ]
+
+    def _list_untracked(self, worktree, gitdir, tracked):
+        """
+        @param worktree - top of the working tree
+        @param gitdir   - git directory of the working tree
+        @param tracked  - list of the tracked files
+        @return         - list of the files which are neither tracked nor
+                          ignored by .gitignore files, info/exclude or the
+                          global excludes file.  Submodules and other
+                          repositories inside the working tree are not
+                          descended into.
+        """
+        tracked = set(tracked)
+        ignores = [
+            walk.IgnoreFile.read("", path)
+            for path in git.exclude_files(worktree, gitdir)
+        ]
+        ret = []
+        for batch in walk.walk(
+            worktree,
+            threads=self._threads,
+            ignore_files=(".gitignore",),
+            nested=False,
+            types=walk.TYPES_FILES,
+            ignores=[ignore for ignore in ignores if ignore is not None],
+        ):
+            ret.extend(path for path in batch if path not in tracked)
+        return ret
+
+    def transform(self, path):
+        if self._worktree is not None:
+            return os.path.normpath(os.path.join(self._worktree, path))
+        return path
+
+
 class StaticScanner(Scanner):
     """
     This class is used to provided a static list of paths. Another way of
@@ -326,6 +1042,73 @@ class StaticScanner(Scanner):
         """
         return self._paths
 
+    def iter_scan(self, path=None, rescan=False):
+        """
+        Yield the paths in batches.
+
+        @param path     - ignore by the StaticScanner
+        @param rescan   - ignore by the StaticScanner
+        @return         - generator of lists of the paths contained in the
+                          StaticScanner
+
+        """
+        for i in range(0, len(self._paths), BATCH_SIZE):
+            yield self._paths[i : i + BATCH_SIZE]
+
+
+class StreamScanner(Scanner):
+    """
+    This class is used to match paths read from a stream, such as a pipe,
+    while they are still being written.
+    """
+
+    def __init__(self, fp, delimiter=b"\n"):
+        """
+        Creates a StreamScanner
+
+        @param fp           - binary file object to read the paths from.  It
+                              is read once, by the first scan.
+        @param delimiter    - bytes separating the paths.  Whitespace around
+                              newline delimited paths is stripped.
+        """
+        super(StreamScanner, self).__init__("stream")
+        self._fp = fp
+        self._delimiter = delimiter
+        self._batches = []
+        self._lock = threading.Lock()
+
+    def is_suitable(self, path):
+        """
+        @param path - ignored by the StreamScanner
+        @return     - True, the stream is read wherever the scanner is used
+        """
+        return True
+
+    def iter_scan(self, path=None, rescan=False):
+        """
+        Read the paths as they arrive.  Later scans yield the paths which
+        were read, the stream is not read again.
+
+        @param path     - ignored by the StreamScanner
+        @param rescan   - ignored by the StreamScanner
+        @return         - generator of lists of paths
+        """
+        with self._lock:
+            if self._fp is None:
+                batches = self._batches
+            else:
+                fp, self._fp = self._fp, None
+                batches = None
+
+        if batches is not None:
+            yield from batches
+            return
+
+        strip = self._delimiter == b"\n"
+        for batch in read_records(fp, self._delimiter, strip=strip):
+            self._batches.append(batch)
+            yield batch
+
 
 def plugin_scanner_from_configparser(section, parser):
     """
@@ -377,6 +1160,11 @@ def plugin_scanner_from_configparser(section, parser):
     if not isinstance(scanner, Scanner):
         raise ConfigError("%s:%s is not an instance of fzsl.Scanner" % (path, obj))
 
+    if not scanner.implements_scan():
+        raise ConfigError(
+            "%s:%s does not implement scan() or iter_scan()" % (path, obj)
+        )
+
     return scanner
 
 
@@ -396,6 +1184,10 @@ def scanner_from_configparser(section, parser):
 
     if scanner_type == "simple":
         scanner = SimpleScanner.from_configparser(section, parser)
+    elif scanner_type == "git":
+        scanner = GitScanner.from_configparser(section, parser)
+    elif scanner_type == "walk":
+        scanner = WalkScanner.from_configparser(section, parser)
     elif scanner_type == "python":
         scanner = plugin_scanner_from_configparser(section, parser)
     else:
@@ -0,0 +1,304 @@
+import collections
+import configparser
+import os
+import socketserver
+import threading
+
+from . import client
+from . import detect
+from . import library as libraries
+from .scanner import ConfigError, scanner_from_configparser
+
+# Number of idle libraries kept loaded.  The least recently used are
+# dropped first.
+MAX_LIBRARIES = 8
+
+# Seconds between checks for scan progress while a library is scanning
+POLL = 0.02
+
+# Seconds between checks for changes to a library nobody is waiting on
+IDLE_POLL = 1.0
+
+
+class _Session(socketserver.StreamRequestHandler):
+    """
+    One client using one library.  Requests are handled in order by the
+    thread of the connection while a second thread pushes the state of the
+    library to the client whenever it changes.
+    """
+
+    def setup(self):
+        super(_Session, self).setup()
+        self._send_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._done = False
+        self._seq = 0
+        self._library = None
+        self._key = None
+        self._refresh = False
+        self._searched = False
+
+    def send(self, message):
+        with self._send_lock:
+            client.send(self.request, message)
+
+    def handle(self):
+        self._pusher = None
+        try:
+            for message in client.receive(self.rfile):
+                if message["op"] == "close":
+                    # The library is handed back before replying so that
+                    # the next client of the same library can use it.
+                    self._close()
+                    self.send({"reply": {}})
+                    return
+
+                try:
+                    reply = self.dispatch(message)
+                except Exception as e:
+                    self.send({"error": str(e)})
+                    if self._library is None:
+                        return
+                else:
+                    if reply is not None:
+                        self.send({"reply": reply})
+                self._seq = message["seq"]
+                self._wake.set()
+
+                if self._pusher is None:
+                    self._pusher = threading.Thread(target=self.push, name="fzsl-push")
+                    self._pusher.daemon = True
+                    self._pusher.start()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._close()
+
+    def _close(self):
+        """
+        Stop pushing the state and hand the library back to the server.
+        """
+        self._done = True
+        self._wake.set()
+        if self._pusher is not None:
+            self._pusher.join()
+            self._pusher = None
+        if self._library is not None:
+            library, self._library = self._library, None
+            self.server.checkin(self._key, library)
+
+    def dispatch(self, message):
+        """
+        @param message  - request from the client
+        @return         - reply to send or None
+        """
+        op = message["op"]
+        if op == "open":
+            if self._library is not None:
+                raise ValueError("A library is already open")
+            self._key, self._library, self._refresh = self.server.checkout(
+                message["config"], message["rule"], message["path"], message["depth"]
+            )
+            return {"rule": self._key[1]}
+        elif self._library is None:
+            raise ValueError("No library is open")
+        elif op == "search":
+            self._searched = True
+            self._library.search(message["search"])
+        elif op == "resize":
+            self._library.resize(message["depth"])
+        elif op == "scroll":
+            self._library.scroll(message["offset"])
+        elif op == "scan":
+            self._library.scan(message["rescan"])
+        elif op == "transform":
+            return {"path": self._library.transform(message["path"])}
+        else:
+            raise ValueError('Unknown request "%s"' % (op,))
+        return None
+
+    def push(self):
+        library = self._library
+        sent = None
+        while not self._done:
+            # The state is read from the requests to the results so that
+            # everything a request or the end of a scan changed is either
+            # in the results or shows as pending.
+            seq = self._seq
+            scanning = library.scanning
+            refreshing = library.refreshing
+            scanned = library.scanned
+            pending = library.pending
+            try:
+                library.check()
+                results = library.results
+            except Exception as e:
+                self.send({"error": str(e)})
+                self._key = None
+                continue
+
+            state = (seq, results, pending, scanning, refreshing, scanned)
+            if state != sent:
+                sent = state
+                try:
+                    self.send({"state": self._state(*state)})
+                except OSError:
+                    return
+
+            if self._refresh and self._searched and not pending:
+                # A library which was already loaded is refreshed once the
+                # first query has been answered rather than competing
+                # with it.
+                self._refresh = False
+                library.scan(rescan=True)
+                continue
+
+            if pending:
+                library.wait(POLL)
+            else:
+                self._wake.wait(POLL if scanning else IDLE_POLL)
+                self._wake.clear()
+
+    @staticmethod
+    def _state(seq, results, pending, scanning, refreshing, scanned):
+        return {
+            "seq": seq,
+            "results": {
+                "generation": results.generation,
+                "search": results.search,
+                "matches": results.matches,
+                "n_matches": results.n_matches,
+                "n_files": results.n_files,
+                "offset": results.offset,
+            },
+            "pending": pending,
+            "scanning": scanning,
+            "refreshing": refreshing,
+            "scanned": scanned,
+        }
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=None, max_libraries=MAX_LIBRARIES, watch=True):
+        """
+        Server keeping libraries loaded between runs of fzsl.  Each library
+        holds the files listed by one rule for one root directory, see
+        Scanner.root(), and stays loaded once its client is done.  The
+        next client opening it gets the files at once.  Libraries whose
+        scanner can watch for changes are kept up to date as the files
+        change, see Library, others are rescanned and synced in the
+        background when they are opened again.  A library is only used by
+        one client at a time, a second client gets a library of its own.
+
+        Commands of the rules run in the environment of the server rather
+        than that of the client.
+
+        @param path             - path of the socket to listen on,
+                                  client.socket_path() by default
+        @param max_libraries    - number of idle libraries kept loaded
+        @param watch            - watch the files of the libraries for
+                                  changes
+        @raise                  - ServerError if a server is already
+                                  listening on the socket
+        """
+        path = path if path is not None else client.socket_path()
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        client.check_socket_dir(path)
+
+        sock = client.connect(path)
+        if sock is not None:
+            sock.close()
+            raise client.ServerError("A server is already listening on %s" % (path,))
+        elif os.path.exists(path):
+            # Left behind by a server which did not exit cleanly
+            os.unlink(path)
+
+        self._max_libraries = max_libraries
+        self._watch = watch
+        self._lock = threading.Lock()
+        self._idle = collections.OrderedDict()
+        super(Server, self).__init__(path, _Session)
+
+    def checkout(self, config, rule, path, depth):
+        """
+        Get a library for a client.
+
+        @param config   - path to the configuration file
+        @param rule     - name of the rule to use or None to pick one
+        @param path     - path at which the client runs
+        @param depth    - number of best matches kept in the results
+        @return         - tuple of the key of the library, the library and
+                          True if the library was already loaded and should
+                          be refreshed as it is not watched
+        @raise          - ConfigError if the rule is not defined
+        """
+        parser = configparser.RawConfigParser(allow_no_value=True)
+        parser.read(config)
+        if rule is None:
+            rule, scanner = detect.scanner_for_path(parser, path)
+        elif parser.has_section(rule):
+            scanner = scanner_from_configparser(rule, parser)
+        else:
+            raise ConfigError('Rule "%s" is not defined' % (rule,))
+        key = (detect.config_key(parser), rule, scanner.root(path))
+
+        with self._lock:
+            idle = self._idle.get(key)
+            library = idle.pop() if idle else None
+            if not idle:
+                self._idle.pop(key, None)
+
+        if library is not None:
+            library.resize(depth)
+            return key, library, not library.watching
+
+        library = libraries.Library(scanner, path, depth, self._watch)
+        library.scan()
+        return key, library, False
+
+    def checkin(self, key, library):
+        """
+        Keep a library loaded for the next client.
+
+        @param key      - key of the library or None if it failed and
+                          must be dropped
+        @param library  - library the client is done with
+        """
+        dropped = []
+        if key is not None:
+            # Abandon the last query of the client
+            library.search("")
+            library.scroll(0)
+
+        with self._lock:
+            if key is None:
+                dropped.append(library)
+            else:
+                self._idle.setdefault(key, []).append(library)
+                self._idle.move_to_end(key)
+
+            n_idle = sum(len(idle) for idle in self._idle.values())
+            while n_idle > self._max_libraries:
+                key, idle = next(iter(self._idle.items()))
+                dropped.append(idle.pop(0))
+                if not idle:
+                    del self._idle[key]
+                n_idle -= 1
+
+        for library in dropped:
+            library.close()
+
+    def server_close(self):
+        super(Server, self).server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+        with self._lock:
+            idle, self._idle = self._idle, collections.OrderedDict()
+        for key in idle:
+            for library in idle[key]:
+                library.close()
@@ -4,11 +4,34 @@ import os
 import sys
 import termios
 
-import fzsl
+from fzsl import library as libraries
+from fzsl import matcher
 
 
 COL_BCYAN = 15
 
+# Milliseconds to wait for a keypress before checking whether a newer
+# round of results has finished scoring.
+POLL_MS = 20
+
+# Control characters and undecodable bytes, which paths read with --read0
+# may hold, are shown as '?' so that every character takes one cell
+_UNPRINTABLE = dict.fromkeys(
+    list(range(0x20)) + [0x7F] + list(range(0xDC80, 0xDD00)), "?"
+)
+
+
+class _Starting(object):
+    """
+    Stands in for the library of a pager until it is set up
+    """
+
+    results = matcher.Results(0, "", [], 0, 0)
+    pending = True
+    scanning = True
+    refreshing = False
+    scanned = 0
+
 
 @contextlib.contextmanager
 def ncurses():
@@ -71,7 +94,7 @@ def ncurses():
 
 
 class SimplePager(object):
-    def __init__(self, scr, scanner):
+    def __init__(self, scr, scanner=None, library=None, setup=None):
         """
         Create a simple pager for showing scan results.  As new terms
         are entered, the results will be updated with the best matches
@@ -80,15 +103,25 @@ class SimplePager(object):
         @param scr      - ncurses screen to use
         @param scanner  - fzsl.Scanner object that will be used to
                           generate the list of possible matches
+        @param library  - if specified, fzsl.Library or an object with the
+                          same interface, such as a library held by a
+                          server, to use instead of scanning with the
+                          scanner.  It is closed when the pager finishes.
+        @param setup    - if specified, callable returning a tuple of the
+                          (scanner, library) to use in place of the above.
+                          It is called by run() once the first frame is
+                          drawn so that picking a rule or reaching a
+                          server does not hold up the interface.
         """
         self._scr = scr
-        self._scanner = scanner
 
         self._show_score = False
-        self._fm = fzsl.FuzzyMatch()
-        self._selection = 0
         self._search = ""
 
+        # Rank of the selected match and of the match on the bottom line
+        self._selection = 0
+        self._offset = 0
+
         y, x = self._scr.getmaxyx()
 
         self._prompt = curses.newwin(1, x, y - 1, 0)
@@ -96,161 +129,304 @@ class SimplePager(object):
         self._max_y = y - 2
         self._max_x = x - 1
         self._cursor_x = 0
+        self._verase = None
+
+        # Lines drawn in the selection window, None when it must be cleared
+        self._lines = None
+
+        self._setup = setup
+        if setup is None:
+            self._open(scanner, library)
+        else:
+            self._library = _Starting()
+        self._results = self._library.results
+
+    def _open(self, scanner, library):
+        if library is None:
+            library = libraries.Library(scanner, depth=self._max_y)
+        else:
+            library.resize(self._max_y)
+        self._library = library
 
     def _draw_select(self):
         """
         Redraw the selection window which contains all of the
-        possible matches to the current search.
+        possible matches to the current search.  Only the lines which
+        differ from the last frame are rewritten.
         """
-        self._select.erase()
-        m = self._fm.top_matches(self._max_y)
-        if self._selection >= len(m):
-            self._selection = max(len(m) - 1, 0)
-
-        for index, match in enumerate(m):
-            if len(self._search) > 0 and self._fm.score(match) == 0:
+        previous, self._results = self._results, self._library.results
+        results = self._results
+        if (
+            results is not previous
+            and results.search == previous.search
+            and 0 <= self._selection - previous.offset < len(previous.matches)
+        ):
+            # Keep the same path selected when the library changes under
+            # the query, such as after a rescan
+            selected = previous.matches[self._selection - previous.offset][0]
+            for index, match in enumerate(results.matches):
+                if match[0] == selected:
+                    self._selection = results.offset + index
+                    break
+
+        m = results.matches[: self._max_y]
+        if results.offset == self._offset:
+            last = self._offset + max(len(m) - 1, 0)
+            self._selection = max(min(self._selection, last), self._offset)
+
+        # The results may still be for another page, their matches are
+        # drawn at their rank and the lines they do not cover are left
+        # empty until the page arrives.
+        lines = {}
+        searched = len(results.search) > 0
+        for index, (match, start, end, score) in enumerate(m):
+            rank = results.offset + index
+            line = self._max_y - 1 - (rank - self._offset)
+            if (searched and score == 0) or not 0 <= line < self._max_y:
                 continue
 
             prefix = u""
             if self._show_score:
-                prefix = u"%f     " % (self._fm.score(match),)
+                prefix = u"%f     " % (score,)
             offset = len(prefix)
 
-            start = self._fm.start(match)
-            end = self._fm.end(match)
-            if end > 0 and len(self._search) > 0:
+            if end > 0 and searched:
                 end += 1
-            line = self._max_y - index - 1
             decor = 0
-            if self._selection == index:
+            if self._selection == rank:
                 decor = curses.A_UNDERLINE
 
-            match = match[: self._max_x]
+            match = match[: self._max_x].translate(_UNPRINTABLE)
             start = min(start, self._max_x)
             end = min(end, self._max_x)
 
-            self._select.addstr(line, 0, prefix + match[:start], decor)
+            parts = [(0, prefix + match[:start], decor)]
             if start + offset < self._max_x:
-                self._select.addstr(
-                    line,
-                    start + offset,
-                    match[start:end],
-                    decor | curses.color_pair(COL_BCYAN),
+                parts.append(
+                    (
+                        start + offset,
+                        match[start:end],
+                        decor | curses.color_pair(COL_BCYAN),
+                    )
                 )
             if end + offset < self._max_x:
-                self._select.addstr(line, end + offset, match[end:], decor)
-        self._select.refresh()
+                parts.append((end + offset, match[end:], decor))
+            lines[line] = parts
+
+        if self._lines is None:
+            self._select.erase()
+            self._lines = {}
+        for line in set(lines) | set(self._lines):
+            parts = lines.get(line)
+            if parts == self._lines.get(line):
+                continue
+            self._select.move(line, 0)
+            self._select.clrtoeol()
+            for x, text, decor in parts or ():
+                self._select.addstr(line, x, text, decor)
+        self._lines = lines
+        self._select.noutrefresh()
 
     def _draw_prompt(self):
         """
         Redraw the prompt window.
         """
         self._prompt.erase()
-        prompt = "%d/%d >" % (self._fm.n_matches, self._fm.n_files)
+        # The prompt marker shows when the results are from an older
+        # query than the one being typed.
+        marker = "*" if self._library.pending else ">"
+        prompt = "%d/%d" % (self._results.n_matches, self._results.n_files)
+        if self._library.refreshing:
+            prompt += " [refreshing]"
+        elif self._library.scanning:
+            prompt += " [%d scanned]" % (self._library.scanned,)
+        prompt += " " + marker
         search_start = 4 + len(prompt)
 
         self._prompt.addstr(0, 2, prompt)
         self._prompt.addstr(0, search_start, self._search)
         y, x = self._prompt.getyx()
         self._prompt.move(y, search_start + self._cursor_x)
-        self._prompt.refresh()
+        self._prompt.noutrefresh()
+
+    def _update(self):
+        """
+        Write the changes to both windows to the terminal at once, leaving
+        the cursor in the prompt.
+        """
+        self._prompt.noutrefresh()
+        curses.doupdate()
 
     def run(self):
         """
         Start the pager.
         """
-        self._scr.addstr("Scanning ...")
-        self._scr.refresh()
-        files = self._scanner.scan()
-        self._fm.add_files(files)
-
+        # The first frame is drawn before the scan starts, or the library is
+        # even set up, so that the interface shows at once
         self._draw_select()
         self._draw_prompt()
+        self._update()
+
+        if self._setup is not None:
+            self._open(*self._setup())
+        self._library.scan()
+
+        try:
+            return self._run()
+        finally:
+            self._library.close()
 
+    def _run(self):
         # Don't trust the terminal to actually follow the terminfo, this is
         # good enough for tmux and we're just using it as a backup.
         tio = termios.tcgetattr(sys.stdin.fileno())
-        verase = int.from_bytes(tio[6][termios.VERASE], byteorder=sys.byteorder)
+        verase = tio[6][termios.VERASE]
+        self._verase = int.from_bytes(verase, byteorder=sys.byteorder)
 
+        drawn = None
+        library = self._library
         while True:
-            c = self._scr.getch()
-            key = curses.keyname(c).decode("UTF-8")
+            busy = library.pending or library.scanning
+            library.check()
 
-            if key in (u"^M",):
-                # enter
-                break
-            elif key in ("KEY_DOWN", "^J"):
-                # down arrow, ctrl+j
-                if self._selection > 0:
-                    self._selection -= 1
-                self._draw_select()
-            elif key in ("KEY_UP", "^K"):
-                # up arrow, ctrl+k
-                if self._selection < self._max_y - 2:
-                    self._selection += 1
+            # Redraw if a newer round has finished or the scan has made
+            # progress.  This is checked before waiting for a key so that
+            # work which finished while the last key was handled is shown.
+            if library.results is not self._results:
                 self._draw_select()
-            elif key in ("KEY_LEFT",):
-                if self._cursor_x > 0:
-                    self._cursor_x -= 1
-                    self._draw_prompt()
-            elif key in ("KEY_RIGHT",):
-                if self._cursor_x < len(self._search):
-                    self._cursor_x += 1
-                    self._draw_prompt()
-            elif key in ("^V",):
-                # ctrl+v
-                self._show_score = not self._show_score
-                self._draw_select()
-            elif key in ("^[", "^C"):
-                # escape or ctrl+c
-                return ""
-            elif c in (curses.KEY_RESIZE,):
-                y, x = self._scr.getmaxyx()
+                self._draw_prompt()
+            elif drawn != (library.scanned, busy, library.refreshing):
+                self._draw_prompt()
+            drawn = (library.scanned, busy, library.refreshing)
+            self._update()
 
-                # Have to handle the parent screen fully first otherwise
-                # updates to the subwindows don't seem to take.
-                curses.resizeterm(y, x)
-                self._scr.resize(y, x)
-                self._scr.erase()
-                self._scr.refresh()
+            self._scr.timeout(POLL_MS if busy else -1)
+            c = self._scr.getch()
+            if c == -1:
+                continue
 
-                self._max_y = y - 2
-                self._max_x = x - 1
-                self._cursor_x = x if x < self._cursor_x else self._cursor_x
+            # Every key already typed, such as a pasted query, is handled
+            # before the query is sent and the windows are drawn so that a
+            # burst of keys costs a single round of scoring.
+            search = self._search
+            offset = self._offset
+            self._scr.timeout(0)
+            while c != -1:
+                done = self._key(c)
+                if done is not None:
+                    break
+                c = self._scr.getch()
+
+            if done is False:
+                return ""
+            elif done:
+                break
 
-                self._select.resize(y - 2, x)
-                self._draw_select()
+            if self._search != search:
+                # A new query starts from its best matches
+                self._selection -= self._offset
+                self._offset = 0
+            if self._offset != offset:
+                library.scroll(self._offset)
+            if self._search != search:
+                library.search(self._search)
+            self._draw_select()
+            self._draw_prompt()
+
+        index = self._selection - self._results.offset
+        if 0 <= index < len(self._results.matches):
+            return library.transform(self._results.matches[index][0])
+        return ""
+
+    def _move(self, rows, page=False):
+        """
+        Move the selection, scrolling the page of matches to keep it shown.
 
-                self._prompt.resize(1, x)
-                self._prompt.mvwin(y - 1, 0)
-                self._draw_prompt()
-            else:
-                if key == "KEY_BACKSPACE" or c == verase:
-                    # delete, backspace
-                    if self._cursor_x > 0:
-                        start = self._search[: self._cursor_x - 1]
-                        end = self._search[self._cursor_x :]
-                        self._search = start + end
-                        self._cursor_x -= 1
-                elif key in ("^R", "KEY_F(5)"):
-                    self._scr.erase()
-                    self._scr.addstr("Scanning ...")
-                    self._scr.refresh()
-                    files = self._scan(rescan=True)
-                    self._fm.reset_files(files)
-                else:
-                    start = self._search[: self._cursor_x]
-                    end = self._search[self._cursor_x :]
-                    self._search = start + chr(c) + end
-                    self._cursor_x += 1
-
-                self._fm.update_scores(self._search)
+        @param rows - number of ranks to move the selection by, positive to
+                      move up to worse matches
+        @param page - scroll the page by as many ranks rather than just as
+                      far as the selection needs
+        """
+        n_matches = self._results.n_matches
+        selection = max(min(self._selection + rows, n_matches - 1), 0)
+        offset = self._offset + rows if page else self._offset
+        offset = max(min(offset, n_matches - self._max_y), 0)
+        offset = max(min(offset, selection), selection - self._max_y + 1)
 
-                self._draw_select()
-                self._draw_prompt()
+        self._selection = selection
+        self._offset = offset
 
-        try:
-            match = self._fm.top_matches(self._max_y)[self._selection]
-            return self._scanner.transform(match)
-        except IndexError:
-            return ""
+    def _key(self, c):
+        """
+        Handle a key.
+
+        @param c    - key read by getch()
+        @return     - True to finish with the selected path, False to finish
+                      without one and None to carry on
+        """
+        key = curses.keyname(c).decode("UTF-8")
+
+        if key in (u"^M",):
+            # enter
+            return True
+        elif key in ("KEY_DOWN", "^J"):
+            # down arrow, ctrl+j
+            self._move(-1)
+        elif key in ("KEY_UP", "^K"):
+            # up arrow, ctrl+k
+            self._move(1)
+        elif key in ("KEY_NPAGE",):
+            # page down
+            self._move(-self._max_y, page=True)
+        elif key in ("KEY_PPAGE",):
+            # page up
+            self._move(self._max_y, page=True)
+        elif key in ("KEY_LEFT",):
+            if self._cursor_x > 0:
+                self._cursor_x -= 1
+        elif key in ("KEY_RIGHT",):
+            if self._cursor_x < len(self._search):
+                self._cursor_x += 1
+        elif key in ("^V",):
+            # ctrl+v
+            self._show_score = not self._show_score
+        elif key in ("^R", "KEY_F(5)"):
+            # ctrl+r, F5
+            self._library.scan(rescan=True)
+        elif key in ("^[", "^C"):
+            # escape or ctrl+c
+            return False
+        elif c in (curses.KEY_RESIZE,):
+            y, x = self._scr.getmaxyx()
+
+            # Have to handle the parent screen fully first otherwise
+            # updates to the subwindows don't seem to take.
+            curses.resizeterm(y, x)
+            self._scr.resize(y, x)
+            self._scr.erase()
+            self._scr.refresh()
+
+            self._max_y = y - 2
+            self._max_x = x - 1
+            self._cursor_x = x if x < self._cursor_x else self._cursor_x
+
+            self._select.resize(y - 2, x)
+            self._library.resize(self._max_y)
+            self._move(0)
+            self._lines = None
+
+            self._prompt.resize(1, x)
+            self._prompt.mvwin(y - 1, 0)
+        elif key == "KEY_BACKSPACE" or c == self._verase:
+            # delete, backspace
+            if self._cursor_x > 0:
+                start = self._search[: self._cursor_x - 1]
+                end = self._search[self._cursor_x :]
+                self._search = start + end
+                self._cursor_x -= 1
+        else:
+            start = self._search[: self._cursor_x]
+            end = self._search[self._cursor_x :]
+            self._search = start + chr(c) + end
+            self._cursor_x += 1
+        return None
@@ -0,0 +1,418 @@
+import os
+import queue
+import re
+import threading
+
+# Files read from every directory for ignore patterns, using the syntax
+# of gitignore(5).  Patterns in later files take precedence.
+IGNORE_FILES = (".gitignore", ".ignore")
+
+# Default number of threads walking directories.  The threads mostly wait
+# on readdir() and stat() with the GIL released so this is not tied to the
+# number of CPUs.
+THREADS = 4
+
+# What walk() reports
+TYPES_ALL = "all"
+TYPES_FILES = "files"
+TYPES_DIRS = "dirs"
+
+
+def _translate(pattern):
+    """
+    @param pattern  - gitignore glob with any leading or trailing '/' removed
+    @return         - regular expression matching the same paths
+    """
+    ret = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            ret.append("(?:.*/)?")
+            i += 3
+            continue
+        elif pattern.startswith("**", i) and i + 2 == n and pattern[i - 1] == "/":
+            ret.append(".*")
+            i += 2
+            continue
+
+        i += 1
+        if c == "*":
+            ret.append("[^/]*")
+        elif c == "?":
+            ret.append("[^/]")
+        elif c == "\\" and i < n:
+            ret.append(re.escape(pattern[i]))
+            i += 1
+        elif c == "[":
+            # A ']' straight after the '[' or '[!' is a member
+            start = i + 1 if pattern.startswith("!", i) else i
+            if pattern.startswith("]", start):
+                start += 1
+            end = pattern.find("]", start)
+            if end == -1:
+                ret.append("\\[")
+                continue
+            members = pattern[i:end].replace("\\", "\\\\").replace("[", "\\[")
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            ret.append("[%s]" % (members,))
+            i = end + 1
+        else:
+            ret.append(re.escape(c))
+    return "".join(ret)
+
+
+class IgnoreFile(object):
+    def __init__(self, base, lines):
+        """
+        Compiled patterns of one ignore file.  Patterns are compiled once
+        when the file is read and then matched against every path below
+        the directory holding it.
+
+        @param base     - path of the directory holding the file relative to
+                          the root of the walk, with a trailing '/' unless
+                          it is the root
+        @param lines    - lines of the file
+        """
+        self.base = base
+        self._patterns = []
+        for line in lines:
+            line = line.rstrip("\n")
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            if not line or line.startswith("#"):
+                continue
+
+            negate = line.startswith("!")
+            if negate or line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # Patterns with a '/' anywhere but the end match the path
+            # relative to the file, others match the name at any depth.
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+
+            regex = re.compile(_translate(line), re.DOTALL)
+            self._patterns.append((regex.fullmatch, negate, dir_only, anchored))
+        self._patterns.reverse()
+
+    def __len__(self):
+        return len(self._patterns)
+
+    @classmethod
+    def read(cls, base, path):
+        """
+        @param base - see __init__()
+        @param path - path to the ignore file
+        @return     - IgnoreFile or None if it cannot be read or is empty
+        """
+        try:
+            with open(path, errors="surrogateescape") as fp:
+                ignore = cls(base, fp)
+        except OSError:
+            return None
+        return ignore if len(ignore) > 0 else None
+
+    def match(self, path, name, is_dir):
+        """
+        @param path     - path relative to the root of the walk
+        @param name     - last component of path
+        @param is_dir   - True if the path is a directory
+        @return         - True if the last matching pattern ignores the path,
+                          False if it re-includes it or None if no pattern
+                          matches
+        """
+        relative = None
+        for fullmatch, negate, dir_only, anchored in self._patterns:
+            if dir_only and not is_dir:
+                continue
+            if anchored:
+                if relative is None:
+                    relative = path[len(self.base) :]
+                if fullmatch(relative):
+                    return not negate
+            elif fullmatch(name):
+                return not negate
+        return None
+
+
+def is_ignored(rules, path, name, is_dir):
+    """
+    @param rules    - tuple of IgnoreFile from the root of the walk down to
+                      the directory holding the path
+    @param path     - path relative to the root of the walk
+    @param name     - last component of path
+    @param is_dir   - True if the path is a directory
+    @return         - True if the path is ignored
+    """
+    for ignore in reversed(rules):
+        ignored = ignore.match(path, name, is_dir)
+        if ignored is not None:
+            return ignored
+    return False
+
+
+class _Walk(object):
+    def __init__(
+        self,
+        n_threads,
+        max_depth,
+        follow_links,
+        hidden,
+        ignore_files,
+        nested,
+        types,
+        size,
+    ):
+        self.n_threads = n_threads
+        self.max_depth = max_depth
+        self.follow_links = follow_links
+        self.hidden = hidden
+        self.ignore_files = ignore_files
+        self.nested = nested
+        self.files = types in (TYPES_ALL, TYPES_FILES)
+        self.dirs = types in (TYPES_ALL, TYPES_DIRS)
+        self.size = size
+
+        self.todo = queue.Queue()
+        self.found = queue.Queue()
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.stopped = False
+
+    def work(self):
+        """
+        Thread walking directories.  Each thread walks depth first from a
+        private stack and only hands directories to the shared queue when
+        it has run dry, so that threads rarely contend.  Paths found are
+        reported in batches.
+        """
+        found = []
+        while True:
+            item = self.todo.get()
+            if item is None or self.stopped:
+                return
+
+            stack = [item]
+            while stack and not self.stopped:
+                item = stack.pop()
+                try:
+                    subdirs = self.scan(found, *item)
+                except OSError as e:
+                    # Unreadable directories are skipped, like find || true,
+                    # but failing to read the root is an error.
+                    if item[1] == 0:
+                        self.found.put(e)
+                    subdirs = []
+
+                stack.extend(subdirs)
+                if self.n_threads > 1 and len(stack) > 1 and self.todo.empty():
+                    shared = stack[: len(stack) // 2]
+                    del stack[: len(stack) // 2]
+                    for item in shared:
+                        self.todo.put(item)
+
+                # Everything found must be reported before the walk can be
+                # seen as finished
+                if not stack or len(found) >= self.size:
+                    self.found.put(found)
+                    found = []
+
+                with self.lock:
+                    self.outstanding += len(subdirs) - 1
+                    if self.outstanding == 0:
+                        self.found.put(None)
+
+    def scan(self, found, path, depth, prefix, dev, ancestors, rules):
+        """
+        Read one directory.
+
+        @param found        - list to append the paths to report to
+        @param path         - path of the directory
+        @param depth        - depth of the directory, the root is 0
+        @param prefix       - path of the directory relative to the root,
+                              with a trailing '/' unless it is the root
+        @param dev          - st_dev of the directory
+        @param ancestors    - set of the (st_dev, st_ino) of the directory
+                              and its parents if following symlinks
+        @param rules        - tuple of IgnoreFile applying to the directory
+        @return             - list of the subdirectories to walk
+        """
+        with os.scandir(path) as it:
+            entries = list(it)
+
+        if not self.nested and depth > 0:
+            if any(entry.name == ".git" for entry in entries):
+                return []
+
+        if self.ignore_files:
+            names = {entry.name for entry in entries}
+            rules += tuple(
+                ignore
+                for ignore in (
+                    IgnoreFile.read(prefix, os.path.join(path, name))
+                    for name in self.ignore_files
+                    if name in names
+                )
+                if ignore is not None
+            )
+
+        depth += 1
+        descend = self.max_depth is None or depth < self.max_depth
+        follow_links = self.follow_links
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            if not self.hidden and name.startswith("."):
+                continue
+            if self.ignore_files and name == ".git":
+                continue
+
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_links)
+            except OSError:
+                is_dir = False
+
+            relative = prefix + name
+            if rules and is_ignored(rules, relative, name, is_dir):
+                continue
+
+            if not is_dir:
+                if self.files:
+                    found.append(relative)
+                continue
+
+            if self.dirs:
+                found.append(relative)
+            if not descend:
+                continue
+
+            children = ancestors
+            child_dev = dev
+            if follow_links:
+                # Only symlinks need a stat(), the inode of a directory is
+                # known from reading its parent.  A loop through a mount
+                # point may be walked once before it is noticed.
+                if entry.is_symlink():
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    child_dev = st.st_dev
+                    key = (st.st_dev, st.st_ino)
+                else:
+                    key = (dev, entry.inode())
+
+                if key in ancestors:
+                    # Symlink loop
+                    continue
+                children = ancestors | {key}
+
+            subdirs.append(
+                (entry.path, depth, relative + "/", child_dev, children, rules)
+            )
+
+        return subdirs
+
+
+def walk(
+    root,
+    threads=THREADS,
+    max_depth=None,
+    follow_links=False,
+    hidden=True,
+    ignore_files=IGNORE_FILES,
+    nested=True,
+    types=TYPES_ALL,
+    batch_size=1 << 12,
+    ignores=(),
+):
+    """
+    Walk a directory tree with a pool of threads reading directories in
+    parallel.  Paths are reported relative to the root as soon as their
+    directory has been read, so the order is not deterministic.
+
+    @param root         - directory to walk
+    @param threads      - number of threads reading directories
+    @param max_depth    - if not None, only report paths at most this many
+                          levels below the root, the children of the root
+                          being at depth 1
+    @param follow_links - descend into symlinks to directories.  A symlink
+                          to a directory which is already being walked is
+                          reported but not descended into.
+    @param hidden       - report paths whose name starts with a '.'
+    @param ignore_files - names of ignore files read in every directory.
+                          Paths they ignore are neither reported nor
+                          descended into and .git directories are skipped.
+                          Pass an empty tuple to report everything.
+    @param nested       - walk directories below the root which hold a .git
+                          of their own, such as git submodules
+    @param types        - TYPES_ALL, TYPES_FILES or TYPES_DIRS to choose what
+                          is reported
+    @param batch_size   - paths found at the same time are reported together
+                          up to this many at once
+    @param ignores      - tuple of IgnoreFile with a base of '' applying to
+                          the whole walk.  The ignore files read in the tree
+                          take precedence over them.
+    @return             - generator of lists of paths
+    @raise              - OSError if the root cannot be read
+    """
+    threads = max(threads, 1)
+    state = _Walk(
+        threads,
+        max_depth,
+        follow_links,
+        hidden,
+        tuple(ignore_files),
+        nested,
+        types,
+        batch_size,
+    )
+
+    st = os.stat(root)
+    ancestors = frozenset()
+    if follow_links:
+        ancestors = frozenset([(st.st_dev, st.st_ino)])
+    state.outstanding = 1
+    state.todo.put((root, 0, "", st.st_dev, ancestors, tuple(ignores)))
+
+    workers = [
+        threading.Thread(target=state.work, name="fzsl-walk") for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    try:
+        batch = []
+        while True:
+            try:
+                # Only wait if there is nothing to report yet
+                found = state.found.get(block=not batch)
+            except queue.Empty:
+                yield batch
+                batch = []
+                continue
+
+            if found is None:
+                break
+            elif isinstance(found, Exception):
+                raise found
+
+            batch.extend(found)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+
+        if batch:
+            yield batch
+    finally:
+        state.stopped = True
+        for worker in workers:
+            state.todo.put(None)
@@ -0,0 +1,512 @@
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+from . import walk
+
+# Seconds between checks of the directories which are polled
+POLL_INTERVAL = 2.0
+
+# Seconds to wait for more events once a change is noticed so that a
+# burst of changes, such as a checkout, is reported at once
+LATENCY = 0.05
+
+# A directory modified less than this many seconds before it was read may
+# change again without its modification time changing, so it is read again
+# at the next poll.
+_MTIME_GRANULARITY = 1.0
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+
+_IN_MASK = (
+    _IN_MODIFY
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+    | _IN_ONLYDIR
+)
+
+_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def _inotify():
+    """
+    @return - libc with the inotify functions declared or None if inotify
+              is not available
+    """
+    global _libc
+    if _libc is None:
+        try:
+            # ctypes is only loaded once a library is watched
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [
+                ctypes.c_int,
+                ctypes.c_char_p,
+                ctypes.c_uint32,
+            ]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (ImportError, OSError, AttributeError):
+            libc = False
+        _libc = libc
+    return _libc or None
+
+
+def _errno():
+    """
+    @return - errno left by the last call to libc
+    """
+    import ctypes
+
+    return ctypes.get_errno()
+
+
+class _Directory(object):
+    __slots__ = ("item", "found", "subdirs", "mtime", "ignores")
+
+    def __init__(self, item):
+        # Arguments of _Walk.scan() reading the directory
+        self.item = item
+        # Paths reported from the directory
+        self.found = set()
+        # Prefixes of the subdirectories walked
+        self.subdirs = set()
+        # Modification time when the directory was read or None if it
+        # must be read again at the next poll
+        self.mtime = None
+        # Modification times of the ignore files in the directory
+        self.ignores = ()
+
+
+class Watcher(object):
+    def __init__(
+        self,
+        root,
+        max_depth=None,
+        follow_links=False,
+        hidden=True,
+        ignore_files=walk.IGNORE_FILES,
+        nested=True,
+        types=walk.TYPES_ALL,
+        inotify=True,
+    ):
+        """
+        Keep the list of paths below a directory up to date.  The tree is
+        walked once by start(), reporting the same paths as walk.walk()
+        given the same options, and changes() then reports the paths added
+        and removed since.  Only the directories which changed are read
+        again.
+
+        On Linux, changes are noticed through inotify.  Elsewhere, or for
+        directories inotify cannot watch because the limit on watches was
+        reached, the modification times of directories and their ignore
+        files are polled every POLL_INTERVAL seconds.
+
+        The watcher holds the reported paths of every directory, so it
+        takes about as much memory as the list of paths itself.
+
+        @param root         - directory to watch
+        @param inotify      - use inotify if it is available, else only poll
+        @param ...          - see walk.walk()
+        """
+        self._root = root
+        self._walk = walk._Walk(
+            1,
+            max_depth,
+            follow_links,
+            hidden,
+            tuple(ignore_files),
+            nested,
+            types,
+            0,
+        )
+        self._ignore_files = frozenset(ignore_files)
+        self._flags = _IN_MASK if follow_links else _IN_MASK | _IN_DONT_FOLLOW
+        self._dirs = {}
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+
+        # Watched directories by watch descriptor.  A directory reached
+        # through a symlink shares the descriptor of its target.
+        self._libc = None
+        self._fd = None
+        self._wds = {}
+        self._prefix_wd = {}
+        self._polled = set()
+        self._next_poll = 0
+
+        libc = _inotify() if inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self._libc = libc
+                self._fd = fd
+
+    @property
+    def inotify(self):
+        """
+        True if changes are noticed through inotify
+        """
+        return self._fd is not None
+
+    def start(self):
+        """
+        Walk the tree.  Directories are watched before they are read so that
+        no change is missed.
+
+        @return - False if the watcher was stopped before the walk finished
+        @raise  - OSError if the root cannot be read
+        """
+        st = os.stat(self._root)
+        ancestors = frozenset()
+        if self._walk.follow_links:
+            ancestors = frozenset([(st.st_dev, st.st_ino)])
+
+        self._add_tree((self._root, 0, "", st.st_dev, ancestors, ()), [], True)
+        self._next_poll = time.monotonic() + POLL_INTERVAL
+        return not self._stopped
+
+    def files(self):
+        """
+        @return - list of every path currently reported
+        """
+        ret = []
+        for directory in self._dirs.values():
+            ret.extend(directory.found)
+        return ret
+
+    def changes(self, timeout=None):
+        """
+        Wait for changes to the tree.
+
+        @param timeout  - maximum number of seconds to wait or None to wait
+                          until something changes
+        @return         - tuple of the (added, removed) lists of paths, both
+                          empty if nothing changed before the timeout, or
+                          None once the watcher is stopped
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stopped:
+            now = time.monotonic()
+            waits = [] if deadline is None else [deadline - now]
+            if self._polled:
+                waits.append(self._next_poll - now)
+            wait = max(min(waits), 0) if waits else None
+
+            dirty = {}
+            if self._wait(wait):
+                self._read_events(dirty)
+            if self._polled and time.monotonic() >= self._next_poll:
+                self._poll(dirty)
+                self._next_poll = time.monotonic() + POLL_INTERVAL
+
+            if dirty:
+                # Let a burst of changes settle
+                select.select([self._wake_r], [], [], LATENCY)
+                if self._fd is not None:
+                    self._read_events(dirty)
+                added, removed = self._update(dirty)
+                if added or removed:
+                    return added, removed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return [], []
+        return None
+
+    def stop(self):
+        """
+        Interrupt start() and changes() from another thread.
+        """
+        with self._lock:
+            if not self._stopped:
+                self._stopped = True
+                os.write(self._wake_w, b"\0")
+
+    def close(self):
+        """
+        Release the watches.  Must only be called once start() and changes()
+        are done with.
+        """
+        self.stop()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        self._dirs = {}
+        self._wds = {}
+        self._prefix_wd = {}
+        self._polled = set()
+
+    def _wait(self, timeout):
+        """
+        @param timeout  - maximum number of seconds to wait or None
+        @return         - True if inotify has events to read
+        """
+        fds = [self._wake_r]
+        if self._fd is not None:
+            fds.append(self._fd)
+        ready, _, _ = select.select(fds, [], [], timeout)
+        return self._fd is not None and self._fd in ready
+
+    def _read_events(self, dirty):
+        """
+        Read the pending inotify events.
+
+        @param dirty    - dictionary of the prefixes of the directories to
+                          read again to True if their subdirectories must be
+                          read too, updated with the changed directories
+        """
+        while True:
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                return
+
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                pos += _EVENT.size
+                name = data[pos : pos + length].rstrip(b"\0")
+                pos += length
+
+                if mask & _IN_Q_OVERFLOW:
+                    # Events were lost, read everything again
+                    dirty[""] = True
+                    continue
+
+                prefixes = self._wds.get(wd, ())
+                if mask & _IN_IGNORED:
+                    for prefix in prefixes:
+                        self._prefix_wd.pop(prefix, None)
+                    self._wds.pop(wd, None)
+                    continue
+
+                for prefix in prefixes:
+                    if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                        # The parent drops the directory when read again
+                        parent = prefix[: prefix.rstrip("/").rfind("/") + 1]
+                        dirty.setdefault(parent if prefix else "", False)
+                    elif os.fsdecode(name) in self._ignore_files:
+                        # The paths ignored below the directory may change
+                        dirty[prefix] = True
+                    elif mask & (_IN_MODIFY | _IN_CLOSE_WRITE):
+                        continue
+                    else:
+                        dirty.setdefault(prefix, False)
+
+    def _poll(self, dirty):
+        """
+        Check the modification times of the polled directories.
+
+        @param dirty    - see _read_events()
+        """
+        for prefix in self._polled:
+            directory = self._dirs.get(prefix)
+            if directory is None:
+                continue
+            try:
+                mtime = os.stat(directory.item[0]).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime is None or mtime != directory.mtime:
+                dirty.setdefault(prefix, False)
+            elif any(directory.ignores):
+                if self._ignores(directory.item[0]) != directory.ignores:
+                    dirty.setdefault(prefix, False)
+
+    def _update(self, dirty):
+        """
+        Read the changed directories again.
+
+        @param dirty    - see _read_events()
+        @return         - tuple of the (added, removed) lists of paths
+        """
+        added = []
+        removed = []
+        # Parents first so that a directory which is gone is dropped
+        # rather than read
+        for prefix in sorted(dirty, key=len):
+            self._rescan(prefix, added, removed, dirty[prefix])
+
+        # A path removed and added again, or the other way around, did not
+        # change
+        both = set(added) & set(removed)
+        if both:
+            added = [path for path in added if path not in both]
+            removed = [path for path in removed if path not in both]
+        return added, removed
+
+    def _watch(self, prefix, path):
+        """
+        Start watching a directory, falling back to polling it.
+        """
+        if self._fd is not None:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._flags)
+            if wd >= 0:
+                self._wds.setdefault(wd, set()).add(prefix)
+                self._prefix_wd[prefix] = wd
+                return
+            elif _errno() == errno.ENOENT:
+                return
+        self._polled.add(prefix)
+
+    def _unwatch(self, prefix):
+        self._polled.discard(prefix)
+        wd = self._prefix_wd.pop(prefix, None)
+        if wd is None:
+            return
+
+        prefixes = self._wds.get(wd)
+        prefixes.discard(prefix)
+        if not prefixes:
+            del self._wds[wd]
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _read(self, directory, found):
+        """
+        @param directory    - _Directory to read
+        @param found        - list to append the reported paths to
+        @return             - list of the arguments of _Walk.scan() for the
+                              subdirectories
+        @raise              - OSError if the directory cannot be read
+        """
+        path = directory.item[0]
+        mtime = os.stat(path).st_mtime_ns
+        subdirs = self._walk.scan(found, *directory.item)
+        if time.time() - mtime / 1e9 < _MTIME_GRANULARITY:
+            mtime = None
+        directory.mtime = mtime
+        directory.ignores = self._ignores(path)
+        return subdirs
+
+    def _ignores(self, path):
+        """
+        @param path - path of a directory
+        @return     - tuple of the modification times of the ignore files in
+                      the directory, None for those which do not exist
+        """
+        ret = []
+        for name in self._walk.ignore_files:
+            try:
+                ret.append(os.stat(os.path.join(path, name)).st_mtime_ns)
+            except OSError:
+                ret.append(None)
+        return tuple(ret)
+
+    def _add_tree(self, item, added, root=False):
+        """
+        Watch and read a directory and everything below it.
+
+        @param item     - arguments of _Walk.scan() for the directory
+        @param added    - list to append the paths found to
+        @param root     - raise an error if the directory cannot be read
+        """
+        stack = [item]
+        while stack and not self._stopped:
+            item = stack.pop()
+            prefix = item[2]
+            directory = _Directory(item)
+            self._watch(prefix, item[0])
+
+            found = []
+            try:
+                subdirs = self._read(directory, found)
+            except OSError:
+                self._unwatch(prefix)
+                if root:
+                    raise
+                continue
+            root = False
+
+            directory.found = set(found)
+            directory.subdirs = set(subdir[2] for subdir in subdirs)
+            self._dirs[prefix] = directory
+            added.extend(found)
+            stack.extend(subdirs)
+
+    def _drop_tree(self, prefix, removed):
+        """
+        Stop watching a directory and everything below it.
+
+        @param prefix   - prefix of the directory
+        @param removed  - list to append the paths reported from it to
+        """
+        stack = [prefix]
+        while stack:
+            directory = self._dirs.pop(stack.pop(), None)
+            if directory is None:
+                continue
+            self._unwatch(directory.item[2])
+            removed.extend(directory.found)
+            stack.extend(directory.subdirs)
+
+    def _rescan(self, prefix, added, removed, recursive):
+        """
+        Read a directory again.  Subdirectories which appeared are read
+        entirely and those which are gone are dropped.
+
+        @param prefix       - prefix of the directory
+        @param added        - list to append the new paths to
+        @param removed      - list to append the paths which are gone to
+        @param recursive    - also read every subdirectory again.  This is
+                              done anyway if the ignore files of the
+                              directory changed, since they apply to the
+                              subdirectories too.
+        """
+        stack = [(prefix, None, recursive)]
+        while stack:
+            prefix, item, recursive = stack.pop()
+            directory = self._dirs.get(prefix)
+            if directory is None:
+                continue
+            if item is not None:
+                directory.item = item
+
+            found = []
+            ignores = directory.ignores
+            try:
+                subdirs = self._read(directory, found)
+            except OSError:
+                self._drop_tree(prefix, removed)
+                continue
+            recursive = recursive or directory.ignores != ignores
+
+            found = set(found)
+            added.extend(found - directory.found)
+            removed.extend(directory.found - found)
+            directory.found = found
+
+            items = {subdir[2]: subdir for subdir in subdirs}
+            for subdir in directory.subdirs - items.keys():
+                self._drop_tree(subdir, removed)
+            for subdir, item in items.items():
+                if subdir not in directory.subdirs:
+                    self._add_tree(item, added)
+                elif recursive:
+                    stack.append((subdir, item, True))
+            directory.subdirs = set(items)
@@ -1,11 +1,93 @@
 import cProfile
 import os
 import pstats
+import pty
+import re
+import select
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
 import unittest
 
 import fzsl
 
 TESTDIR = os.path.realpath(os.path.dirname(__file__))
+FZSL = os.path.join(os.path.dirname(TESTDIR), "bin", "fzsl")
+
+
+SEARCHES = ["drineethe100ephy", "drinete100phy.c", "e100phy.c"]
+
+
+def synthetic_paths(n):
+    return [
+        "src/module%03d/pkg%03d/file%07d.py" % (i % 997, i % 89, i) for i in range(n)
+    ]
+
+
+def import_time(cwd, *args):
+    """
+    @param cwd  - directory to run python in
+    @param args - arguments to python
+    @return     - tuple of the milliseconds spent importing modules, as
+                  reported by python -X importtime, and the names of the
+                  modules imported
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(TESTDIR))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    cmd = [sys.executable, "-X", "importtime"] + list(args)
+    for _ in range(2):
+        # The first run writes the bytecode of any module which changed
+        proc = subprocess.run(
+            cmd,
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+
+    total = 0
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match is None:
+            continue
+        modules.append(match.group(3))
+        if len(match.group(2)) == 1:
+            total += int(match.group(1))
+    return total / 1000, modules
+
+
+def first_paint(cwd, *args):
+    """
+    @param cwd  - directory to run fzsl in
+    @param args - arguments to bin/fzsl
+    @return     - seconds from starting fzsl in a terminal until it drew
+                  the prompt
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(TESTDIR), TERM="xterm")
+    start = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(cwd)
+        os.execve(sys.executable, [sys.executable, FZSL] + list(args), env)
+
+    out = b""
+    try:
+        while re.search(rb"\d+/\d+ ", out) is None:
+            ready, _, _ = select.select([fd], [], [], 10)
+            if not ready:
+                raise AssertionError("fzsl did not draw the prompt")
+            out += os.read(fd, 1 << 16)
+        return time.perf_counter() - start
+    finally:
+        # Escape
+        os.write(fd, b"\x1b")
+        os.waitpid(pid, 0)
+        os.close(fd)
 
 
 class Benchmark(unittest.TestCase):
@@ -17,7 +99,7 @@ class Benchmark(unittest.TestCase):
     def testeth100e(self):
         files = self._scanner.scan(TESTDIR)
 
-        for search in ["drineethe100ephy", "drinete100phy.c", "e100phy.c"]:
+        for search in SEARCHES:
             fm = fzsl.FuzzyMatch(files=files)
             pr = cProfile.Profile()
             for i in range(1, len(search)):
@@ -27,13 +109,7 @@ class Benchmark(unittest.TestCase):
                 stats = pstats.Stats(pr)
                 pr.clear()
                 self.assertLess(stats.total_tt, 10)
-                print(
-                    "%d/%d"
-                    % (
-                        len(fm._library),
-                        len([f for f in fm._library.values() if f.round_ejected == 0]),
-                    )
-                )
+                print("%d/%d" % (fm.n_files, fm.n_matches))
                 print("search for %-20s: %f" % (search[:i], stats.total_tt))
             print("\n".join(fm.top_matches()))
             self.assertIn(
@@ -41,6 +117,104 @@ class Benchmark(unittest.TestCase):
                 fm.top_matches(),
             )
 
+    def testscorers(self):
+        files = self._scanner.scan(TESTDIR)
+
+        for search in SEARCHES:
+            folded = fzsl.core.fold(search)
+            for scorer in (fzsl.core.regex_scorer, fzsl.core.default_scorer):
+                elapsed = 0.0
+                for i in range(1, len(search) + 1):
+                    start = time.perf_counter()
+                    for path in files:
+                        scorer(path, i, folded[:i])
+                    elapsed += time.perf_counter() - start
+                print("%-14s %-20s: %f" % (scorer.__name__, search, elapsed))
+
+    def testmemory(self):
+        files = synthetic_paths(5000000)
+
+        tracemalloc.start()
+        fm = fzsl.FuzzyMatch(files=files)
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print("library of %d paths: %.1f MiB" % (fm.n_files, used / 2 ** 20))
+
+    def testcache(self):
+        files = synthetic_paths(2000000)
+        path = os.path.join(TESTDIR, ".benchmark-cache")
+
+        try:
+            with fzsl.cache.CacheWriter(path) as writer:
+                writer.add(files)
+                writer.commit()
+
+            start = time.perf_counter()
+            cache = fzsl.cache.PathCache(path)
+            print("open %d paths: %f" % (len(cache), time.perf_counter() - start))
+
+            start = time.perf_counter()
+            fm = fzsl.FuzzyMatch()
+            for batch in cache.batches(1 << 12):
+                fm.add_files(batch)
+            cache.close()
+            elapsed = time.perf_counter() - start
+            print("library from cache: %f" % (elapsed,))
+
+            start = time.perf_counter()
+            fm = fzsl.FuzzyMatch(files=files)
+            elapsed = time.perf_counter() - start
+            print("library from text:  %f" % (elapsed,))
+        finally:
+            os.unlink(path)
+
+    def testwalk(self):
+        with tempfile.TemporaryDirectory() as root:
+            for path in synthetic_paths(200000):
+                path = os.path.join(root, path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, "w").close()
+
+            scanner = fzsl.SimpleScanner("find", "find -L . || true")
+            start = time.perf_counter()
+            found = scanner.scan(root)
+            elapsed = time.perf_counter() - start
+            print("find -L:        %d paths %f" % (len(found), elapsed))
+
+            for threads in (1, 2, 4, 8):
+                scanner = fzsl.WalkScanner(
+                    "walk", threads=threads, follow_links=True, ignore=False
+                )
+                start = time.perf_counter()
+                found = scanner.scan(root)
+                elapsed = time.perf_counter() - start
+                print("walk %d threads: %d paths %f" % (threads, len(found), elapsed))
+
+    def teststartup(self):
+        with tempfile.TemporaryDirectory() as root:
+            for path in synthetic_paths(20000):
+                path = os.path.join(root, path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, "w").close()
+
+            config = os.path.join(root, "fzsl.conf")
+            with open(config, "w") as fp:
+                fp.write("[walk]\ntype = walk\n")
+
+            for label, args in (
+                ("import fzsl", ["-c", "import fzsl"]),
+                ("the pager", ["-c", "import fzsl; fzsl.SimplePager"]),
+                ("fzsl --filter", [FZSL, "--no-server", "-c", config, "-f", "e100"]),
+            ):
+                elapsed, modules = import_time(root, *args)
+                print("%-14s: %5.1f ms, %d modules" % (label, elapsed, len(modules)))
+
+            times = sorted(
+                first_paint(root, "--no-server", "-c", config) for _ in range(5)
+            )
+            print("first paint: %.1f ms" % (times[len(times) // 2] * 1000,))
+
 
 def main():
     unittest.main()
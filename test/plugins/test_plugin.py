@@ -35,6 +35,18 @@ class KwdsScanner(fzsl.Scanner):
         return self._args
 
 
+class StreamScanner(fzsl.Scanner):
+    def __init__(self):
+        super(StreamScanner, self).__init__("stream")
+
+    def is_suitable(self, path):
+        return True
+
+    def iter_scan(self, path, rescan=False):
+        yield ["a", "b"]
+        yield ["c"]
+
+
 class BrokenScanner1(fzsl.Scanner):
     def __init__(self):
         super(BrokenScanner1, self).__init__("broken1")
@@ -57,3 +69,25 @@ class BrokenScanner3(object):
 
     def scan(self, path):
         return []
+
+
+class BrokenScanner4(fzsl.Scanner):
+    def __init__(self):
+        super(BrokenScanner4, self).__init__("broken4")
+
+    def is_suitable(self, path):
+        return True
+
+
+class TransformScanner(fzsl.Scanner):
+    def __init__(self):
+        super(TransformScanner, self).__init__("transform")
+
+    def is_suitable(self, path):
+        return True
+
+    def scan(self, path, rescan=False):
+        return ["a"]
+
+    def transform(self, path):
+        return path.upper()
@@ -0,0 +1,93 @@
+import io
+import os
+import struct
+
+import pytest
+
+import fzsl
+from fzsl import cache
+
+
+@pytest.fixture
+def paths():
+    return ["abc/def", "with space", "ünïcode/päth", "bad\udcffbyte", "z"]
+
+
+def test_round_trip(tmpdir, paths):
+    path = os.path.join(tmpdir, "cache")
+    with cache.CacheWriter(path, meta={"cmd": "find"}) as writer:
+        writer.add(paths[:2])
+        writer.add(cache.Paths(paths[2:], [1, 2, 3]))
+        writer.commit()
+
+    assert cache.is_cache(path)
+    assert ["cache"] == os.listdir(tmpdir)
+
+    with cache.PathCache(path) as c:
+        assert len(paths) == len(c)
+        assert paths == [c[i] for i in range(len(c))]
+        assert paths[-1] == c[-1]
+        assert {"cmd": "find"} == c.meta
+        with pytest.raises(IndexError):
+            c[len(paths)]
+
+        masks = [fzsl.core.char_mask(p) for p in paths[:2]] + [1, 2, 3]
+        assert masks == list(c.masks)
+
+        batches = list(c.batches(2))
+        assert [paths[:2], paths[2:4], paths[4:]] == batches
+        assert masks == [m for b in batches for m in b.masks]
+
+
+def test_empty(tmpdir):
+    path = os.path.join(tmpdir, "cache")
+    with cache.CacheWriter(path, masks=False) as writer:
+        writer.commit()
+
+    with cache.PathCache(path) as c:
+        assert 0 == len(c)
+        assert {} == c.meta
+        assert c.masks is None
+        assert [] == list(c.batches(10))
+
+
+def test_abandoned(tmpdir, paths):
+    path = os.path.join(tmpdir, "cache")
+    with open(path, "w") as fp:
+        fp.write("old")
+
+    with cache.CacheWriter(path) as writer:
+        writer.add(paths)
+
+    assert ["cache"] == os.listdir(tmpdir)
+    assert not cache.is_cache(path)
+
+
+def test_version(tmpdir, paths):
+    path = os.path.join(tmpdir, "cache")
+    with cache.CacheWriter(path) as writer:
+        writer.add(paths)
+        writer.commit()
+
+    with open(path, "r+b") as fp:
+        fp.seek(len(cache.MAGIC))
+        fp.write(struct.pack("<I", cache.VERSION + 1))
+
+    assert cache.is_cache(path)
+    with pytest.raises(ValueError):
+        cache.PathCache(path)
+
+    # Scanners rebuild caches they cannot read
+    s = fzsl.SimpleScanner("test", "echo hi", cache=path)
+    assert ["hi"] == s.scan()
+    with cache.PathCache(path) as c:
+        assert ["hi"] == list(c.batches(10))[0]
+
+
+def test_text(tmpdir, paths):
+    path = os.path.join(tmpdir, "cache")
+    cache.import_text(io.StringIO("\n".join(paths) + "\n"), path)
+
+    out = io.StringIO()
+    cache.export_text(path, out)
+    assert "\n".join(paths) + "\n" == out.getvalue()
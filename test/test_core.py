@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 import fzsl
@@ -99,3 +101,265 @@ def test_ignorecase():
 
     fm.update_scores("ABC")
     assert 3 == fm.n_matches
+
+
+def test_subsequence_match():
+    assert (0, 2) == fzsl.core.subsequence_match("abc/def", "abc")
+    assert (4, 12) == fzsl.core.subsequence_match("ggg/a/b/ggg/c/d", "abc")
+    assert (2, 2) == fzsl.core.subsequence_match("a/a/b", "a")
+    assert fzsl.core.subsequence_match("cba", "abc") is None
+    assert fzsl.core.subsequence_match("", "a") is None
+
+
+def test_scorers_agree():
+    testdir = os.path.realpath(os.path.dirname(__file__))
+    with open(os.path.join(testdir, "files")) as fp:
+        files = fp.read().split()[::50]
+
+    for search in ("drinete100phy.c", "e100", "FIRM", "x", "zzzq"):
+        folded = fzsl.core.fold(search)
+        for path in files:
+            expected = fzsl.core.regex_scorer(path, len(search), folded)
+            assert expected == fzsl.core.default_scorer(path, len(search), folded)
+
+
+def test_match_tree():
+    testdir = os.path.realpath(os.path.dirname(__file__))
+    with open(os.path.join(testdir, "files")) as fp:
+        files = fp.read().split()[::10]
+    files += ["", "abc", "a/b/c", "a/b/", "/c", "İi/Ab/c", "a/İbc"]
+
+    directories = {}
+    items = [
+        (
+            i,
+            path,
+            fzsl.core.char_mask(path),
+            directories.setdefault(d, len(directories)),
+        )
+        for i, path in enumerate(files)
+        for d in (path[: path.rfind("/") + 1],)
+    ]
+
+    for search in ("drinete100phy.c", "e100", "firm", "x", "abc", "/c", "iab"):
+        expected = []
+        for i, path in enumerate(files):
+            _, (start, end, score, ejected) = fzsl.core.default_scorer(
+                path, len(search), search
+            )
+            if ejected == 0:
+                expected.append((i, start, end, score))
+
+        mask = fzsl.core.char_mask(search)
+        assert expected == list(fzsl.core.match_tree(search, mask, items))
+
+
+def test_char_mask():
+    mask = fzsl.core.char_mask
+
+    assert 0 == mask("")
+    assert mask("abc") == mask("CBA")
+    assert mask("a/b") & mask("ab") == mask("ab")
+    assert mask("a/b") & mask("abc") != mask("abc")
+    assert mask("0") != mask("p")
+    assert mask("ü") & mask("aü") != mask("aü")
+
+    # Characters which fold to ASCII letters pass the prefilter for them
+    kelvin = "\u212a"
+    assert mask(kelvin) & mask("k") == mask("k")
+    assert fzsl.core.default_scorer(kelvin, 1, "k")[1][3] == 0
+    fm = fzsl.FuzzyMatch(files=[kelvin, "x"])
+    fm.update_scores("k")
+    assert [kelvin] == fm.top_matches()
+
+
+def test_edit_query():
+    fm = fzsl.FuzzyMatch()
+
+    files = ["abc/def", "bcd", "xbc", "ab"]
+    fm.add_files(files)
+
+    fm.update_scores("abc")
+    assert ["abc/def"] == fm.top_matches()
+
+    # Delete the first character rather than the last
+    fm.update_scores("bc")
+    assert 3 == fm.n_matches
+    assert ["abc/def", "bcd", "xbc"] == sorted(fm.top_matches())
+
+    # Insert a character in the middle
+    fm.update_scores("bxc")
+    assert 0 == fm.n_matches
+
+    fm.update_scores("b")
+    assert 4 == fm.n_matches
+    assert 1 == fm.start("abc/def")
+
+
+def test_cancel():
+    fm = fzsl.FuzzyMatch(files=["abc/def", "bcd", "xbc", "ab"])
+    fm.update_scores("bc")
+
+    assert not fm.update_scores("bcd", lambda: True)
+    assert "bc" == fm._rounds[-1].query
+    assert ["xbc", "bcd", "abc/def"] == fm.top_matches()
+
+    assert not fm.update_scores("b", lambda: True)
+    fm.add_files(["bbc"])
+    assert not fm.update_scores("bc", lambda: True)
+    assert 4 == fm.n_matches
+    assert fm.update_scores("bc")
+    assert ["xbc", "bbc", "bcd", "abc/def"] == fm.top_matches()
+
+
+def test_cache_size():
+    files = ["abc/def", "bcd", "xbc", "ab"]
+
+    for cache_size in (0, 1, 100):
+        fm = fzsl.FuzzyMatch(files=files, cache_size=cache_size)
+
+        for search in ("a", "ab", "abc", "ab", "a", "ax", "", "b", "bc"):
+            fm.update_scores(search)
+
+        assert 3 == fm.n_matches
+        assert sum(len(r) for r in fm._rounds[1:-1]) <= cache_size
+
+
+def test_top_matches_cache():
+    fm = fzsl.FuzzyMatch()
+
+    fm.add_files(["a/b/c", "abc", "abcxx", "b", "c"])
+    assert ["a/b/c", "abc"] == fm.top_matches(2)
+    assert ["a/b/c", "abc", "abcxx"] == fm.top_matches(3)
+
+    fm.update_scores("abc")
+    assert 3 == fm.n_matches
+    assert ["abc"] == fm.top_matches(1)
+    assert ["abc", "a/b/c", "abcxx"] == fm.top_matches(10)
+    assert ["abc", "a/b/c"] == fm.top_matches(2)
+
+    fm.add_files(["zabc"])
+    assert 4 == fm.n_matches
+    fm.update_scores("abc")
+    assert ["abc", "zabc", "a/b/c"] == fm.top_matches(3)
+
+    fm.update_scores("abcd")
+    assert 0 == fm.n_matches
+    assert [] == fm.top_matches()
+
+
+def test_rank_depth():
+    files = ["%s/abc" % ("x" * i) for i in range(20)]
+    reference = fzsl.FuzzyMatch(files=files)
+    fm = fzsl.FuzzyMatch(files=files, rank_depth=3)
+
+    for search in ("a", "ab", "abc"):
+        reference.update_scores(search)
+        fm.update_scores(search)
+        assert reference.top_matches(3) == fm.top_matches(3)
+        assert reference.top_matches(15) == fm.top_matches(15)
+        for path in files:
+            assert reference.score(path) == fm.score(path)
+            assert reference.start(path) == fm.start(path)
+            assert reference.end(path) == fm.end(path)
+
+
+def test_top_matches_offset():
+    testdir = os.path.realpath(os.path.dirname(__file__))
+    with open(os.path.join(testdir, "files")) as fp:
+        files = fp.read().split()[::10]
+
+    fm = fzsl.FuzzyMatch(files=files, rank_depth=5)
+    assert files[30:40] == fm.top_matches(10, 30)
+
+    for search in ("d", "drinet"):
+        fm.update_scores(search)
+        matched = [path for path in files if fm.score(path) > 0]
+        ranked = sorted(matched, key=lambda path: -fm.score(path))
+
+        # Paging ranks no more than the pages reached
+        pages = []
+        for offset in range(0, 100, 25):
+            pages += fm.top_matches(25, offset)
+            assert offset + 25 >= len(fm._current.top)
+        assert ranked[:100] == pages
+
+        assert ranked[200:210] == fm.top_matches(10, 200)
+        assert ranked[len(ranked) - 3 :] == fm.top_matches(10, len(ranked) - 3)
+        assert ranked[:5] == fm.top_matches(5)
+
+
+def test_remove_files():
+    files = ["%s/abc" % ("x" * i) for i in range(20)] + ["abd", "zzz"]
+    fm = fzsl.FuzzyMatch(files=files, rank_depth=3)
+    fm.remove_files(["zzz", "not-there"])
+    assert 21 == fm.n_files
+    assert 21 == fm.n_matches
+
+    fm.update_scores("ab")
+    fm.update_scores("abc")
+    fm.top_matches(15)
+    removed = files[1:20:3]
+    fm.remove_files(removed + removed)
+
+    remaining = [f for f in files[:21] if f not in removed]
+    reference = fzsl.FuzzyMatch(files=remaining)
+    reference.update_scores("abc")
+    assert reference.n_files == fm.n_files
+    assert reference.n_matches == fm.n_matches
+    assert reference.top_matches(3) == fm.top_matches(3)
+    assert reference.top_matches(15) == fm.top_matches(15)
+    for path in remaining:
+        assert reference.score(path) == fm.score(path)
+    with pytest.raises(KeyError):
+        fm.score(removed[0])
+
+    # Earlier queries were dropped but still work
+    fm.update_scores("ab")
+    reference.update_scores("ab")
+    assert reference.top_matches(20) == fm.top_matches(20)
+
+
+def test_sync_files():
+    fm = fzsl.FuzzyMatch(files=["abc", "a/b/c", "xyz"])
+    fm.update_scores("abc")
+    current = fm._current
+
+    fm.sync_files(["a/b/c", "xyz", "zabc"])
+    assert ["a/b/c", "xyz", "zabc"] == fm._paths
+    assert 2 == fm.n_matches
+    assert ["a/b/c"] == fm.top_matches()
+
+    # Only the new file is scored
+    fm.update_scores("abc")
+    assert current.query == fm._current.query
+    assert ["zabc", "a/b/c"] == fm.top_matches()
+
+
+def test_match_queries():
+    testdir = os.path.realpath(os.path.dirname(__file__))
+    with open(os.path.join(testdir, "files")) as fp:
+        files = fp.read().split()[::10]
+
+    fm = fzsl.FuzzyMatch(files=files, rank_depth=3)
+    fm.update_scores("drv")
+    current = fm._current
+
+    queries = ["drinet", "drivers/net", "Drivers/Nfc", "zzzzz", "", "drinet", "driv"]
+    matches = fm.match_queries(queries, 10)
+    assert len(queries) == len(matches)
+    assert [] == matches[3]
+    assert matches[0] == matches[5]
+    assert 10 == len(matches[4])
+
+    for search, found in zip(queries, matches):
+        reference = fzsl.FuzzyMatch(files=files)
+        reference.update_scores(search)
+        assert reference.top_matches(10) == [m[0] for m in found]
+        for path, start, end, score in found:
+            assert reference.start(path) == start
+            assert reference.end(path) == end
+            assert reference.score(path) == score
+
+    # The current query is left alone
+    assert current is fm._current
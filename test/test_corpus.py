@@ -0,0 +1,81 @@
+import array
+
+import pytest
+
+import fzsl
+from fzsl import corpus
+
+pytestmark = pytest.mark.skipif(
+    not corpus.available(), reason="multiprocessing.shared_memory unavailable"
+)
+
+
+def _masks(paths):
+    return array.array("Q", map(fzsl.core.char_mask, paths))
+
+
+def _parents(paths):
+    return array.array("I", range(len(paths)))
+
+
+def test_paths():
+    paths = ["abc/def", "", "ünïcode/päth", "z"]
+    shared = corpus.SharedCorpus(paths, _masks(paths), _parents(paths))
+    try:
+        view = corpus.attach(shared.handle)
+        assert paths == [view.path(i) for i in range(len(paths))]
+        assert list(_masks(paths)) == list(view.masks)
+    finally:
+        shared.close()
+
+
+def test_match_range():
+    paths = ["abc/def", "xyz", "a/b/c", "cba", "abc"]
+    shared = corpus.SharedCorpus(paths, _masks(paths), _parents(paths))
+    mask = fzsl.core.char_mask("abc")
+    scorer = fzsl.core.default_scorer
+    try:
+        shared.set_candidates(array.array("Q", [0, 2, 3, 4]))
+        lo, survivors, top, spans = corpus.match_range(
+            scorer, "abc", mask, 1, False, shared.handle, False, (1, 4)
+        )
+        assert 1 == lo
+        assert [2, 4] == list(survivors)
+        assert [(1.0 / 3, -4, 0, 2)] == top
+        assert spans is None
+
+        lo, survivors, top, spans = corpus.match_range(
+            scorer, "abc", mask, 4, True, shared.handle, True, (0, 5)
+        )
+        assert [0, 2, 4] == list(survivors)
+        assert [-4, -2, 0] == [neg for _, neg, _, _ in top]
+        starts, ends, scores = spans
+        assert [0, 0, 0] == list(starts)
+        assert [2, 4, 2] == list(ends)
+        assert [t[0] for t in sorted(top, key=lambda t: -t[1])] == list(scores)
+
+        # Growing the candidates past the segment size changes the handle
+        handle = shared.handle
+        shared.set_candidates(array.array("Q", list(range(4)) * 4))
+        assert handle != shared.handle
+    finally:
+        shared.close()
+
+
+def test_match_paths():
+    paths = ["abc/def", "xyz", "a/b/c", "cba", "abc"]
+    lo, survivors, top, spans = corpus.match_paths(
+        fzsl.core.default_scorer,
+        "abc",
+        fzsl.core.char_mask("abc"),
+        2,
+        False,
+        paths,
+        _masks(paths),
+        _parents(paths),
+        None,
+        (0, 5),
+    )
+    assert 0 == lo
+    assert [0, 2, 4] == list(survivors)
+    assert [-4, -2] == [neg for _, neg, _, _ in top]
@@ -0,0 +1,126 @@
+import configparser
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import fzsl
+from fzsl import detect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+class Check(fzsl.Scanner):
+    def __init__(self, name, priority, suitable, delay=0):
+        super(Check, self).__init__(name, priority)
+        self.suitable = suitable
+        self.delay = delay
+        self.checked = []
+
+    def is_suitable(self, path):
+        time.sleep(self.delay)
+        self.checked.append(path)
+        return self.suitable
+
+    def scan(self, path=None, rescan=False):
+        return []
+
+
+def test_pick_scanner():
+    slow = Check("slow", 10, True, 0.2)
+    fast = Check("fast", 5, True)
+    scanners = [Check("no", 20, False), slow, fast, Check("hidden", -1, True)]
+
+    # The slower check of a better scanner is waited on
+    assert slow is fzsl.pick_scanner(scanners, "/")
+    assert slow is fzsl.pick_scanner(scanners, "/", threads=1)
+    assert fzsl.pick_scanner(scanners[:1], "/") is None
+    assert fzsl.pick_scanner(scanners[3:], "/") is None
+    assert not scanners[3].checked
+
+    # While the checks of worse scanners are not
+    stuck = Check("stuck", 0, True, 2)
+    start = time.time()
+    assert fast is fzsl.pick_scanner([fast, stuck], "/")
+    assert time.time() - start < 1
+
+
+def test_detection_cache(tmpdir, monkeypatch):
+    path = str(tmpdir.join("sub", "detect.json"))
+    cache = fzsl.DetectionCache(path, ttl=10, key="a")
+    assert cache.get("/x") is None
+
+    cache.set("/x", "git")
+    cache.set("/y", "default")
+    assert "git" == cache.get("/x")
+    assert "default" == cache.get("/y")
+    assert fzsl.DetectionCache(path, ttl=10, key="b").get("/x") is None
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("/x") is None
+    cache.set("/z", "git")
+    with open(path) as fp:
+        assert ["/z"] == list(json.load(fp)["entries"])
+    monkeypatch.undo()
+
+    with open(path, "w") as fp:
+        fp.write('{"key": "a", "entries": {"/x": 1}}')
+    assert cache.get("/x") is None
+
+    # Failing to write is ignored
+    cache = fzsl.DetectionCache(str(tmpdir.join("sub", "detect.json", "x")))
+    cache.set("/x", "git")
+    assert cache.get("/x") is None
+    assert detect.default_cache_path().endswith("detect.json")
+
+
+def test_default_scanner(tmpdir):
+    tmpdir.join(".gitignore").write("ignored\n")
+    tmpdir.join("ignored").write("")
+
+    # Without a suitable rule every path is listed, like find -L .
+    rule, scanner = detect.scanner_for_path(configparser.RawConfigParser(), str(tmpdir))
+    assert rule is None
+    assert [".gitignore", "ignored"] == sorted(scanner.scan(str(tmpdir)))
+
+
+def test_rules_built_in_order(tmpdir):
+    parser = configparser.RawConfigParser()
+    parser.read_string(
+        "[fzsl]\ndetect_ttl = 0\n"
+        "[first]\ntype = simple\ncmd = true\ndetect_cmd = %s\npriority = 10\n"
+        "[plugin]\ntype = python\npath = %s\nobject = Missing\npriority = 5\n"
+        "[hidden]\ntype = python\npath = %s\nobject = Missing\npriority = -1\n"
+        % ("true", tmpdir.join("missing.py"), tmpdir.join("missing.py"))
+    )
+    assert ["first", "plugin"] == [rule[0] for rule in detect.build_rules(parser)]
+
+    # The plugin is only loaded once the rules before it are unsuitable
+    assert "first" == detect.scanner_for_path(parser, str(tmpdir))[0]
+    parser.set("first", "detect_cmd", "false")
+    with pytest.raises(fzsl.ConfigError):
+        detect.scanner_for_path(parser, str(tmpdir))
+
+
+def test_slow_check_exit(tmpdir):
+    # Checks which are not waited on do not hold up exiting
+    script = (
+        "import configparser, fzsl.detect\n"
+        "parser = configparser.RawConfigParser()\n"
+        "parser.read_string('[fzsl]\\ndetect_ttl = 0\\n"
+        "[a]\\ntype = simple\\ncmd = true\\ndetect_cmd = sleep 0.2\\npriority = 1\\n"
+        "[b]\\ntype = simple\\ncmd = true\\ndetect_cmd = sleep 5\\n')\n"
+        "print(fzsl.detect.scanner_for_path(parser, '.')[0])\n"
+    )
+    start = time.time()
+    output = subprocess.check_output(
+        [sys.executable, "-c", script],
+        cwd=str(tmpdir),
+        env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+    assert b"a\n" == output
+    assert time.time() - start < 4
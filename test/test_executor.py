@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import fzsl
+from fzsl import corpus, executor
+
+
+@pytest.fixture
+def files():
+    testdir = os.path.realpath(os.path.dirname(__file__))
+    with open(os.path.join(testdir, "files")) as fp:
+        return fp.read().split()[::20]
+
+
+def backends():
+    ret = [fzsl.SerialExecutor(), fzsl.ThreadExecutor(2)]
+    if corpus.available():
+        ret.append(fzsl.ProcessExecutor(2))
+    return ret
+
+
+@pytest.mark.parametrize("backend", backends(), ids=lambda b: type(b).__name__)
+def test_backends_agree(files, backend):
+    reference = fzsl.FuzzyMatch(files=files, executor=fzsl.SerialExecutor())
+    fm = fzsl.FuzzyMatch(files=files, executor=backend)
+
+    try:
+        for search in ("d", "dri", "drinet", "drine", "e100"):
+            reference.update_scores(search)
+            fm.update_scores(search)
+            assert reference.n_matches == fm.n_matches
+            assert reference.top_matches(50) == fm.top_matches(50)
+    finally:
+        backend.close()
+
+
+@pytest.mark.skipif(not corpus.available(), reason="requires shared_memory")
+def test_process_context():
+    # The pool is started from threads and must not fork them
+    assert "fork" != executor._context().get_start_method()
+
+
+def test_bounds():
+    e = fzsl.SerialExecutor()
+    assert [] == e.bounds(0)
+    assert [(0, 10)] == e.bounds(10)
+
+    e = fzsl.ThreadExecutor(2)
+    assert [(0, 256), (256, 300)] == e.bounds(300)
+
+    bounds = e.bounds(10000)
+    assert 8 == len(bounds)
+    assert 10000 == sum(hi - lo for lo, hi in bounds)
+
+
+def test_auto_select(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+
+    auto = fzsl.AutoExecutor(budget=0.01, cost=1e-6)
+    assert isinstance(auto.select(100), fzsl.SerialExecutor)
+
+    if corpus.available():
+        assert auto.select(10 ** 6) is executor.process_executor()
+
+    # Cheap scoring moves the threshold up
+    auto.record(auto.select(100), 10 ** 6, 0.0)
+    assert isinstance(auto.select(10 ** 4), fzsl.SerialExecutor)
+
+    monkeypatch.setattr(os, "cpu_count", lambda: 1)
+    assert isinstance(auto.select(10 ** 9), fzsl.SerialExecutor)
+
+
+@pytest.mark.parametrize("backend", backends(), ids=lambda b: type(b).__name__)
+def test_cancel(backend):
+    bounds = [(i, i + 1) for i in range(8)]
+    try:
+        assert backend.map(sum, bounds, lambda: True) is None
+        assert [2 * i + 1 for i in range(8)] == backend.map(sum, bounds, lambda: False)
+
+        # The cancellation is checked before each job
+        calls = []
+
+        def cancelled():
+            calls.append(None)
+            return len(calls) > 2
+
+        assert backend.map(sum, bounds, cancelled) is None
+        assert 3 == len(calls)
+        assert [2 * i + 1 for i in range(8)] == backend.map(sum, bounds, lambda: False)
+    finally:
+        backend.close()
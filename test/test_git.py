@@ -0,0 +1,170 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import fzsl
+from fzsl import git
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+
+
+def run(cwd, *args):
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_NAME="a",
+        GIT_AUTHOR_EMAIL="a@b",
+        GIT_COMMITTER_NAME="a",
+        GIT_COMMITTER_EMAIL="a@b",
+    )
+    return subprocess.check_output(
+        ("git", "-c", "protocol.file.allow=always") + args,
+        cwd=cwd,
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def ls_files(cwd, *args):
+    return run(cwd, "ls-files", "-z", *args).decode().split("\0")[:-1]
+
+
+def make_repo(path, files):
+    os.makedirs(path)
+    run(path, "init", "-q")
+    for name in files:
+        name = os.path.join(path, name)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(name, "w") as fp:
+            fp.write(name)
+    run(path, "add", ".")
+    run(path, "commit", "-q", "-m", "files")
+
+
+@pytest.fixture
+def repo(tmpdir):
+    path = os.path.join(tmpdir, "repo")
+    make_repo(path, ["a", "dir/b", "dir/sub/c", "dir/sub/d", "ünï cödé"])
+
+    # Names of 0xfff bytes or more are not stored in the flags.  The path is
+    # too long to create so only the index holds it.
+    blob = run(path, "hash-object", "-w", "a").decode().strip()
+    name = "/".join(["x" * 200] * 25)
+    run(path, "update-index", "--add", "--cacheinfo", "100644,%s,%s" % (blob, name))
+    return path
+
+
+@pytest.mark.parametrize("version", [2, 3, 4])
+def test_read_index(repo, version):
+    run(repo, "update-index", "--index-version", str(version))
+    # Extended flags are only written by version 3 and later
+    run(repo, "update-index", "--skip-worktree", "a")
+
+    worktree, gitdir = git.find_repository(os.path.join(repo, "dir", "sub"))
+    assert repo == worktree
+    paths, indexes = git.ls_files(worktree, gitdir)
+    assert ls_files(repo) == paths
+    assert git.indexes_unchanged(indexes)
+
+    with open(os.path.join(repo, "e"), "w"):
+        pass
+    run(repo, "add", "e")
+    assert not git.indexes_unchanged(indexes)
+
+
+def test_bad_index(repo, tmpdir):
+    index = os.path.join(repo, ".git", "index")
+    with open(index, "rb") as fp:
+        data = fp.read()
+
+    for bad in (b"JUNK" + data[4:], data[:100] + bytes(20)):
+        with open(index, "wb") as fp:
+            fp.write(bad)
+        with pytest.raises(git.GitError):
+            git.read_index(index)
+
+    assert git.find_repository(str(tmpdir)) is None
+
+
+def test_submodules(repo, tmpdir):
+    for name in ("one", "two"):
+        make_repo(os.path.join(tmpdir, name), ["%s/file" % (name,), "top"])
+        run(repo, "submodule", "add", "-q", os.path.join(tmpdir, name), "mods/" + name)
+    run(repo, "commit", "-q", "-m", "submodules")
+
+    expected = ls_files(repo, "--recurse-submodules")
+    paths, indexes = git.ls_files(repo, os.path.join(repo, ".git"))
+    assert expected == paths
+    assert 3 == len(indexes)
+
+    paths, _ = git.ls_files(repo, os.path.join(repo, ".git"), submodules=False)
+    assert ls_files(repo) == paths
+
+    # Uninitialized submodules are listed as is
+    run(repo, "submodule", "deinit", "-q", "mods/two")
+    paths, indexes = git.ls_files(repo, os.path.join(repo, ".git"))
+    assert "mods/two" in paths
+    assert "mods/one/one/file" in paths
+    run(repo, "submodule", "update", "-q", "--init", "mods/two")
+    assert not git.indexes_unchanged(indexes)
+
+
+def test_git_scanner(repo, tmpdir, monkeypatch):
+    cache_dir = os.path.join(tmpdir, "cache")
+    with open(os.path.join(repo, ".gitignore"), "w") as fp:
+        fp.write("*.o\n")
+    for name in ("new", "build.o"):
+        with open(os.path.join(repo, "dir", name), "w"):
+            pass
+    make_repo(os.path.join(repo, "nested"), ["inside"])
+
+    s = fzsl.GitScanner("git", cache_dir=cache_dir)
+    assert s.is_suitable(os.path.join(repo, "dir"))
+    assert not s.is_suitable(str(tmpdir))
+    assert ls_files(repo) == s.scan(os.path.join(repo, "dir"))
+    assert os.path.join(repo, "dir/b") == s.transform("dir/b")
+    assert repo == s.root(os.path.join(repo, "dir"))
+    assert not s.needs_refresh()
+
+    # Served from the cache until the index changes
+    assert 1 == len(os.listdir(cache_dir))
+    with monkeypatch.context() as m:
+        m.setattr(git, "ls_files", None)
+        assert ls_files(repo) == s.scan(repo)
+    run(repo, "rm", "-q", "--cached", "a")
+    assert ls_files(repo) == s.scan(repo)
+    open(os.path.join(repo, "a"), "w").close()
+
+    s = fzsl.GitScanner("git", untracked=True, cache_dir=cache_dir)
+    expected = ls_files(repo) + ["a", ".gitignore", "dir/new"]
+    assert sorted(expected) == sorted(s.scan(repo))
+    assert s.needs_refresh()
+
+    # Split indexes are read by git
+    run(repo, "update-index", "--split-index")
+    with pytest.raises(git.GitError):
+        git.ls_files(repo, os.path.join(repo, ".git"))
+    s = fzsl.GitScanner("git")
+    assert ls_files(repo) == s.scan(repo)
+
+
+def test_untracked(repo, tmpdir):
+    excludes = os.path.join(tmpdir, "excludes")
+    for path, pattern in (
+        (excludes, "*.global"),
+        (os.path.join(repo, ".git", "info", "exclude"), "*.info"),
+        (os.path.join(repo, ".gitignore"), "*.o"),
+        (os.path.join(repo, ".ignore"), "*.txt"),
+    ):
+        with open(path, "w") as fp:
+            fp.write(pattern + "\n")
+    for name in ("new", "x.global", "x.info", "x.o", "x.txt"):
+        open(os.path.join(repo, "dir", name), "w").close()
+    run(repo, "config", "core.excludesFile", excludes)
+
+    # Untracked files are the ones git reports, .ignore files are not read
+    s = fzsl.GitScanner("git", untracked=True)
+    expected = ls_files(repo) + ls_files(repo, "-o", "--exclude-standard")
+    assert "dir/x.txt" in expected
+    assert sorted(expected) == sorted(s.scan(repo))
@@ -0,0 +1,117 @@
+import configparser
+import os
+import time
+
+import pytest
+
+import fzsl
+
+
+def settle(library):
+    deadline = time.time() + 10
+    while not library.wait(0.01) or library.scanning:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_library(tmpdir):
+    listing = tmpdir.join("files")
+    listing.write("abc\na/b/c\nxyz\n")
+    cache = str(tmpdir.join("cache"))
+    scanner = fzsl.SimpleScanner("test", "cat %s" % (listing,), cache=cache)
+    library = fzsl.Library(scanner, str(tmpdir), depth=5)
+    try:
+        assert library.scan()
+        library.search("abc")
+        settle(library)
+        assert ["abc", "a/b/c"] == [m[0] for m in library.results.matches]
+        assert 3 == library.scanned
+
+        # Rescans keep the query
+        listing.write("abc\nabcd\n")
+        assert library.scan(rescan=True)
+        settle(library)
+        assert ["abc", "abcd"] == [m[0] for m in library.results.matches]
+        assert "abc" == library.results.search
+        library.check()
+    finally:
+        library.close()
+
+    # Files served from the cache leave the root_path command to transform()
+    scanner = fzsl.SimpleScanner("test", "false", root_path="!pwd", cache=cache)
+    library = fzsl.Library(scanner, str(tmpdir), depth=5)
+    try:
+        assert library.scan()
+        settle(library)
+        assert 2 == library.scanned
+        assert str(tmpdir.join("abc")) == library.transform("abc")
+    finally:
+        library.close()
+
+
+def test_plugin_transform(tmpdir):
+    testdir = os.path.realpath(os.path.dirname(__file__))
+    parser = configparser.RawConfigParser()
+    parser.read_string(
+        "[rule]\ntype=python\npath=%s/plugins/test_plugin.py\n"
+        "object=TransformScanner\n" % (testdir,)
+    )
+    scanner = fzsl.scanner_from_configparser("rule", parser)
+    library = fzsl.Library(scanner, str(tmpdir), depth=5)
+    try:
+        assert library.scan()
+        settle(library)
+        assert "A" == library.transform("a")
+    finally:
+        library.close()
+
+
+def test_scan_error(tmpdir):
+    library = fzsl.Library(fzsl.SimpleScanner("test", "false"), str(tmpdir))
+    try:
+        library.scan()
+        settle(library)
+        with pytest.raises(fzsl.SubprocessError):
+            library.check()
+        library.check()
+    finally:
+        library.close()
+
+
+def test_watch(tmpdir, monkeypatch):
+    monkeypatch.setattr(fzsl.library, "CACHE_DELAY", 0.05)
+    root = tmpdir.mkdir("root")
+    root.join("abc").write("")
+    root.join("a", "b", "c").write("", ensure=True)
+    cache = str(tmpdir.join("cache"))
+    scanner = fzsl.WalkScanner(
+        "test", root_path=str(root), cache=cache, refresh="auto", types="files"
+    )
+    scanner.scan()
+    root.join("xyz").write("")
+
+    library = fzsl.Library(scanner, str(root), depth=5, watch=True)
+    try:
+        library.scan()
+        library.search("abc")
+        settle(library)
+        assert library.watching
+        assert 3 == library.results.n_files
+
+        # New files are scored against the current query
+        root.join("abcd").write("")
+        root.join("a", "b", "c").remove()
+        deadline = time.time() + 10
+        while ["abc", "abcd"] != [m[0] for m in library.results.matches]:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert 3 == library.results.n_files
+        assert "abc" == library.results.search
+        library.check()
+    finally:
+        library.close()
+    assert not library.watching
+
+    # The cache follows the changes
+    assert not scanner.needs_refresh(str(root))
+    assert ["abc", "abcd", "xyz"] == sorted(scanner.scan(str(root)))
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+import fzsl
+
+
+@pytest.fixture
+def files():
+    testdir = os.path.realpath(os.path.dirname(__file__))
+    with open(os.path.join(testdir, "files")) as fp:
+        return fp.read().split()[::10]
+
+
+@pytest.fixture
+def background():
+    matcher = fzsl.BackgroundMatcher(depth=20)
+    yield matcher
+    matcher.close()
+
+
+def test_latest_query_wins(files, background):
+    background.add_files(files)
+    for i in range(1, len("drinete100phy.c") + 1):
+        generation = background.search("drinete100phy.c"[:i])
+
+    assert background.wait(10)
+    assert not background.pending
+
+    reference = fzsl.FuzzyMatch(files=files)
+    reference.update_scores("drinete100phy.c")
+
+    results = background.results
+    assert generation == results.generation
+    assert "drinete100phy.c" == results.search
+    assert reference.n_matches == results.n_matches
+    assert len(files) == results.n_files
+    assert reference.top_matches(20) == [m[0] for m in results.matches]
+    for path, start, end, score in results.matches:
+        assert (reference.start(path), reference.end(path)) == (start, end)
+        assert reference.score(path) == score
+
+
+def test_resize_and_reset(background):
+    background.add_files(["abc", "a/b/c", "xyz"])
+    background.search("abc")
+    background.wait(10)
+    assert ["abc", "a/b/c"] == [m[0] for m in background.results.matches]
+
+    background.resize(1)
+    background.wait(10)
+    assert ["abc"] == [m[0] for m in background.results.matches]
+
+    background.reset_files(["xabc", "abx"])
+    background.wait(10)
+    assert ["xabc"] == [m[0] for m in background.results.matches]
+    assert 2 == background.results.n_files
+
+
+def test_scroll(background):
+    background.add_files(["abc", "a/b/c", "xyz", "xabc"])
+    background.search("abc")
+    background.resize(2)
+    background.scroll(1)
+    background.wait(10)
+
+    results = background.results
+    assert 1 == results.offset
+    assert 3 == results.n_matches
+    assert ["xabc", "a/b/c"] == [m[0] for m in results.matches]
+
+    background.scroll(5)
+    background.wait(10)
+    assert [] == background.results.matches
+
+
+def test_error():
+    def scorer(path, c_round, search):
+        raise ValueError(path)
+
+    background = fzsl.BackgroundMatcher(fzsl.FuzzyMatch(scorer=scorer))
+    try:
+        background.add_files(["abc"])
+        background.search("a")
+        background.wait(10)
+        with pytest.raises(ValueError):
+            background.results
+    finally:
+        background.close()
+
+
+def test_sync_keeps_query(background):
+    background.add_files(["abc", "a/b/c", "xyz"])
+    generation = background.search("abc")
+    background.wait(10)
+
+    background.add_files(["superseded/abc"])
+    background.sync_files(["a/b/c", "zabc"])
+    background.wait(10)
+
+    results = background.results
+    assert generation < results.generation
+    assert "abc" == results.search
+    assert ["zabc", "a/b/c"] == [m[0] for m in results.matches]
+    assert 2 == results.n_files
+
+
+def test_add_and_remove_in_order(background):
+    background.add_files(["abc", "a/b/c", "xyz"])
+    generation = background.search("abc")
+    background.wait(10)
+
+    background.remove_files(["abc", "xyz"])
+    background.add_files(["abc/d", "xyz"])
+    background.remove_files(["xyz"])
+    background.wait(10)
+
+    results = background.results
+    assert generation < results.generation
+    assert "abc" == results.search
+    assert ["a/b/c", "abc/d"] == sorted(m[0] for m in results.matches)
+    assert 2 == results.n_files
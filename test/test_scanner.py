@@ -23,6 +23,10 @@ def test_sort():
 
     assert [s1, s2] == sorted([s2, s1])
 
+    s3 = fzsl.SimpleScanner("test", "echo", priority="10")
+    s4 = fzsl.GitScanner("test", priority=9)
+    assert [s4, s3] == sorted([s3, s4])
+
 
 def test_root_path_match(testdir):
     s = fzsl.SimpleScanner("test", "echo", root_path=testdir)
@@ -39,6 +43,24 @@ def test_root_path_cmd(testdir):
     assert s.is_suitable(testdir)
 
 
+def test_root_path_cmd_lazy(tmpdir):
+    marker = tmpdir.join("ran")
+    s = fzsl.SimpleScanner("test", "echo", root_path="!touch ran; pwd")
+    assert not marker.exists()
+    assert s.is_suitable(str(tmpdir))
+    assert marker.exists()
+    assert str(tmpdir) == s.root(str(tmpdir.join("sub")))
+    assert str(tmpdir) == fzsl.SimpleScanner("test", "echo").root(str(tmpdir))
+
+    # A failing command leaves it to the detect_cmd
+    s = fzsl.SimpleScanner("test", "echo", root_path="!false")
+    assert not s.is_suitable(str(tmpdir))
+    s = fzsl.SimpleScanner("test", "echo", root_path="!false", detect_cmd="true")
+    assert s.is_suitable(str(tmpdir))
+    with pytest.raises(fzsl.SubprocessError):
+        s.scan(str(tmpdir))
+
+
 def test_detect_cmd_match(testdir, basename):
     cmd = "[ -f %s ]" % (basename,)
     s = fzsl.SimpleScanner("test", "echo", detect_cmd=cmd)
@@ -60,6 +82,37 @@ def test_cmd(testdir, basename):
     assert not s.scan("%s/../bin" % (testdir,))
 
 
+def test_iter_scan(testdir, monkeypatch):
+    monkeypatch.setattr(fzsl.scanner, "READ_SIZE", 4096)
+
+    s = fzsl.SimpleScanner("test", "cat files", root_path=testdir)
+    batches = list(s.iter_scan())
+    assert len(batches) > 1
+    assert s.scan() == [f for batch in batches for f in batch]
+    assert 49168 == len(s.scan())
+
+    # Split reads in the middle of multibyte characters
+    monkeypatch.setattr(fzsl.scanner, "READ_SIZE", 3)
+    s = fzsl.SimpleScanner("test", "printf 'ünï\\ncödé'")
+    assert ["ünï", "cödé"] == s.scan()
+
+    s = fzsl.SimpleScanner("test", "echo a; exit 3")
+    with pytest.raises(fzsl.SubprocessError):
+        s.scan()
+
+
+def test_unimplemented_scan():
+    class Unscanned(fzsl.Scanner):
+        def is_suitable(self, path):
+            return True
+
+    s = Unscanned("test")
+    with pytest.raises(TypeError):
+        s.scan()
+    with pytest.raises(TypeError):
+        list(s.iter_scan())
+
+
 def test_fallthrough(testdir):
     s = fzsl.SimpleScanner("test", "echo")
     assert s.is_suitable(testdir)
@@ -79,6 +132,89 @@ def test_scanner(testdir, tmpdir):
     results = s.scan(rescan=True)
     assert len(results) == 1
     assert results[0] == "hi"
+    assert ["cache"] == os.listdir(tmpdir)
+    assert fzsl.cache.is_cache(cache)
+    assert ["hi"] == s.scan()
+
+    # A failed scan leaves the cache alone
+    s = fzsl.SimpleScanner("test", "echo a b; exit 1", cache=cache)
+    with pytest.raises(fzsl.SubprocessError):
+        s.scan(rescan=True)
+    assert ["hi"] == s.scan()
+    assert ["cache"] == os.listdir(tmpdir)
+
+    # Abandoning a scan part way leaves the cache alone
+    s = fzsl.SimpleScanner("test", "echo a b; sleep 10", cache=cache)
+    scan = s.iter_scan(rescan=True)
+    assert ["a", "b"] == next(scan)
+    scan.close()
+    assert ["hi"] == s.scan()
+    assert ["cache"] == os.listdir(tmpdir)
+
+
+def test_needs_refresh(tmpdir):
+    cache = os.path.join(tmpdir, "cache")
+    root = os.path.join(tmpdir, "root")
+    os.makedirs(os.path.join(root, ".git"))
+
+    s = fzsl.SimpleScanner("test", "ls", root_path=root, cache=cache)
+    assert not s.needs_refresh()
+
+    s = fzsl.SimpleScanner("test", "ls", root_path=root, cache=cache, refresh="auto")
+    assert s.needs_refresh()
+    assert [] == s.scan()
+    assert not s.needs_refresh()
+
+    # Adding a file to the root or touching the git index is noticed
+    with open(os.path.join(root, "a"), "w"):
+        pass
+    assert s.needs_refresh()
+    assert ["a"] == s.scan(rescan=True)
+    assert not s.needs_refresh()
+
+    with open(os.path.join(root, ".git", "index"), "w"):
+        pass
+    assert s.needs_refresh()
+    s.scan(rescan=True)
+
+    # As is a cache made by another command
+    s = fzsl.SimpleScanner("test", "ls -a", root_path=root, cache=cache, refresh="auto")
+    assert s.needs_refresh()
+
+    s = fzsl.SimpleScanner("test", "ls", root_path=root, cache=cache, watch=[])
+    assert not s.needs_refresh()
+    s = fzsl.SimpleScanner("test", "ls", root_path=root, cache=cache, refresh="always")
+    assert s.needs_refresh()
+
+    with pytest.raises(fzsl.ConfigError):
+        fzsl.SimpleScanner("test", "ls", refresh="sometimes")
+
+
+def test_walk_scanner(tmpdir):
+    root = os.path.join(tmpdir, "root")
+    os.makedirs(os.path.join(root, "a", "b"))
+    with open(os.path.join(root, "a", "b", "c"), "w"):
+        pass
+
+    buf = "[walk]\ntype = walk\nroot_path = %s\ncache = %s/cache\n" % (root, tmpdir)
+    buf += "max_depth = 2\nfollow_links = yes\ntypes = dirs\n"
+    parser = configparser.RawConfigParser()
+    parser.read_file(io.StringIO(buf))
+
+    s = fzsl.scanner_from_configparser("walk", parser)
+    assert isinstance(s, fzsl.WalkScanner)
+    assert s.is_suitable(os.path.join(root, "a"))
+    assert ["a", "a/b"] == sorted(s.scan())
+    assert os.path.join(root, "a/b") == s.transform("a/b")
+
+    # Served from the cache until rescanned
+    os.makedirs(os.path.join(root, "d", "e", "f"))
+    assert fzsl.cache.is_cache(os.path.join(tmpdir, "cache"))
+    assert ["a", "a/b"] == sorted(s.scan())
+    assert ["a", "a/b", "d", "d/e"] == sorted(s.scan(rescan=True))
+
+    with pytest.raises(fzsl.ConfigError):
+        fzsl.WalkScanner("walk", types="links")
 
 
 def test_load_rule():
@@ -127,6 +263,13 @@ def test_load_plugin(testdir):
     parser.read_file(io.StringIO(b))
     scanner = fzsl.scanner_from_configparser("rule", parser)
     assert scanner.scan("") == ["1", "abc", "some string"]
+    assert list(scanner.iter_scan("")) == [["1", "abc", "some string"]]
+
+    parser = configparser.RawConfigParser()
+    parser.read_file(io.StringIO(buf + "object=StreamScanner\n"))
+    scanner = fzsl.scanner_from_configparser("rule", parser)
+    assert list(scanner.iter_scan("")) == [["a", "b"], ["c"]]
+    assert scanner.scan("") == ["a", "b", "c"]
 
     with pytest.raises(fzsl.ConfigError):
         parser = configparser.RawConfigParser()
@@ -142,3 +285,39 @@ def test_load_plugin(testdir):
         parser = configparser.RawConfigParser()
         parser.read_file(io.StringIO(buf + "object=BrokenScanner3\n"))
         scanner = fzsl.scanner_from_configparser("rule", parser)
+
+    with pytest.raises(fzsl.ConfigError):
+        parser = configparser.RawConfigParser()
+        parser.read_file(io.StringIO(buf + "object=BrokenScanner4\n"))
+        scanner = fzsl.scanner_from_configparser("rule", parser)
+
+
+def test_static_scanner(monkeypatch):
+    monkeypatch.setattr(fzsl.scanner, "BATCH_SIZE", 2)
+
+    s = fzsl.StaticScanner(["a", "b", "c"])
+    assert [["a", "b"], ["c"]] == list(s.iter_scan())
+    assert ["a", "b", "c"] == s.scan()
+
+
+def test_read_records():
+    data = b"a b\n\n c \r\nlast"
+    records = fzsl.scanner.read_records(io.BytesIO(data), size=3, strip=True)
+    assert ["a b", "c", "last"] == [r for batch in records for r in batch]
+
+    data = b"new\nline\0 space \0bad\xff\0"
+    records = fzsl.scanner.read_records(io.BytesIO(data), b"\0", size=4)
+    records = [r for batch in records for r in batch]
+    assert ["new\nline", " space ", "bad\udcff"] == records
+    assert b"bad\xff" == records[-1].encode("UTF-8", "surrogateescape")
+
+
+def test_stream_scanner():
+    s = fzsl.StreamScanner(io.BytesIO(b"a\0b c\0"), b"\0")
+    assert s.is_suitable("/")
+    assert ["a", "b c"] == s.scan()
+    # The stream is only read once
+    assert ["a", "b c"] == s.scan(rescan=True)
+
+    s = fzsl.StreamScanner(io.BytesIO(b" a \nb c\n"))
+    assert ["a", "b c"] == s.scan()
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+import pytest
+
+import fzsl
+from fzsl import client
+
+
+@pytest.fixture
+def server(tmpdir):
+    path = os.path.join(str(tmpdir), "run", "server.sock")
+    server = fzsl.Server(path, max_libraries=1)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def config(tmpdir):
+    root = tmpdir.mkdir("root")
+    for name in ("abc", "a/b/c", "xyz"):
+        root.join(name).write("", ensure=True)
+
+    path = str(tmpdir.join("fzsl.conf"))
+    with open(path, "w") as fp:
+        fp.write("[fzsl]\ndetect_ttl = 0\n")
+        fp.write("[walk]\ntype = walk\nroot_path = %s\ntypes = files\n" % (root,))
+        fp.write("[other]\ntype = simple\ncmd = echo other\npriority = -1\n")
+    return path
+
+
+def open_library(server, config, rule=None):
+    sock = client.connect(server.server_address)
+    assert sock is not None
+    path = os.path.join(os.path.dirname(config), "root")
+    return fzsl.RemoteLibrary(sock, config, rule, path, depth=5)
+
+
+def settle(library):
+    deadline = time.time() + 10
+    while not library.wait(0.01) or library.scanning:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_remote_library(server, config, tmpdir):
+    library = open_library(server, config)
+    try:
+        assert "walk" == library.rule
+        library.search("abc")
+        settle(library)
+        assert ["abc", "a/b/c"] == [m[0] for m in library.results.matches]
+        assert 3 == library.results.n_files
+        assert str(tmpdir.join("root", "abc")) == library.transform("abc")
+
+        library.resize(1)
+        assert library.wait(10)
+        assert ["abc"] == [m[0] for m in library.results.matches]
+
+        library.scroll(1)
+        assert library.wait(10)
+        assert ["a/b/c"] == [m[0] for m in library.results.matches]
+        assert 1 == library.results.offset
+        library.check()
+    finally:
+        library.close()
+
+    # The library stays loaded and follows changes to the files
+    tmpdir.join("root", "abcd").write("")
+    library = open_library(server, config)
+    try:
+        library.search("abcd")
+        settle(library)
+        assert 3 <= library.results.n_files
+        deadline = time.time() + 10
+        while library.results.n_files != 4:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        settle(library)
+        assert "abcd" == library.results.matches[0][0]
+    finally:
+        library.close()
+
+
+def test_server_errors(server, config, tmpdir):
+    with pytest.raises(fzsl.ServerError):
+        open_library(server, config, "missing")
+
+    with pytest.raises(fzsl.ServerError):
+        fzsl.Server(server.server_address)
+
+    # Libraries of other rules are kept apart
+    library = open_library(server, config, "other")
+    try:
+        settle(library)
+        assert 1 == library.results.n_files
+    finally:
+        library.close()
+
+    assert client.connect(str(tmpdir.join("run", "missing.sock"))) is None
+    os.chmod(str(tmpdir.join("run")), 0o755)
+    assert client.connect(server.server_address) is None
+
+
+def test_cached_root_path_cmd(server, tmpdir):
+    root = tmpdir.mkdir("root")
+    root.join("abc").write("")
+
+    path = str(tmpdir.join("fzsl.conf"))
+    with open(path, "w") as fp:
+        fp.write("[cached]\ntype = simple\ncmd = ls\nroot_path = !pwd\n")
+        fp.write("cache = %s\n" % (tmpdir.join("cache"),))
+
+    # The root_path command runs where the client is, not the server
+    library = open_library(server, path, "cached")
+    try:
+        settle(library)
+        assert str(root.join("abc")) == library.transform("abc")
+    finally:
+        library.close()
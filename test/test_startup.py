@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import fzsl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Modules which fzsl must not load until they are needed
+HEAVY = (
+    "concurrent.futures",
+    "ctypes",
+    "curses",
+    "multiprocessing",
+    "termios",
+)
+
+lazy = pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="modules cannot define __getattr__"
+)
+
+
+def imported(*args, stdin=b""):
+    """
+    @param args     - arguments to python
+    @param stdin    - input to python
+    @return         - set of the names of the modules python imported
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + list(args),
+        input=stdin,
+        cwd=ROOT,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    lines = proc.stderr.decode("UTF-8").splitlines()
+    return set(line.split("|")[-1].strip() for line in lines if "|" in line)
+
+
+def test_exports():
+    assert set(fzsl.__all__) <= set(dir(fzsl))
+    for name in fzsl.__all__:
+        assert getattr(fzsl, name) is not None
+    assert fzsl.core.FuzzyMatch is fzsl.FuzzyMatch
+
+    with pytest.raises(AttributeError):
+        fzsl.missing
+
+
+@lazy
+def test_lazy_imports():
+    modules = imported(
+        "-c", "import fzsl; fzsl.FuzzyMatch(files=['ab']).update_scores('a')"
+    )
+    assert "fzsl.core" in modules
+    for name in HEAVY + ("fzsl.scanner", "fzsl.server", "fzsl.ui"):
+        assert name not in modules
+
+
+@lazy
+def test_filter_imports():
+    modules = imported(
+        os.path.join(ROOT, "bin", "fzsl"), "--filter", "ab", stdin=b"ab\nb\n"
+    )
+    assert "fzsl.scanner" in modules
+    for name in HEAVY + ("fzsl.server", "fzsl.ui"):
+        assert name not in modules
@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+from fzsl import walk
+
+
+def touch(root, *paths):
+    for path in paths:
+        path = os.path.join(root, path)
+        if path.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w"):
+                pass
+
+
+def walked(root, **kwds):
+    return sorted(path for batch in walk.walk(str(root), **kwds) for path in batch)
+
+
+@pytest.mark.parametrize(
+    "pattern,matches,misses",
+    [
+        ("*.py", ["a.py", "b/c.py"], ["a.pyc", "py"]),
+        ("/build", ["build"], ["a/build"]),
+        ("doc/*.txt", ["doc/a.txt"], ["doc/a/b.txt", "a/doc/a.txt"]),
+        ("**/foo", ["foo", "a/b/foo"], ["afoo"]),
+        ("a/**/b", ["a/b", "a/x/y/b"], ["ab", "a/bc"]),
+        ("abc/**", ["abc/x", "abc/x/y"], ["abc"]),
+        ("[!a-c]x", ["dx"], ["ax", "xx/"]),
+        ("\\#x", ["#x"], []),
+    ],
+)
+def test_patterns(pattern, matches, misses):
+    ignore = walk.IgnoreFile("", [pattern])
+    for path in matches:
+        assert ignore.match(path, path.rsplit("/", 1)[-1], False), path
+    for path in misses:
+        assert ignore.match(path, path.rsplit("/", 1)[-1], False) is None, path
+
+
+def test_ignore_file():
+    ignore = walk.IgnoreFile(
+        "sub/",
+        ["# comment", "", "*.log", "!keep.log", "out/", "/top", "trailing   "],
+    )
+    assert 5 == len(ignore)
+    assert ignore.match("sub/a.log", "a.log", False)
+    assert not ignore.match("sub/keep.log", "keep.log", False)
+    assert ignore.match("sub/x/out", "out", True)
+    assert ignore.match("sub/x/out", "out", False) is None
+    assert ignore.match("sub/top", "top", False)
+    assert ignore.match("sub/x/top", "top", False) is None
+    assert ignore.match("sub/trailing", "trailing", False)
+
+    # Deeper files take precedence
+    rules = (ignore, walk.IgnoreFile("sub/x/", ["!*.log"]))
+    assert not walk.is_ignored(rules, "sub/x/a.log", "a.log", False)
+    assert walk.is_ignored(rules[:1], "sub/a.log", "a.log", False)
+
+
+def test_walk(tmpdir):
+    touch(
+        tmpdir,
+        "a/b/c.py",
+        "a/b/c.pyc",
+        "a/.hidden",
+        "d/",
+        "build/x",
+        "keep/build/y",
+        ".git/HEAD",
+    )
+    with open(os.path.join(tmpdir, ".gitignore"), "w") as fp:
+        fp.write("*.pyc\n/build\n")
+    with open(os.path.join(tmpdir, "a", ".ignore"), "w") as fp:
+        fp.write("b/\n")
+
+    assert [
+        ".gitignore",
+        "a",
+        "a/.hidden",
+        "a/.ignore",
+        "d",
+        "keep",
+        "keep/build",
+        "keep/build/y",
+    ] == walked(tmpdir)
+
+    assert ["a/b/c.py", "a/b/c.pyc", "build/x", "keep/build/y"] == walked(
+        tmpdir, hidden=False, ignore_files=(), types=walk.TYPES_FILES
+    )
+    assert ["a", "a/b", "build", "d", "keep", "keep/build"] == walked(
+        tmpdir, hidden=False, ignore_files=(), types=walk.TYPES_DIRS
+    )
+    assert [".git", ".gitignore", "a", "build", "d", "keep"] == walked(
+        tmpdir, ignore_files=(), max_depth=1
+    )
+
+    # Batches are limited in size and every thread count agrees
+    batches = list(walk.walk(str(tmpdir), ignore_files=(), batch_size=2))
+    assert all(len(batch) <= 2 for batch in batches)
+    for threads in (1, 2, 8):
+        assert walked(tmpdir, threads=threads) == walked(tmpdir)
+
+    with pytest.raises(OSError):
+        walked(os.path.join(tmpdir, "missing"))
+
+
+def test_follow_links(tmpdir):
+    touch(tmpdir, "a/b/c", "d/e")
+    os.symlink(os.path.join(tmpdir, "d"), os.path.join(tmpdir, "a", "d"))
+    os.symlink(os.path.join(tmpdir, "a"), os.path.join(tmpdir, "a", "b", "loop"))
+
+    assert ["a", "a/b", "a/b/c", "a/b/loop", "a/d", "d", "d/e"] == walked(tmpdir)
+
+    # Loops back to a directory being walked are reported but not followed
+    assert [
+        "a",
+        "a/b",
+        "a/b/c",
+        "a/b/loop",
+        "a/d",
+        "a/d/e",
+        "d",
+        "d/e",
+    ] == walked(tmpdir, follow_links=True)
@@ -0,0 +1,77 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from fzsl import walk
+from fzsl import watch
+
+
+def touch(root, *paths):
+    for path in paths:
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w"):
+            pass
+
+
+@pytest.fixture(params=[True, False], ids=["inotify", "poll"])
+def watcher(request, tmpdir, monkeypatch):
+    monkeypatch.setattr(watch, "POLL_INTERVAL", 0.05)
+    root = str(tmpdir.mkdir("root"))
+    touch(root, "x", "a/y", "a/b/z")
+    watcher = watch.Watcher(root, inotify=request.param)
+    if request.param and not watcher.inotify:
+        watcher.close()
+        pytest.skip("inotify is not available")
+    assert watcher.start()
+    yield watcher
+    watcher.close()
+
+
+def changed(watcher):
+    added, removed = watcher.changes(10)
+    return sorted(added), sorted(removed)
+
+
+def test_changes(watcher, tmpdir):
+    root = str(tmpdir.join("root"))
+    assert sorted(watcher.files()) == ["a", "a/b", "a/b/z", "a/y", "x"]
+    assert sorted(watcher.files()) == sorted(
+        path for batch in walk.walk(root) for path in batch
+    )
+
+    touch(root, "a/b/new")
+    assert (["a/b/new"], []) == changed(watcher)
+
+    touch(root, "n/m/q")
+    assert (["n", "n/m", "n/m/q"], []) == changed(watcher)
+
+    os.rename(os.path.join(root, "n"), os.path.join(root, "o"))
+    assert (["o", "o/m", "o/m/q"], ["n", "n/m", "n/m/q"]) == changed(watcher)
+
+    shutil.rmtree(os.path.join(root, "o"))
+    os.unlink(os.path.join(root, "x"))
+    assert ([], ["o", "o/m", "o/m/q", "x"]) == changed(watcher)
+    assert ([], []) == watcher.changes(0.1)
+
+
+def test_ignore_files(watcher, tmpdir):
+    root = tmpdir.join("root")
+    root.join(".ignore").write("z\n")
+    assert ([".ignore"], ["a/b/z"]) == changed(watcher)
+
+    # Changing the patterns reads the subdirectories again
+    time.sleep(0.01)
+    root.join(".ignore").write("b\n")
+    assert ([], ["a/b"]) == changed(watcher)
+
+    root.join(".ignore").remove()
+    assert (["a/b", "a/b/z"], [".ignore"]) == changed(watcher)
+
+
+def test_stop(watcher):
+    threading.Timer(0.1, watcher.stop).start()
+    assert watcher.changes() is None